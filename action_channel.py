@@ -0,0 +1,211 @@
+"""
+Movement Action Channel
+
+Carries every movement command the mover process sends to the Sphero to the
+collector as a fixed-size binary record, so the commands can be used as
+training labels instead of being lost in log output.
+
+The collector creates an AF_UNIX datagram socketpair, passes one end to
+unlimited_move.py (pass_fds plus the ACTION_FD_ENV environment variable) and
+records what arrives into actions.bin in the run directory. Sends never block
+the mover: if the collector falls behind, records are counted as dropped.
+
+Record layout (little endian), used both on the socket and in actions.bin:
+
+    planned time (float64, the command's deadline, see command_scheduler.py)
+    command time (float64, time.monotonic() just before the command was sent)
+    round trip (float32, seconds the blocking send took)
+    duration (float32, seconds the mover intends to hold this command)
+    speed (uint16), heading (uint16, degrees), direction (uint8, 0 forward / 1 reverse)
+
+actions.bin starts with the same kind of header as the frame timestamp sidecar
+(magic "ACT1", version, record size, wall clock and monotonic origins), so
+action times share the clock of the video frame and sensor timestamps.
+Processes that send the commands themselves (fleet_collector.py) write the
+same file format directly with ActionWriter.
+"""
+
+import os
+import socket
+import struct
+import threading
+import time
+
+MAGIC = b"ACT1"
+VERSION = 2
+HEADER_STRUCT = struct.Struct("<4sHHdd")
+RECORD_STRUCT = struct.Struct("<ddffHHB3x")
+FLUSH_INTERVAL_RECORDS = 25  # About every 5s at the mover's command rate
+
+ACTION_FD_ENV = "SPHERO_ACTION_FD"
+ACTIONS_FILENAME = "actions.bin"
+
+
+def create_action_channel():
+    """Return (collector socket, mover socket) for one mover process"""
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+
+def pack_action(speed, heading, direction, duration, command_time=None, planned_time=None, round_trip=0.0):
+    """Build one action record"""
+    if command_time is None:
+        command_time = time.monotonic()
+    if planned_time is None:
+        planned_time = command_time
+    return RECORD_STRUCT.pack(planned_time, command_time, round_trip, duration,
+                              speed, heading, int(direction))
+
+
+class ActionWriter:
+    """Appends action records to an actions file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'wb')
+        self._file.write(HEADER_STRUCT.pack(MAGIC, VERSION, RECORD_STRUCT.size,
+                                            time.time(), time.monotonic()))
+        self._file.flush()
+
+    def write_record(self, record):
+        self._file.write(record)
+        self.count += 1
+        if self.count % FLUSH_INTERVAL_RECORDS == 0:
+            self._file.flush()
+
+    def write(self, *args, **kwargs):
+        """Write one command, arguments as for pack_action()"""
+        self.write_record(pack_action(*args, **kwargs))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            self._file.close()
+
+
+class ActionPublisher:
+    """Mover side of the action channel"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.sent = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_environment(cls):
+        """Connect to the channel passed by the collector, or return None when run standalone"""
+        fd = os.environ.get(ACTION_FD_ENV)
+        if not fd:
+            return None
+        try:
+            return cls(socket.socket(fileno=int(fd)))
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not open action channel (fd {fd}): {e}")
+            return None
+
+    def publish(self, speed, heading, direction, duration, command_time=None,
+                planned_time=None, round_trip=0.0):
+        """Send one command record without blocking"""
+        record = pack_action(speed, heading, direction, duration, command_time, planned_time, round_trip)
+
+        try:
+            self.sock.send(record, socket.MSG_DONTWAIT)
+            self.sent += 1
+        except (BlockingIOError, InterruptedError):
+            self.dropped += 1
+        except OSError:
+            # Collector is gone; keep driving without labels
+            self.dropped += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class ActionRecorder:
+    """Collector side: receives action records on a thread and appends them to a file"""
+
+    def __init__(self, sock, path):
+        self.sock = sock
+        self.path = path
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._writer = ActionWriter(path)
+
+    @property
+    def count(self):
+        return self._writer.count
+
+    def start(self):
+        self.sock.settimeout(0.2)
+        self._thread = threading.Thread(target=self._loop, name="action-recorder")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.sock.close()
+        self._writer.close()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                record = self.sock.recv(RECORD_STRUCT.size)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            if len(record) != RECORD_STRUCT.size:
+                continue
+            self._writer.write_record(record)
+
+
+def read_actions(path):
+    """Read an actions file.
+
+    Returns (header, records) where header is a dict with the clock origins and
+    records is a NumPy structured array with fields
+    'planned_time', 'command_time', 'round_trip', 'duration', 'speed',
+    'heading' and 'direction'.
+    """
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        magic, version, record_size, wall_origin, monotonic_origin = HEADER_STRUCT.unpack(
+            f.read(HEADER_STRUCT.size))
+
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an actions file")
+    if record_size != RECORD_STRUCT.size:
+        raise ValueError(f"{path} has unsupported record size {record_size} (version {version})")
+
+    dtype = np.dtype([
+        ('planned_time', '<f8'),
+        ('command_time', '<f8'),
+        ('round_trip', '<f4'),
+        ('duration', '<f4'),
+        ('speed', '<u2'),
+        ('heading', '<u2'),
+        ('direction', 'u1'),
+        ('padding', 'V3'),
+    ])
+
+    # A crash can leave a partial record at the end, ignore it
+    count = (os.path.getsize(path) - HEADER_STRUCT.size) // dtype.itemsize
+    records = np.fromfile(path, dtype=dtype, count=count, offset=HEADER_STRUCT.size)
+
+    header = {
+        "version": version,
+        "wall_origin": wall_origin,
+        "monotonic_origin": monotonic_origin,
+    }
+    return header, records
+
+
+def actions_at(command_times, times):
+    """Return the index of the command in effect at each time (-1 before the first one)"""
+    import numpy as np
+
+    return np.searchsorted(command_times, times, side='right') - 1
@@ -0,0 +1,171 @@
+"""
+Closed-Loop Arena Controller
+
+Keeps the ball inside a virtual rectangular arena using the streamed Locator
+(position) and Velocity sensors, so open-loop movement does not pin it against
+a wall for the rest of the run.
+
+At run start reset_position() zeroes the yaw and the locator, so the arena is
+centred on the ball's start position with heading 0 along +y and heading 90
+along +x (Locator and Velocity arrive in cm and cm/s). For every new sample the
+controller predicts where the ball will be LOOKAHEAD seconds later; when that
+point is within ARENA_MARGIN of a wall it takes over from the movement schedule
+and drives away from the wall(s) until the prediction is back inside.
+
+The sensor callback only stores the latest sample and wakes the control task,
+so reacting never blocks pysphero's notify thread. Samples that are already
+older than LATENCY_BUDGET when the task gets to them are dropped, since a
+newer one is on the way. For every steering command the sense-to-command
+latency is recorded: from the sample's arrival on the host to the estimated
+arrival of the command at the robot (send time plus half the round trip).
+
+Usage:
+
+    controller = ArenaController()
+    sphero.sensor.set_notify(callback, Locator, Velocity, ...)  # callback calls controller.on_sample()
+    await controller.run(runtime, sphero.driving.drive_with_heading)
+"""
+
+import asyncio
+import math
+import threading
+import time
+
+import numpy as np
+
+from pysphero.device_api.sensor import SensorCommand
+
+ARENA_HALF_WIDTH = 100.0  # cm either side of the start position along x
+ARENA_HALF_HEIGHT = 100.0  # cm either side of the start position along y
+ARENA_MARGIN = 25.0  # cm inside the walls where steering starts
+LOOKAHEAD = 0.3  # Seconds of travel at the current velocity added to the position
+STEER_SPEED = 120
+LATENCY_BUDGET = 0.1  # Seconds from sample arrival to command arrival
+REPEAT_INTERVAL = 0.2  # Seconds before a steering command is repeated unchanged
+HEADING_TOLERANCE = 10  # Degrees of heading change that trigger a new command sooner
+
+
+def reset_position(sphero):
+    """Zero the yaw and the locator, making the current pose the arena origin"""
+    sphero.driving.reset_yaw()
+    # pysphero has no wrapper for the reset_locator command
+    sphero.sensor.request(SensorCommand.reset_locator, target_id=0x12)
+
+
+def heading_difference(a, b):
+    return abs((a - b + 180) % 360 - 180)
+
+
+class ArenaController:
+    """Steers the ball away from the walls of a virtual arena"""
+
+    def __init__(self, half_width=ARENA_HALF_WIDTH, half_height=ARENA_HALF_HEIGHT, margin=ARENA_MARGIN,
+                 lookahead=LOOKAHEAD, speed=STEER_SPEED, latency_budget=LATENCY_BUDGET):
+        self.limit_x = half_width - margin
+        self.limit_y = half_height - margin
+        self.half_width = half_width
+        self.half_height = half_height
+        self.lookahead = lookahead
+        self.speed = speed
+        self.latency_budget = latency_budget
+
+        self.steering = False  # True while the controller overrides the movement schedule
+        self.samples = 0
+        self.stale_samples = 0
+        self.interventions = 0
+        self.commands = 0
+        self.latencies = []  # (send, arrival) seconds after the triggering sample arrived
+
+        self._lock = threading.Lock()
+        self._latest = None
+        self._wake = None
+        self._last_heading = None
+        self._last_command = 0.0
+
+    def on_sample(self, x, y, vx, vy, received=None):
+        """Store the newest Locator/Velocity sample (called from the sensor callback thread)"""
+        if received is None:
+            received = time.monotonic()
+        with self._lock:
+            self._latest = (x, y, vx, vy, received)
+            self.samples += 1
+        if self._wake:
+            self._wake()
+
+    def steer(self, x, y, vx, vy):
+        """Heading (degrees) that drives away from the walls the ball is heading into, or None"""
+        px = x + vx * self.lookahead
+        py = y + vy * self.lookahead
+
+        # Push back from each wall in proportion to how far the prediction is past its margin
+        push_x = min(0.0, self.limit_x - px) + max(0.0, -self.limit_x - px)
+        push_y = min(0.0, self.limit_y - py) + max(0.0, -self.limit_y - py)
+        if push_x == 0 and push_y == 0:
+            return None
+        return int(round(math.degrees(math.atan2(push_x, push_y)))) % 360
+
+    def _send(self, drive, heading):
+        sent = time.monotonic()
+        drive(self.speed, heading)
+        return sent, time.monotonic()
+
+    async def run(self, runtime, drive):
+        """React to each new sample until cancelled. drive(speed, heading) is a
+        blocking robot call and runs on the runtime's BLE executor."""
+        event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._wake = lambda: loop.call_soon_threadsafe(event.set)
+        try:
+            while True:
+                await event.wait()
+                event.clear()
+                with self._lock:
+                    x, y, vx, vy, received = self._latest
+
+                if time.monotonic() - received > self.latency_budget:
+                    self.stale_samples += 1
+                    continue
+
+                heading = self.steer(x, y, vx, vy)
+                if heading is None:
+                    self.steering = False
+                    continue
+
+                if not self.steering:
+                    self.interventions += 1
+                    self._last_heading = None
+                self.steering = True
+
+                # While steering, only resend when the heading changed or the last command is getting old
+                now = time.monotonic()
+                if (self._last_heading is not None
+                        and heading_difference(heading, self._last_heading) < HEADING_TOLERANCE
+                        and now - self._last_command < REPEAT_INTERVAL):
+                    continue
+
+                sent, completed = await runtime.ble(self._send, drive, heading)
+                self.latencies.append((sent - received, (sent + completed) / 2 - received))
+                self.commands += 1
+                self._last_heading = heading
+                self._last_command = sent
+        finally:
+            self._wake = None
+            self.steering = False
+
+    def stats(self):
+        """Intervention counts and sense-to-command latency for metadata.json"""
+        latencies = np.array(self.latencies).reshape(-1, 2) * 1000
+        arrival = latencies[:, 1]
+        return {
+            "arena_cm": [2 * self.half_width, 2 * self.half_height],
+            "samples": self.samples,
+            "stale_samples": self.stale_samples,
+            "interventions": self.interventions,
+            "steering_commands": self.commands,
+            "latency_budget_ms": self.latency_budget * 1000,
+            "sense_to_send_p50_ms": float(np.percentile(latencies[:, 0], 50)) if len(arrival) else None,
+            "sense_to_command_p50_ms": float(np.percentile(arrival, 50)) if len(arrival) else None,
+            "sense_to_command_p99_ms": float(np.percentile(arrival, 99)) if len(arrival) else None,
+            "sense_to_command_max_ms": float(arrival.max()) if len(arrival) else None,
+            "within_budget": float(np.mean(arrival <= self.latency_budget * 1000)) if len(arrival) else None,
+        }
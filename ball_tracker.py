@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Vision-Based Ball Tracker
+
+Detects the Sphero in every frame of a recorded run and writes a per-frame
+ground-truth position track next to the video (video.mp4 -> video_ball_track.npy).
+The track is a float32 array of shape (N, 3) holding x, y (full-resolution
+pixel coordinates) and a confidence in [0, 1], one row per video frame, in the
+same order as the frame timestamp sidecar.
+
+Detection works on downscaled frames in batches, vectorized with NumPy/OpenCV:
+
+1. A per-batch temporal median gives the static background
+2. Each pixel is scored by motion (difference to the background) plus
+   brightness above a threshold (the ball's LEDs)
+3. The score is box-filtered to the ball's size and the best candidate in
+   each cell of a coarse grid is kept, giving a few candidates per frame
+
+Detection runs in parallel chunks across all cores (video_runner). A cheap
+sequential pass then picks one candidate per frame using a constant velocity
+motion prior. LiveBallTracker runs the same detector on the frames a
+CameraPipeline is recording.
+
+Usage:
+    python ball_tracker.py collected_data/run_YYYYMMDD_HHMMSS [--camera 0] [--workers N]
+"""
+
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from video_reader import find_run_video
+from video_runner import process_video
+
+# Detection settings
+TRACK_DOWNSCALE = 4  # 640x480 -> 160x120
+BALL_RADIUS = 3  # Ball radius in downscaled pixels
+BRIGHTNESS_THRESHOLD = 200  # Pixel value (0-255) above which brightness counts as evidence
+BRIGHTNESS_WEIGHT = 0.5
+CANDIDATES_PER_FRAME = 8
+BATCH_SIZE = 64  # Frames per batch, also the window of the background median
+
+# Track selection settings
+MAX_STEP = 40.0  # Expected max movement between frames in full-resolution pixels
+CONTRAST_FULL = 4.0  # Candidate/background score ratio that gives full confidence
+MIN_CONFIDENCE = 0.3  # Detections below this do not update the motion model
+LIVE_BACKGROUND_RATE = 0.05  # Background adaptation rate for live tracking
+
+
+def preprocess(frames, downscale=TRACK_DOWNSCALE):
+    """Turn a (n, H, W, 3) uint8 batch into downscaled brightness images (n, h, w) float32"""
+    n, height, width, _ = frames.shape
+    h, w = height // downscale, width // downscale
+    frames = np.ascontiguousarray(frames[:, :h * downscale, :w * downscale])
+
+    # Area-downscale the whole batch as one tall image; with an integer factor
+    # no output pixel mixes two frames
+    stacked = frames.reshape(n * h * downscale, w * downscale, 3)
+    small = cv2.resize(stacked, (w, n * h), interpolation=cv2.INTER_AREA)
+
+    # Brightness is the max over colour channels (HSV value)
+    return small.max(axis=2).reshape(n, h, w).astype(np.float32)
+
+
+def box_filter(images, radius):
+    """Mean filter over a (2r+1)x(2r+1) window for a stack of images, via cumulative sums"""
+    size = 2 * radius + 1
+    padded = np.pad(images, ((0, 0), (radius + 1, radius), (radius + 1, radius)), mode='edge')
+    padded[:, 0, :] = 0
+    padded[:, :, 0] = 0
+    sums = padded.cumsum(axis=1).cumsum(axis=2)
+    window = (sums[:, size:, size:] - sums[:, :-size, size:]
+              - sums[:, size:, :-size] + sums[:, :-size, :-size])
+    return window / (size * size)
+
+
+def detect_candidates(value, background=None, radius=BALL_RADIUS,
+                      candidates=CANDIDATES_PER_FRAME, downscale=TRACK_DOWNSCALE):
+    """Score a batch of brightness images and return the best candidates per frame.
+
+    Returns (positions, scores, noise): positions (n, k, 2) as full-resolution x, y,
+    scores (n, k) and noise (n,), the typical score of a frame's background.
+    """
+    if background is None:
+        background = np.median(value, axis=0)
+
+    motion = np.abs(value - background)
+    brightness = np.maximum(value - BRIGHTNESS_THRESHOLD, 0)
+    score = box_filter(motion + BRIGHTNESS_WEIGHT * brightness, radius)
+
+    # Best pixel in each cell of a grid with cells about the size of the ball
+    n, h, w = score.shape
+    cell = 2 * radius + 1
+    hc, wc = h // cell, w // cell
+    cells = score[:, :hc * cell, :wc * cell].reshape(n, hc, cell, wc, cell)
+    cells = cells.transpose(0, 1, 3, 2, 4).reshape(n, hc * wc, cell * cell)
+    cell_max = cells.max(axis=2)
+    cell_arg = cells.argmax(axis=2)
+
+    k = min(candidates, hc * wc)
+    top = np.argpartition(-cell_max, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(cell_max, top, axis=1)
+    arg = np.take_along_axis(cell_arg, top, axis=1)
+
+    y = (top // wc) * cell + arg // cell
+    x = (top % wc) * cell + arg % cell
+    positions = (np.stack([x, y], axis=2).astype(np.float32) + 0.5) * downscale
+
+    noise = np.median(cell_max, axis=1) + 1e-3
+    return positions, scores, noise
+
+
+class TrackSelector:
+    """Picks one candidate per frame using a constant velocity motion prior"""
+
+    def __init__(self, max_step=MAX_STEP, min_confidence=MIN_CONFIDENCE):
+        self.max_step = max_step
+        self.min_confidence = min_confidence
+        self.last = None
+        self.velocity = (0.0, 0.0)
+        self.missed = 0
+
+    def select(self, positions, scores, noise):
+        """Return an (n, 3) float32 array of x, y, confidence for a batch of candidates"""
+        track = np.zeros((len(scores), 3), dtype=np.float32)
+        contrast = scores / noise[:, None]
+
+        for i in range(len(scores)):
+            frame_contrast = contrast[i]
+            if self.last is None:
+                prior = np.ones_like(frame_contrast)
+            else:
+                # The prior widens while the ball is lost
+                predicted_x = self.last[0] + self.velocity[0]
+                predicted_y = self.last[1] + self.velocity[1]
+                sigma = self.max_step * (1 + self.missed)
+                d2 = ((positions[i, :, 0] - predicted_x) ** 2 + (positions[i, :, 1] - predicted_y) ** 2) / sigma ** 2
+                prior = np.exp(-0.5 * d2)
+
+            best = int(np.argmax(frame_contrast * prior))
+            x, y = float(positions[i, best, 0]), float(positions[i, best, 1])
+            confidence = min(max((frame_contrast[best] - 1) / (CONTRAST_FULL - 1), 0.0), 1.0) * prior[best]
+            track[i] = (x, y, confidence)
+
+            if confidence >= self.min_confidence:
+                if self.last is not None:
+                    self.velocity = (0.5 * self.velocity[0] + 0.5 * (x - self.last[0]),
+                                     0.5 * self.velocity[1] + 0.5 * (y - self.last[1]))
+                self.last = (x, y)
+                self.missed = 0
+            else:
+                self.missed += 1
+                self.velocity = (0.8 * self.velocity[0], 0.8 * self.velocity[1])
+
+        return track
+
+
+def track_path(video_path):
+    """Return the ball track path for a video file"""
+    return os.path.splitext(video_path)[0] + "_ball_track.npy"
+
+
+def _detect_batch(first_index, frames):
+    """Detection stage for one batch, run in a video_runner worker process"""
+    return detect_candidates(preprocess(frames))
+
+
+def track_video(video_path, batch_size=BATCH_SIZE, workers=None):
+    """Track the ball through a whole video and return the (N, 3) track"""
+    detections = process_video(video_path, _detect_batch, workers=workers, batch_size=batch_size)
+    if not detections:
+        return np.zeros((0, 3), dtype=np.float32)
+
+    # Selection carries the motion model from frame to frame, so it stays sequential
+    selector = TrackSelector()
+    return np.concatenate([selector.select(positions, scores, noise)
+                           for positions, scores, noise in detections])
+
+
+class LiveBallTracker:
+    """Tracks the ball on the frames a CameraPipeline is recording.
+
+    Polls pipeline.latest_frame() on its own thread, so a slow tracker never
+    holds up recording. The latest result is available as `latest`:
+    (capture_index, capture_time, x, y, confidence) or None.
+    """
+
+    def __init__(self, pipeline, interval=0.0):
+        self.pipeline = pipeline
+        self.interval = interval
+        self.latest = None
+        self.frames_tracked = 0
+
+        self._selector = TrackSelector()
+        self._background = None
+        self._last_index = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="ball-tracker")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            latest = self.pipeline.latest_frame()
+            if latest is None or latest[0] == self._last_index:
+                if latest is not None:
+                    self.pipeline.release_frame(latest[2])
+                time.sleep(0.005)
+                continue
+
+            capture_index, capture_time, frame = latest
+            try:
+                value = preprocess(frame[None])
+            finally:
+                self.pipeline.release_frame(frame)
+
+            # Running average instead of a batch median
+            if self._background is None:
+                self._background = value[0].copy()
+            positions, scores, noise = detect_candidates(value, self._background)
+            self._background += LIVE_BACKGROUND_RATE * (value[0] - self._background)
+
+            x, y, confidence = self._selector.select(positions, scores, noise)[0]
+            self.latest = (capture_index, capture_time, float(x), float(y), float(confidence))
+            self._last_index = capture_index
+            self.frames_tracked += 1
+
+            if self.interval:
+                time.sleep(self.interval)
+
+
+def main():
+    """Track the ball in a recorded run"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Track the Sphero in a recorded run.')
+    parser.add_argument('run_dir', help='Run directory, e.g. collected_data/run_YYYYMMDD_HHMMSS')
+    parser.add_argument('--camera', type=int, default=0,
+                        help='Camera position in CAMERA_INDICES (default: 0)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for detection (default: all cores)')
+    args = parser.parse_args()
+
+    video_path = find_run_video(args.run_dir, args.camera)
+    print(f"Tracking ball in {video_path}...")
+
+    start_time = time.time()
+    track = track_video(video_path, workers=args.workers)
+    elapsed = time.time() - start_time
+
+    output_path = track_path(video_path)
+    np.save(output_path, track)
+
+    fps = len(track) / elapsed if elapsed > 0 else 0
+    confident = int((track[:, 2] >= MIN_CONFIDENCE).sum()) if len(track) else 0
+    print(f"Tracked {len(track)} frames in {elapsed:.1f}s ({fps:.0f} fps, "
+          f"{fps / 30:.1f}x real time at 30fps)")
+    print(f"Confident detections: {confident}/{len(track)}")
+    print(f"Track saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Bluetooth Controller Selection
+
+pysphero always connects through the first controller: GattAdapter hard-codes
+gatt.DeviceManager("hci0") and BluepyAdapter creates its Peripheral without an
+interface, so every robot shares one radio and its connection-interval budget.
+
+The adapters here take the controller per connection (e.g. "hci1"), and
+ControllerAllocator spreads connections over all controllers by load, so
+throughput with several robots scales with the number of dongles. Load is the
+sum of the expected packet rates of the robots on a controller.
+
+The bluepy adapter also takes its handles from the GATT handle cache
+(gatt_cache.py) instead of discovering them on every connect, and records how
+long connecting took in `connect_timing`.
+
+Usage:
+
+    allocator = ControllerAllocator()            # All controllers in /sys/class/bluetooth
+    controller = allocator.acquire(weight=22)    # e.g. 20 Hz sensors + 2 commands/s
+    with Sphero(mac_address=MAC, ble_adapter_cls=adapter_for(controller)) as sphero:
+        ...
+    allocator.release(controller, weight=22)
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+
+from bluepy.btle import ADDR_TYPE_RANDOM, Peripheral
+
+from pysphero.bluetooth import BleAdapter
+from pysphero.bluetooth.ble_adapter import AbstractBleAdapter
+from pysphero.bluetooth.bluepy_adapter import BluepyAdapter, BluepyDelegate
+from pysphero.constants import SpheroCharacteristic
+from pysphero.device_api import SystemInfo
+
+from gatt_cache import GattHandleCache
+
+try:
+    import gatt
+    from pysphero.bluetooth.gatt_adapter import Device, GattAdapter
+except ImportError:
+    gatt = None
+
+SYSFS_BLUETOOTH = "/sys/class/bluetooth"
+DEFAULT_CONTROLLER = "hci0"
+MAX_CONNECTIONS_PER_CONTROLLER = 7  # Typical limit of USB Bluetooth dongles
+
+logger = logging.getLogger(__name__)
+_handle_cache = None
+
+
+def handle_cache():
+    """The process-wide GattHandleCache, loaded on first use"""
+    global _handle_cache
+    if _handle_cache is None:
+        _handle_cache = GattHandleCache()
+    return _handle_cache
+
+
+def list_controllers():
+    """Names of the local Bluetooth controllers, e.g. ["hci0", "hci1"]"""
+    try:
+        # Entries like "hci0:64" are connections, not controllers
+        names = [name for name in os.listdir(SYSFS_BLUETOOTH) if name.startswith("hci") and ":" not in name]
+    except OSError:
+        names = []
+    return sorted(names, key=controller_index) or [DEFAULT_CONTROLLER]
+
+
+def controller_index(controller):
+    """bluepy interface number of a controller name ("hci1" -> 1), None for the default"""
+    if controller is None:
+        return None
+    return int(str(controller).replace("hci", ""))
+
+
+class ControllerBluepyAdapter(BluepyAdapter):
+    """BluepyAdapter that connects through the given controller, using cached GATT handles"""
+
+    def __init__(self, mac_address, controller=None, cache=None):
+        # Same setup as BluepyAdapter.__init__, which offers no interface argument
+        # and discovers the handles every time
+        AbstractBleAdapter.__init__(self, mac_address)
+        self.controller = controller or DEFAULT_CONTROLLER
+        cache = cache or handle_cache()
+
+        started = time.monotonic()
+        self.delegate = BluepyDelegate(self.packet_collector)
+        self.peripheral = Peripheral(self.mac_address, ADDR_TYPE_RANDOM, iface=controller_index(controller))
+        self.peripheral.setDelegate(self.delegate)
+        connected = time.monotonic()
+
+        self.ch_api_v2, cccd_handle, handles = cache.api_characteristic(self.peripheral, self.mac_address)
+        self.peripheral.writeCharacteristic(cccd_handle, b"\x01\x00", withResponse=True)
+        ready = time.monotonic()
+
+        self._executor.submit(self._receiver)
+
+        if handles == "discovery":
+            # Record which firmware the new handles belong to
+            try:
+                version = SystemInfo(ble_adapter=self).get_main_application_version()
+                cache.set_firmware(self.mac_address, f"{version.major}.{version.minor}.{version.revision}")
+            except Exception as e:
+                logger.debug(f"Could not read firmware version: {e}")
+
+        self.connect_timing = {
+            "handles": handles,
+            "connect_s": connected - started,
+            "setup_s": ready - connected,
+        }
+
+
+if gatt is not None:
+    class ControllerGattAdapter(GattAdapter):
+        """GattAdapter that connects through the given controller"""
+
+        def __init__(self, mac_address, controller=DEFAULT_CONTROLLER):
+            # Same setup as GattAdapter.__init__, which hard-codes "hci0"
+            AbstractBleAdapter.__init__(self, mac_address)
+            self.controller = controller
+            self.manager = gatt.DeviceManager(controller)
+
+            self._device = Device(self.packet_collector, mac_address=self.mac_address, manager=self.manager)
+            self._device.connect()
+
+            ch_force_band = self._find_characteristic(SpheroCharacteristic.force_band.value)
+            ch_force_band.write_value(b"usetheforce...band")
+
+            self.ch_api_v2 = self._find_characteristic(SpheroCharacteristic.api_v2.value)
+            self.ch_api_v2.enable_notifications()
+            self._executor.submit(self.manager.run)
+
+
+def connect_entry(sphero, started):
+    """connect_log entry for a connection that was started at `started` and is now open"""
+    timing = getattr(sphero.ble_adapter, "connect_timing", {})
+    return {
+        "connect_ms": (time.monotonic() - started) * 1000,
+        "handles": timing.get("handles"),
+        "first_command_ms": None,  # Set by first_command()
+        "ready_ms": None,  # Wake-to-ready probe time, on connections that waited for it (see startup.py)
+        "_started": started,
+    }
+
+
+def first_command(entry, completed):
+    """Record the first acknowledged command of a connection"""
+    if entry is not None and entry["first_command_ms"] is None:
+        entry["first_command_ms"] = (completed - entry["_started"]) * 1000
+
+
+def connect_stats(log):
+    """Summary of a connect_log for metadata.json"""
+    connects = [entry["connect_ms"] for entry in log]
+    first = [entry["first_command_ms"] for entry in log if entry["first_command_ms"] is not None]
+    return {
+        "connections": [{key: value for key, value in entry.items() if not key.startswith("_")} for entry in log],
+        "cached_handles": sum(entry["handles"] == "cache" for entry in log),
+        "median_connect_ms": sorted(connects)[len(connects) // 2] if connects else None,
+        "median_first_command_ms": sorted(first)[len(first) // 2] if first else None,
+    }
+
+
+def adapter_for(controller=None):
+    """ble_adapter_cls for Sphero() that connects through controller (None: the default controller)"""
+    if gatt is not None:
+        return BleAdapter if controller is None else functools.partial(ControllerGattAdapter, controller=controller)
+    return functools.partial(ControllerBluepyAdapter, controller=controller)
+
+
+class ControllerAllocator:
+    """Assigns each new connection to the least loaded controller"""
+
+    def __init__(self, controllers=None, max_connections=MAX_CONNECTIONS_PER_CONTROLLER):
+        self.controllers = list(controllers or list_controllers())
+        self.max_connections = max_connections
+        self.load = {controller: 0.0 for controller in self.controllers}
+        self.connections = {controller: 0 for controller in self.controllers}
+        self.assigned = {controller: 0 for controller in self.controllers}  # Total over the run
+        self._lock = threading.Lock()
+
+    def acquire(self, weight=1.0):
+        """Reserve a controller for a connection with the given load; raises RuntimeError if all are full"""
+        with self._lock:
+            available = [c for c in self.controllers if self.connections[c] < self.max_connections]
+            if not available:
+                raise RuntimeError(f"All Bluetooth controllers are at {self.max_connections} connections")
+
+            controller = min(available, key=lambda c: (self.load[c], self.connections[c]))
+            self.load[controller] += weight
+            self.connections[controller] += 1
+            self.assigned[controller] += 1
+            return controller
+
+    def release(self, controller, weight=1.0):
+        with self._lock:
+            self.load[controller] = max(0.0, self.load[controller] - weight)
+            self.connections[controller] = max(0, self.connections[controller] - 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                controller: {
+                    "connections": self.connections[controller],
+                    "load": self.load[controller],
+                    "assigned": self.assigned[controller],
+                }
+                for controller in self.controllers
+            }
@@ -0,0 +1,515 @@
+"""
+Camera Capture Pipeline
+
+Splits video recording into two threads connected by a bounded frame queue:
+
+- a capture thread that only grabs frames from the camera
+- an encoder thread that annotates and writes frames to the video file
+
+This way the capture cadence no longer depends on how long encoding takes.
+When the encoder falls behind, the queue's drop policy decides what happens:
+
+- "drop_oldest": the oldest queued frame is discarded to make room
+- "block": the capture thread waits until the encoder frees a slot
+
+Frames are timestamped with time.monotonic() right after they are grabbed and,
+when a sidecar path is given, the timing of every written frame is recorded
+with frame_timestamps.FrameTimestampWriter.
+
+start_camera_recording() opens one camera and its output file and starts a
+pipeline for it. Every camera gets its own pipeline and threads, so several
+cameras can record in the same run without slowing each other down.
+
+Decoded frames are retrieved into a fixed FramePool of preallocated buffers
+instead of allocating a new array per frame, so memory use and GC pressure stay
+flat over long recordings. A buffer returns to the pool once the encoder and
+all live consumers have released it.
+"""
+
+import collections
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_timestamps import FrameTimestampWriter, sidecar_path
+from mjpeg_recorder import MjpegStreamWriter, enable_mjpeg_passthrough, decode_jpeg
+from video_encoder import load_encoder_choice, open_video_writer, video_filename
+
+# Drop policies
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+DROP_POLICIES = (DROP_OLDEST, BLOCK)
+
+# Pipeline defaults
+DEFAULT_QUEUE_SIZE = 60  # About 2 seconds of video at 30fps
+DEFAULT_DROP_POLICY = DROP_OLDEST
+STATUS_INTERVAL_FRAMES = 300  # Print status every 300 encoded frames
+POOL_HEADROOM = 4  # Buffers beyond the queue size, for the encoder and live consumers
+
+
+class FrameQueue:
+    """Bounded FIFO of captured frames with a configurable drop policy"""
+
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, drop_policy=DEFAULT_DROP_POLICY):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy} (expected one of {DROP_POLICIES})")
+        if maxsize < 1:
+            raise ValueError("Queue size must be at least 1")
+
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+        self.dropped = 0
+
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        """Add an item, applying the drop policy if the queue is full.
+
+        Returns the item that was dropped to make room, or None.
+        """
+        dropped_item = None
+        with self._cond:
+            if self.drop_policy == BLOCK:
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._cond.wait()
+            elif len(self._items) >= self.maxsize:
+                dropped_item = self._items.popleft()
+                self.dropped += 1
+
+            if self._closed:
+                # Nobody will consume it anymore
+                self.dropped += 1
+                return item
+
+            self._items.append(item)
+            self._cond.notify_all()
+
+        return dropped_item
+
+    def drop_oldest(self):
+        """Discard and return the oldest queued item, or None if the queue is empty"""
+        with self._cond:
+            if not self._items:
+                return None
+            self.dropped += 1
+            self._cond.notify_all()
+            return self._items.popleft()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item.
+
+        Returns None on timeout, or when the queue is closed and drained.
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """Stop accepting new items and wake up any waiting threads"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class FramePool:
+    """Fixed set of preallocated frame buffers with reference counting"""
+
+    def __init__(self, count, shape, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.buffers = [np.empty(self.shape, dtype=dtype) for _ in range(count)]
+        self.exhausted = 0  # Times a buffer was requested but none was free
+
+        # Pool buffers are never freed, so their ids stay unique
+        self._refs = {id(buf): 0 for buf in self.buffers}
+        self._free = collections.deque(self.buffers)
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def owns(self, frame):
+        return id(frame) in self._refs
+
+    def acquire(self, timeout=None):
+        """Take a free buffer (holding one reference), or return None if none frees up in time"""
+        with self._cond:
+            if not self._free and timeout != 0:
+                self._cond.wait(timeout)
+            if not self._free:
+                self.exhausted += 1
+                return None
+
+            buf = self._free.popleft()
+            self._refs[id(buf)] = 1
+            return buf
+
+    def retain(self, frame):
+        """Add a reference to a pool buffer (no-op for other arrays)"""
+        with self._cond:
+            if id(frame) in self._refs:
+                self._refs[id(frame)] += 1
+
+    def release(self, frame):
+        """Drop a reference, returning the buffer to the pool when none are left"""
+        with self._cond:
+            key = id(frame)
+            if key not in self._refs or self._refs[key] == 0:
+                return
+            self._refs[key] -= 1
+            if self._refs[key] == 0:
+                self._free.append(frame)
+                self._cond.notify()
+
+    def free_count(self):
+        with self._cond:
+            return len(self._free)
+
+
+class CameraPipeline:
+    """Capture/encode pipeline around an opened cv2.VideoCapture and cv2.VideoWriter.
+
+    The pipeline takes ownership of both objects and releases them in stop().
+    `annotate` is an optional callable `annotate(frame, capture_time)` that is run
+    on the encoder thread right before a frame is written; capture_time is given
+    in time.time() seconds. If `timestamps_path` is set, a frame timestamp
+    sidecar is written there.
+
+    In passthrough mode the queued frames are compressed buffers and `decode`
+    converts one to BGR. It is only called from latest_frame(), i.e. when a live
+    consumer actually asks for a frame.
+
+    If `frame_shape` is given (decoded BGR capture), frames are retrieved into a
+    FramePool of `pool_size` buffers (default: queue size + POOL_HEADROOM).
+    """
+
+    def __init__(self, cap, writer, queue_size=DEFAULT_QUEUE_SIZE,
+                 drop_policy=DEFAULT_DROP_POLICY, annotate=None, name="camera",
+                 timestamps_path=None, decode=None, frame_shape=None, pool_size=None):
+        self.cap = cap
+        self.writer = writer
+        self.annotate = annotate
+        self.name = name
+        self.queue = FrameQueue(queue_size, drop_policy)
+        self.timestamps_path = timestamps_path
+        self.timestamps = None
+        self.decode = decode
+        self.info = {}  # Extra fields reported by stats(), e.g. camera index and codec
+
+        self.pool = None
+        if frame_shape is not None and decode is None:
+            self.pool = FramePool(pool_size or queue_size + POOL_HEADROOM, frame_shape)
+
+        # Most recently written frame, for live consumers
+        self._latest = None
+        self._latest_decoded = None
+        self._latest_lock = threading.Lock()
+
+        # Offset to convert monotonic capture times to wall clock for overlays
+        self._wall_offset = time.time() - time.monotonic()
+
+        # Counters
+        self.captured = 0
+        self.encoded = 0
+        self.read_errors = 0
+        self.pool_drops = 0  # Frames skipped because no pool buffer was free
+        self.unpooled_frames = 0  # Frames the camera returned in a buffer of its own
+
+        self._stop_event = threading.Event()
+        self._capture_thread = None
+        self._encoder_thread = None
+        self._start_time = None
+        self._stop_time = None
+
+    @property
+    def dropped(self):
+        return self.queue.dropped + self.pool_drops
+
+    def start(self):
+        """Start the capture and encoder threads"""
+        self._start_time = time.time()
+
+        if self.timestamps_path:
+            self.timestamps = FrameTimestampWriter(self.timestamps_path)
+
+        self._encoder_thread = threading.Thread(target=self._encoder_loop, name=f"{self.name}-encoder")
+        self._encoder_thread.daemon = True
+        self._encoder_thread.start()
+
+        self._capture_thread = threading.Thread(target=self._capture_loop, name=f"{self.name}-capture")
+        self._capture_thread.daemon = True
+        self._capture_thread.start()
+
+    def stop(self, timeout=5):
+        """Stop capturing, let the encoder drain the queue and release the camera and writer"""
+        self._stop_event.set()
+
+        if self._capture_thread:
+            self._capture_thread.join(timeout=timeout)
+
+        # Encoder drains whatever is left, then exits
+        self.queue.close()
+        if self._encoder_thread:
+            self._encoder_thread.join(timeout=timeout)
+
+        self._stop_time = time.time()
+        self.writer.release()
+        self.cap.release()
+        if self.timestamps:
+            self.timestamps.close()
+
+    def is_running(self):
+        return self._capture_thread is not None and self._capture_thread.is_alive()
+
+    def latest_frame(self):
+        """Return (capture_index, capture_time, BGR frame) for the last written frame, or None.
+
+        Pass the frame to release_frame() when done with it, so its pool buffer
+        can be reused.
+        """
+        with self._latest_lock:
+            latest = self._latest
+            if latest is None:
+                return None
+
+            capture_index, capture_time, frame = latest
+            if self.decode is None:
+                self._retain(frame)
+                return capture_index, capture_time, frame
+
+        # Decode at most once per frame, however many consumers ask
+        decoded = self._latest_decoded
+        if decoded is None or decoded[0] != capture_index:
+            decoded = (capture_index, self.decode(frame))
+            self._latest_decoded = decoded
+        return capture_index, capture_time, decoded[1]
+
+    def stats(self):
+        """Return a dict with the pipeline counters and achieved rates"""
+        end_time = self._stop_time or time.time()
+        elapsed = end_time - self._start_time if self._start_time else 0
+
+        return {
+            **self.info,
+            "captured_frames": self.captured,
+            "encoded_frames": self.encoded,
+            "dropped_frames": self.dropped,
+            "read_errors": self.read_errors,
+            "queue_size": self.queue.maxsize,
+            "drop_policy": self.queue.drop_policy,
+            "elapsed_seconds": elapsed,
+            "capture_fps": self.captured / elapsed if elapsed > 0 else 0,
+            "encode_fps": self.encoded / elapsed if elapsed > 0 else 0,
+            "timestamps_file": os.path.basename(self.timestamps_path) if self.timestamps_path else None,
+            "pool_buffers": len(self.pool) if self.pool else 0,
+            "pool_drops": self.pool_drops,
+            "unpooled_frames": self.unpooled_frames,
+        }
+
+    def release_frame(self, frame):
+        """Hand back a frame obtained from latest_frame()"""
+        self._release(frame)
+
+    def _retain(self, frame):
+        if self.pool:
+            self.pool.retain(frame)
+
+    def _release(self, frame):
+        if self.pool:
+            self.pool.release(frame)
+
+    def _acquire_buffer(self):
+        """Get a free pool buffer, applying the drop policy when the pool is exhausted"""
+        if self.queue.drop_policy == BLOCK:
+            while not self._stop_event.is_set():
+                buf = self.pool.acquire(timeout=0.5)
+                if buf is not None:
+                    return buf
+            return None
+
+        buf = self.pool.acquire(timeout=0)
+        if buf is None:
+            # Recycle the buffer of the oldest queued frame
+            oldest = self.queue.drop_oldest()
+            if oldest is not None:
+                self._release(oldest[2])
+            buf = self.pool.acquire(timeout=0.05)
+        return buf
+
+    def _capture_loop(self):
+        """Grab frames as fast as the camera delivers them and queue them"""
+        try:
+            while not self._stop_event.is_set():
+                # Timestamp right after the grab, before the frame is decoded
+                ret = self.cap.grab()
+                capture_time = time.monotonic()
+
+                buf = None
+                if ret and self.pool:
+                    buf = self._acquire_buffer()
+                    if buf is None:
+                        # No buffer came free, skip this frame
+                        self.pool_drops += 1
+                        self.captured += 1
+                        continue
+
+                if ret:
+                    ret, frame = self.cap.retrieve(buf)
+
+                if ret and buf is not None and frame is not buf:
+                    # Camera returned a different size, the pool buffer was not used
+                    self._release(buf)
+                    self.unpooled_frames += 1
+                elif not ret and buf is not None:
+                    self._release(buf)
+
+                if not ret:
+                    self.read_errors += 1
+                    print(f"Error: Could not read frame from {self.name}")
+                    # Try to recover
+                    time.sleep(0.1)
+                    continue
+
+                dropped_item = self.queue.put((self.captured, capture_time, frame))
+                if dropped_item is not None:
+                    self._release(dropped_item[2])
+                self.captured += 1
+
+        except Exception as e:
+            print(f"Error in {self.name} capture thread: {e}")
+
+    def _encoder_loop(self):
+        """Take frames off the queue, annotate them and write them to the video file"""
+        last_report_time = time.time()
+        last_report_count = 0
+
+        try:
+            while True:
+                item = self.queue.get(timeout=0.5)
+                if item is None:
+                    if self.queue.closed:
+                        break
+                    continue
+
+                capture_index, capture_time, frame = item
+
+                if self.annotate:
+                    self.annotate(frame, capture_time + self._wall_offset)
+
+                self.writer.write(frame)
+                if self.timestamps:
+                    self.timestamps.write(capture_index, capture_time, time.monotonic() - capture_time)
+                self.encoded += 1
+
+                # Keep the frame around for live consumers, then drop the encoder's reference
+                with self._latest_lock:
+                    self._retain(frame)
+                    if self._latest is not None:
+                        self._release(self._latest[2])
+                    self._latest = item
+                self._release(frame)
+
+                # Print status periodically
+                if self.encoded % STATUS_INTERVAL_FRAMES == 0:
+                    current_time = time.time()
+                    elapsed = current_time - last_report_time
+                    fps = (self.encoded - last_report_count) / elapsed if elapsed > 0 else 0
+                    print(f"Recording video: {self.encoded} frames, {fps:.1f} fps "
+                          f"(captured {self.captured}, dropped {self.dropped}, queued {len(self.queue)})")
+                    last_report_time = current_time
+                    last_report_count = self.encoded
+
+        except Exception as e:
+            print(f"Error in {self.name} encoder thread: {e}")
+
+
+def start_camera_recording(camera_index, video_base_path, width, height, fps,
+                           recording_mode="encode", queue_size=DEFAULT_QUEUE_SIZE,
+                           drop_policy=DEFAULT_DROP_POLICY, annotate=None):
+    """Open a camera and its video file and start a CameraPipeline for them.
+
+    `video_base_path` is the output path without extension (e.g. "run/video");
+    the extension follows the codec. `recording_mode` is "encode" (codec from
+    video_encoder.load_encoder_choice) or "mjpeg" (passthrough, no overlay).
+    Returns the started pipeline, or None if the camera or writer failed to open.
+    """
+    name = f"camera{camera_index}"
+
+    # Initialize camera
+    cap = cv2.VideoCapture(camera_index)
+    if not cap.isOpened():
+        print(f"Error: Could not open camera {camera_index}")
+        return None
+
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    cap.set(cv2.CAP_PROP_FPS, fps)
+
+    # Keep the camera's compressed frames instead of decoding and re-encoding them
+    decode = None
+    if recording_mode == "mjpeg":
+        if enable_mjpeg_passthrough(cap):
+            decode = decode_jpeg
+            print(f"Camera {camera_index}: MJPEG passthrough enabled, frames are stored without transcoding")
+        else:
+            print(f"Warning: Camera {camera_index} does not deliver MJPEG, falling back to encoding")
+
+    # Get actual camera properties (might be different from requested)
+    actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    actual_fps = cap.get(cv2.CAP_PROP_FPS)
+    print(f"Camera {camera_index} initialized with resolution: {actual_width}x{actual_height} @ {actual_fps}fps")
+
+    # Create the video writer
+    if decode:
+        codec = "mjpeg_passthrough"
+        video_path = video_base_path + ".mjpeg"
+        out = MjpegStreamWriter(video_path)
+    else:
+        codec = load_encoder_choice(actual_width, actual_height)
+        video_path = video_filename(video_base_path, codec)
+        out = open_video_writer(video_path, codec, actual_fps, (actual_width, actual_height))
+
+    if not out.isOpened():
+        print(f"Error: Could not create video writer for camera {camera_index}")
+        cap.release()
+        return None
+
+    print(f"Camera {camera_index}: recording to {video_path} ({codec})")
+
+    pipeline = CameraPipeline(cap, out,
+                              queue_size=queue_size,
+                              drop_policy=drop_policy,
+                              annotate=None if decode else annotate,
+                              name=name,
+                              timestamps_path=sidecar_path(video_path),
+                              decode=decode,
+                              frame_shape=None if decode else (actual_height, actual_width, 3))
+    pipeline.info = {
+        "camera_index": camera_index,
+        "video_file": os.path.basename(video_path),
+        "codec": codec,
+        "width": actual_width,
+        "height": actual_height,
+        "fps": actual_fps,
+    }
+    pipeline.start()
+    return pipeline
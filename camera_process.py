@@ -0,0 +1,213 @@
+"""
+Camera Recording in a Child Process
+
+Runs the camera pipelines (capture, optional overlay, encoding, timestamp
+sidecars, live ball tracking) in a separate process, so frame encoding and
+drawing never compete for the GIL with pysphero's BLE receiver and the sensor
+callback in the collector process.
+
+Frame timestamps need no translation: time.monotonic() is the system-wide
+monotonic clock, so the child's sidecar times and the parent's sensor times
+are on the same clock. The run start time used by the overlay is sent to the
+child once it is known.
+
+Parent and child talk over a multiprocessing Pipe with small dict messages:
+
+    parent -> child   {"type": "run_start", "time": ...}, {"type": "stop"}
+    child -> parent   {"type": "started", "cameras": [...]}        pipeline info per opened camera
+                      {"type": "status", "cameras": [...], ...}    stats every STATUS_INTERVAL seconds
+                      {"type": "stopped", "cameras": [...], ...}   final stats after release
+"""
+
+import multiprocessing
+import signal
+import threading
+import time
+
+import cv2
+
+from ball_tracker import LiveBallTracker
+from camera_pipeline import DEFAULT_DROP_POLICY, DEFAULT_QUEUE_SIZE, start_camera_recording
+
+STATUS_INTERVAL = 5.0  # Seconds between status messages from the child
+START_TIMEOUT = 15.0  # Seconds to wait for the child to open the cameras
+STOP_TIMEOUT = 15.0  # Seconds to wait for the child to flush and release the cameras
+
+
+def run_camera_process(conn, config):
+    """Child process entry point: record from the configured cameras until told to stop"""
+    # Ctrl+C reaches the whole process group; the parent decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    run_start = {"time": None}
+
+    def annotate(frame, capture_time):
+        timestamp = capture_time - run_start["time"] if run_start["time"] else 0
+        cv2.putText(frame, f"Time: {timestamp:.3f}s", (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+    pipelines = []
+    for camera_index, video_base_path in config["cameras"]:
+        pipeline = start_camera_recording(
+            camera_index, video_base_path,
+            config["width"], config["height"], config["fps"],
+            recording_mode=config["recording_mode"],
+            queue_size=config["queue_size"],
+            drop_policy=config["drop_policy"],
+            annotate=annotate if config["timestamp_overlay"] else None)
+        if pipeline:
+            pipelines.append(pipeline)
+
+    conn.send({"type": "started", "cameras": [pipeline.info for pipeline in pipelines]})
+    if not pipelines:
+        conn.close()
+        return
+
+    ball_tracker = None
+    if config["live_ball_tracking"]:
+        ball_tracker = LiveBallTracker(pipelines[0])
+        ball_tracker.start()
+
+    next_status = time.monotonic() + config["status_interval"]
+    while any(pipeline.is_running() for pipeline in pipelines):
+        if conn.poll(max(0.0, min(0.5, next_status - time.monotonic()))):
+            try:
+                message = conn.recv()
+            except EOFError:
+                break  # Parent died
+            if message["type"] == "stop":
+                break
+            if message["type"] == "run_start":
+                run_start["time"] = message["time"]
+
+        if time.monotonic() >= next_status:
+            conn.send({
+                "type": "status",
+                "cameras": [pipeline.stats() for pipeline in pipelines],
+                "ball": ball_tracker.latest if ball_tracker else None,
+            })
+            next_status += config["status_interval"]
+
+    if ball_tracker:
+        ball_tracker.stop()
+    for pipeline in pipelines:
+        pipeline.stop()
+
+    try:
+        conn.send({
+            "type": "stopped",
+            "cameras": [pipeline.stats() for pipeline in pipelines],
+            "frames_tracked": ball_tracker.frames_tracked if ball_tracker else None,
+        })
+    except (BrokenPipeError, OSError):
+        pass
+    conn.close()
+
+
+class CameraProcess:
+    """Parent side handle for camera recording in a child process.
+
+    `cameras` is a list of (camera_index, video_base_path) pairs; the other
+    arguments are passed through to camera_pipeline.start_camera_recording.
+    """
+
+    def __init__(self, cameras, width, height, fps, recording_mode="encode",
+                 queue_size=DEFAULT_QUEUE_SIZE, drop_policy=DEFAULT_DROP_POLICY,
+                 timestamp_overlay=False, live_ball_tracking=False, status_interval=STATUS_INTERVAL):
+        self.config = {
+            "cameras": list(cameras),
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "recording_mode": recording_mode,
+            "queue_size": queue_size,
+            "drop_policy": drop_policy,
+            "timestamp_overlay": timestamp_overlay,
+            "live_ball_tracking": live_ball_tracking,
+            "status_interval": status_interval,
+        }
+        self.cameras = []  # Pipeline info of the cameras the child opened
+        self.status = None  # Latest status message
+        self.status_messages = 0
+        self.final = None  # The "stopped" message
+
+        self._conn = None
+        self._process = None
+        self._reader = None
+        self._send_lock = threading.Lock()
+        self._started = threading.Event()
+        self._stopped = threading.Event()
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process else None
+
+    def start(self, timeout=START_TIMEOUT):
+        """Start the child and wait until it has opened its cameras. Returns the opened cameras."""
+        # spawn: never fork a process that has live BLE threads
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=run_camera_process, args=(child_conn, self.config),
+                                        name="camera-process", daemon=True)
+        self._process.start()
+        child_conn.close()
+
+        self._reader = threading.Thread(target=self._read_loop, name="camera-process-reader")
+        self._reader.daemon = True
+        self._reader.start()
+
+        if not self._started.wait(timeout):
+            print("Error: Camera process did not start in time")
+        return self.cameras
+
+    def is_running(self):
+        return self._process is not None and self._process.is_alive() and not self._stopped.is_set()
+
+    def set_run_start(self, wall_time):
+        """Tell the child the run start time (time.time()) for the timestamp overlay"""
+        self._send({"type": "run_start", "time": wall_time})
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Stop recording and return the final per-camera stats"""
+        if self._process is None:
+            return []
+
+        self._send({"type": "stop"})
+        self._stopped.wait(timeout)
+        self._process.join(timeout=2)
+        if self._process.is_alive():
+            print("Warning: Camera process did not exit, terminating it")
+            self._process.terminate()
+            self._process.join(timeout=2)
+
+        if self.final:
+            return self.final["cameras"]
+        # Fall back to the last status the child sent
+        return self.status["cameras"] if self.status else []
+
+    def _send(self, message):
+        with self._send_lock:
+            try:
+                self._conn.send(message)
+            except (BrokenPipeError, OSError):
+                pass  # Child already gone
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if message["type"] == "started":
+                self.cameras = message["cameras"]
+                self._started.set()
+            elif message["type"] == "status":
+                self.status = message
+                self.status_messages += 1
+            elif message["type"] == "stopped":
+                self.final = message
+                break
+
+        self._started.set()
+        self._stopped.set()
@@ -0,0 +1,213 @@
+"""
+Collector Runtime
+
+A single asyncio event loop for a data collection run. Periodic work
+(movement commands, keep-alive, backups, status) runs as tasks scheduled
+against absolute deadlines instead of sleep-and-poll loops, so a task wakes
+exactly when it is due and slow iterations do not push later ones back.
+
+Blocking calls go to small bounded thread pools:
+
+    ble()  one worker, so BLE requests to the robot are never issued concurrently
+    io()   disk writes (backups, camera start/stop)
+
+With several robots (fleet_collector.py) each one gets its own single-worker
+executor from robot_executor(), so a slow or reconnecting robot never holds up
+the others' requests. After a lost connection reset_ble() (or a new
+robot_executor()) replaces the executor, whose worker may still be waiting out
+the dead connection's request timeouts, so reconnecting can start at once.
+
+Each periodic task records how late it started relative to its deadline;
+timing_stats() summarizes this (mean/p50/p99/max in milliseconds) for
+metadata.json.
+
+Usage:
+
+    runtime = CollectorRuntime()
+
+    async def collect(runtime):
+        await runtime.every("status", 10, print_status)
+
+    runtime.run(collect(runtime))   # Ctrl+C stops, a second Ctrl+C force-exits
+"""
+
+import asyncio
+import functools
+import math
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BLE_WORKERS = 1
+IO_WORKERS = 2
+LATENESS_SAMPLES = 10000  # Most recent start delays kept per task for the stats
+
+
+class TaskTiming:
+    """Start delay statistics of one periodic task"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.runs = 0
+        self.skipped = 0
+        self._lateness = np.zeros(LATENESS_SAMPLES)
+
+    def record(self, lateness):
+        self._lateness[self.runs % LATENESS_SAMPLES] = lateness
+        self.runs += 1
+
+    def stats(self):
+        lateness = self._lateness[:min(self.runs, LATENESS_SAMPLES)] * 1000
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "skipped_deadlines": self.skipped,
+            "lateness_mean_ms": float(lateness.mean()) if len(lateness) else None,
+            "lateness_p50_ms": float(np.percentile(lateness, 50)) if len(lateness) else None,
+            "lateness_p99_ms": float(np.percentile(lateness, 99)) if len(lateness) else None,
+            "lateness_max_ms": float(lateness.max()) if len(lateness) else None,
+        }
+
+
+class CollectorRuntime:
+    """Event loop, executors and deadline scheduling for one collection run"""
+
+    def __init__(self, ble_workers=BLE_WORKERS, io_workers=IO_WORKERS):
+        self.ble_workers = ble_workers
+        self.ble_executor = ThreadPoolExecutor(max_workers=ble_workers, thread_name_prefix="ble")
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io")
+        self.robot_executors = []
+        self.timings = {}
+        self.loop = None
+        self._stop_event = None
+
+    @property
+    def running(self):
+        return self._stop_event is not None and not self._stop_event.is_set()
+
+    def stop(self):
+        """Ask every task to finish (safe to call from any thread)"""
+        if self.loop and self._stop_event:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+
+    async def wait_stopped(self):
+        await self._stop_event.wait()
+
+    def robot_executor(self, name):
+        """A dedicated single-worker BLE executor for one robot of a fleet"""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ble-{name}")
+        self.robot_executors.append(executor)
+        return executor
+
+    def reset_ble(self):
+        """Start a fresh BLE executor; a call stuck on the old one finishes in the background"""
+        self.ble_executor.shutdown(wait=False)
+        self.ble_executor = ThreadPoolExecutor(max_workers=self.ble_workers, thread_name_prefix="ble")
+
+    async def call(self, executor, fn, *args, **kwargs):
+        """Run a blocking call on the given executor"""
+        return await self.loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    async def ble(self, fn, *args, **kwargs):
+        """Run a blocking robot call on the BLE executor"""
+        return await self.call(self.ble_executor, fn, *args, **kwargs)
+
+    async def io(self, fn, *args, **kwargs):
+        """Run a blocking file/device call on the I/O executor"""
+        return await self.loop.run_in_executor(self.io_executor, functools.partial(fn, *args, **kwargs))
+
+    async def sleep(self, seconds):
+        """Sleep unless the run stops first. Returns False if it stopped."""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), seconds)
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    async def every(self, name, interval, fn, *args, first_delay=None):
+        """Call fn(*args) (a coroutine function or a plain function) every interval
+        seconds on a fixed deadline grid until the run stops.
+
+        Deadlines that were missed entirely are skipped rather than run back to
+        back. Exceptions from fn propagate to the caller.
+        """
+        timing = self.timings.setdefault(name, TaskTiming(interval))
+        deadline = self.loop.time() + (interval if first_delay is None else first_delay)
+
+        while self.running:
+            if not await self.sleep(deadline - self.loop.time()):
+                break
+
+            now = self.loop.time()
+            timing.record(now - deadline)
+            result = fn(*args)
+            if asyncio.iscoroutine(result):
+                await result
+
+            deadline += interval
+            now = self.loop.time()
+            if deadline < now:
+                missed = math.ceil((now - deadline) / interval)
+                timing.skipped += missed
+                deadline += missed * interval
+
+    async def first(self, *coros):
+        """Run coroutines until the first one finishes, then cancel the others.
+        Returns its result or raises its exception (e.g. a lost connection
+        noticed by either movement or a watchdog)."""
+        tasks = [asyncio.ensure_future(coro) for coro in coros]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def timing_stats(self):
+        return {name: timing.stats() for name, timing in self.timings.items()}
+
+    def run(self, coro):
+        """Run the collection coroutine to completion, stopping cleanly on Ctrl+C"""
+        asyncio.run(self._main(coro))
+        self.ble_executor.shutdown(wait=False)
+        for executor in self.robot_executors:
+            executor.shutdown(wait=False)
+        self.io_executor.shutdown(wait=True)
+
+    async def _main(self, coro):
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+
+        def interrupt():
+            if not self.running:  # Ctrl+C pressed twice
+                print("\nForce exiting...")
+                os._exit(1)
+            print("\nStopping data collection and Sphero movement...")
+            self._stop_event.set()
+
+        self.loop.add_signal_handler(signal.SIGINT, interrupt)
+        try:
+            return await coro
+        finally:
+            self.loop.remove_signal_handler(signal.SIGINT)
+
+
+def sample_rate_stats(times, target_hz):
+    """Achieved rate of a sample stream, from the monotonic times of its samples"""
+    times = np.asarray(times, dtype=np.float64)
+    if len(times) < 2:
+        return None
+
+    # Samples per one-second window over the whole run
+    windows = np.histogram(times, bins=np.arange(times[0], times[-1] + 1.0, 1.0))[0]
+    intervals = np.diff(times)
+    return {
+        "target_hz": target_hz,
+        "mean_hz": (len(times) - 1) / (times[-1] - times[0]) if times[-1] > times[0] else None,
+        "min_window_hz": int(windows[:-1].min()) if len(windows) > 1 else None,
+        "p5_window_hz": float(np.percentile(windows[:-1], 5)) if len(windows) > 1 else None,
+        "max_gap_seconds": float(intervals.max()),
+    }
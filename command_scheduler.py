@@ -0,0 +1,267 @@
+"""
+Deadline-Scheduled Command Timing
+
+Issues movement commands against absolute time.monotonic() deadlines instead of
+sleeping a fixed time after each blocking command (which makes the real period
+the sleep plus the BLE round trip, and lets errors accumulate).
+
+pysphero's drive_with_heading() blocks until the robot answers, so the
+command reaches the robot at roughly the midpoint of the call. The scheduler
+keeps a running estimate of that one-way latency and starts each send that
+much before its deadline, so commands land on the deadline rather than after
+it.
+
+Every command's planned time, send start and completion are recorded. The
+jitter of a command is its estimated arrival (midpoint of the call) minus its
+planned time; stats() summarizes it as a histogram for metadata.json.
+
+With an AdaptivePacer the send rate also follows the BLE round trip, like TCP
+congestion control: when the smoothed round trip rises well above the lowest
+one seen (or a send fails) the rate is halved, and while it stays low the rate
+climbs back linearly, up to the schedule's own rate. The round trip is smoothed
+over time rather than per command, so recovery is not slowed down by the low
+rate itself. Sends are then held back to at least 1/rate apart, so slow acks do
+not pile commands up into pysphero's 10 s request timeout. The rate is logged
+over time.
+
+Usage:
+
+    scheduler = CommandScheduler(period=0.2, pacer=AdaptivePacer(max_rate=5))
+    while running:
+        scheduler.wait()
+        started = time.monotonic()
+        sphero.driving.drive_with_heading(speed, heading, Direction.forward)
+        scheduler.record(started, time.monotonic())   # or scheduler.failed() if it raised
+"""
+
+import math
+import time
+
+import numpy as np
+
+LATENCY_SMOOTHING = 0.2  # Weight of the newest sample in the latency estimate
+MAX_COMPENSATION = 0.1  # Never start sends more than this many seconds early
+JITTER_BINS_MS = [-50, -20, -10, -5, -2, -1, 0, 1, 2, 5, 10, 20, 50, 100]
+
+RTT_TIME_CONSTANT = 0.5  # Seconds over which the smoothed RTT follows a change
+CONGESTION_MARGIN = 0.1  # Seconds of smoothed RTT above the lowest RTT seen that count as congestion
+MIN_RATE = 0.5  # Commands/second the pacer never goes below
+RATE_INCREASE = 1.0  # Commands/second added per second without congestion
+RATE_LOG_INTERVAL = 1.0  # Seconds; rate changes closer together share one log entry
+SEND_RATE_WINDOW = 10.0  # Seconds per entry of the achieved send rate log
+
+
+def jitter_stats(planned, started, completed):
+    """Summarize command timing arrays as a jitter histogram (milliseconds)"""
+    planned = np.asarray(planned, dtype=np.float64)
+    if len(planned) == 0:
+        return None
+
+    started = np.asarray(started, dtype=np.float64)
+    completed = np.asarray(completed, dtype=np.float64)
+    jitter = ((started + completed) / 2 - planned) * 1000
+    round_trip = (completed - started) * 1000
+
+    # Outer bins catch everything beyond the listed edges
+    edges = [-np.inf] + JITTER_BINS_MS + [np.inf]
+    counts = np.histogram(jitter, bins=edges)[0]
+    return {
+        "commands": len(planned),
+        "jitter_mean_ms": float(jitter.mean()),
+        "jitter_p50_ms": float(np.percentile(jitter, 50)),
+        "jitter_p99_abs_ms": float(np.percentile(np.abs(jitter), 99)),
+        "jitter_max_abs_ms": float(np.abs(jitter).max()),
+        "round_trip_mean_ms": float(round_trip.mean()),
+        "round_trip_p99_ms": float(np.percentile(round_trip, 99)),
+        "histogram_edges_ms": JITTER_BINS_MS,
+        "histogram_counts": counts.tolist(),
+    }
+
+
+def send_rate_log(started, window=SEND_RATE_WINDOW):
+    """Achieved send rate over time: [[window start, commands/second], ...]"""
+    started = np.asarray(started, dtype=np.float64)
+    if len(started) == 0:
+        return []
+    edges = np.arange(started[0], started[-1] + window, window)
+    counts = np.histogram(started, bins=edges)[0] if len(edges) > 1 else np.array([len(started)])
+    return [[float(t), float(n) / window] for t, n in zip(edges, counts)]
+
+
+class AdaptivePacer:
+    """AIMD send rate driven by the command round trip time"""
+
+    def __init__(self, max_rate, min_rate=MIN_RATE, increase=RATE_INCREASE, margin=CONGESTION_MARGIN):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.increase = increase
+        self.margin = margin
+        self.rate = max_rate
+        self.srtt = None
+        self.min_rtt = None
+        self.decreases = 0
+        self.failures = 0
+        self.rate_log = []  # [monotonic time, rate, smoothed RTT ms]
+        self._hold_until = 0.0
+        self._last_sample = None
+
+    @property
+    def interval(self):
+        """Minimum time between send starts"""
+        return 1.0 / self.rate
+
+    @property
+    def congested(self):
+        return self.srtt is not None and self.srtt > self.min_rtt + self.margin
+
+    def on_round_trip(self, rtt, now):
+        """Update the smoothed RTT with a completed command and adjust the rate"""
+        elapsed = 0.0 if self._last_sample is None else now - self._last_sample
+        self._last_sample = now
+        if self.srtt is None:
+            self.srtt = rtt
+        else:
+            self.srtt += (1 - math.exp(-elapsed / RTT_TIME_CONSTANT)) * (rtt - self.srtt)
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+
+        if self.congested:
+            self._decrease(now)
+        elif self.rate < self.max_rate:
+            self._set_rate(min(self.max_rate, self.rate + self.increase * elapsed), now)
+
+    def on_failure(self, now):
+        """A send raised (usually a timeout): treat it as congestion"""
+        self.failures += 1
+        self._decrease(now)
+
+    def _decrease(self, now):
+        # Halve at most once per smoothed RTT window, like one loss event per window in TCP
+        if now < self._hold_until or self.rate <= self.min_rate:
+            return
+        self.decreases += 1
+        self._set_rate(max(self.min_rate, self.rate / 2), now)
+        self._hold_until = now + max(self.srtt or 0.0, self.interval)
+
+    def _set_rate(self, rate, now):
+        self.rate = rate
+        entry = [now, rate, self.srtt * 1000 if self.srtt is not None else None]
+        if self.rate_log and now - self.rate_log[-1][0] < RATE_LOG_INTERVAL:
+            self.rate_log[-1][1:] = entry[1:]
+        else:
+            self.rate_log.append(entry)
+
+    def stats(self):
+        """Rate summary and log for metadata.json"""
+        return {
+            "max_rate": self.max_rate,
+            "min_rate": self.min_rate,
+            "final_rate": self.rate,
+            "rate_decreases": self.decreases,
+            "send_failures": self.failures,
+            "smoothed_rtt_ms": self.srtt * 1000 if self.srtt is not None else None,
+            "min_rtt_ms": self.min_rtt * 1000 if self.min_rtt is not None else None,
+            "rate_log": self.rate_log,
+        }
+
+
+class CommandScheduler:
+    """Paces commands on absolute deadlines with send latency compensation.
+
+    With a period, deadlines form a fixed grid (missed ones are skipped). For
+    irregular timing, call schedule() with each next deadline instead. With a
+    pacer, sends are additionally kept at least pacer.interval apart.
+    """
+
+    def __init__(self, period=None, compensate=True, start=None, pacer=None):
+        self.period = period
+        self.compensate = compensate
+        self.pacer = pacer
+        self.latency = 0.0  # Estimated one-way send latency in seconds
+        self.next_deadline = time.monotonic() if start is None else start
+        self.skipped = 0
+        self.last_started = None
+
+        self.planned = []
+        self.started = []
+        self.completed = []
+
+    def schedule(self, deadline):
+        """Set the deadline of the next command (time.monotonic() seconds)"""
+        self.next_deadline = deadline
+
+    def _paced_time(self):
+        """Earliest next send allowed by the pacer, or None while it is not holding sends back.
+
+        At full rate the schedule alone sets the timing; gating on the last send
+        would then carry each send's lateness into the next one.
+        """
+        if self.pacer is None or self.last_started is None or self.pacer.rate >= self.pacer.max_rate:
+            return None
+        return self.last_started + self.pacer.interval
+
+    def earliest_send(self):
+        """Earliest time the pacer allows the next send (time.monotonic() seconds)"""
+        paced = self._paced_time()
+        return time.monotonic() if paced is None else max(time.monotonic(), paced)
+
+    def send_time(self):
+        """When the next send should start"""
+        compensation = min(self.latency, MAX_COMPENSATION) if self.compensate else 0.0
+        send_time = self.next_deadline - compensation
+        paced = self._paced_time()
+        return send_time if paced is None else max(send_time, paced)
+
+    def delay(self):
+        """Seconds until the next send should start (0 if it is already due)"""
+        return max(0.0, self.send_time() - time.monotonic())
+
+    def wait(self):
+        """Sleep until the next send should start"""
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, started, completed):
+        """Record a command sent for the current deadline and advance to the next one"""
+        self.planned.append(self.next_deadline)
+        self.started.append(started)
+        self.completed.append(completed)
+        self.last_started = started
+        if self.pacer is not None:
+            self.pacer.on_round_trip(completed - started, completed)
+
+        one_way = (completed - started) / 2
+        if len(self.planned) == 1:
+            self.latency = one_way
+        else:
+            self.latency += LATENCY_SMOOTHING * (one_way - self.latency)
+
+        self._advance()
+
+    def failed(self, started=None):
+        """Record that the send for the current deadline raised, and advance to the next one"""
+        now = time.monotonic()
+        self.last_started = now if started is None else started
+        if self.pacer is not None:
+            self.pacer.on_failure(now)
+        self._advance()
+
+    def _advance(self):
+        if self.period:
+            self.next_deadline += self.period
+            # Deadlines the pacer holds sends back from are skipped like missed ones
+            now = self.earliest_send()
+            if self.next_deadline < now:
+                missed = math.ceil((now - self.next_deadline) / self.period)
+                self.skipped += missed
+                self.next_deadline += missed * self.period
+
+    def stats(self):
+        """Jitter histogram and latency numbers for metadata.json"""
+        stats = jitter_stats(self.planned, self.started, self.completed)
+        if stats is not None:
+            stats["period_seconds"] = self.period
+            stats["latency_compensation"] = self.compensate
+            stats["skipped_deadlines"] = self.skipped
+            stats["pacing"] = self.pacer.stats() if self.pacer else None
+        return stats
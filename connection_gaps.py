@@ -0,0 +1,164 @@
+"""
+Reconnect Backoff and Gap Records
+
+When a connection drops, the collectors reconnect after a short, jittered,
+exponentially growing delay (50 ms, 100 ms, 200 ms, ... up to 5 s) instead of
+a fixed 5 s, so a brief dropout costs well under a second of data. The delay
+only starts again from the bottom once a connection has stayed up for
+STABLE_AFTER seconds, so a robot that drops right after every connect is not
+hammered with connects. The jitter keeps several robots that dropped together
+from reconnecting in lockstep.
+
+The run then continues in the same files, and every hole is recorded
+explicitly in gaps.csv, one row per gap:
+
+    start_monotonic  last sample before the connection was lost
+    end_monotonic    first sample after it came back (empty if the run ended first)
+    start, end       the same, in seconds from the run start as in the sensor CSV
+    duration         seconds
+    reason           why the connection was considered lost
+
+Both ends are sample times, so a gap covers exactly the samples that are
+missing, whatever the time the loss took to be noticed.
+
+A connection that stays open but stops streaming counts as lost too:
+watch_stream() raises after STREAM_TIMEOUT seconds without a sample, much
+sooner than failing keep-alive requests would notice.
+
+Usage:
+    backoff = ReconnectBackoff()
+    gaps = GapLog("collected_data/run_.../gaps.csv", run_start)
+    ...connection lost: gaps.open(reason, last_sample); await sleep(backoff.next_delay())
+    ...connected:       backoff.connected()
+    ...first sample:    gaps.close(sample_time)
+"""
+
+import csv
+import random
+import threading
+import time
+
+RECONNECT_INITIAL_DELAY = 0.05  # Seconds before the first reconnect attempt
+RECONNECT_MAX_DELAY = 5.0  # Seconds
+RECONNECT_FACTOR = 2.0
+STABLE_AFTER = 10.0  # Seconds a connection must last before the delay starts again at the initial delay
+STREAM_TIMEOUT = 1.0  # Seconds without a sensor sample before the connection counts as lost
+GAP_COLUMNS = ['start_monotonic', 'end_monotonic', 'start', 'end', 'duration', 'reason']
+
+
+class ReconnectBackoff:
+    """Jittered exponential delays between reconnect attempts"""
+
+    def __init__(self, initial=RECONNECT_INITIAL_DELAY, maximum=RECONNECT_MAX_DELAY, factor=RECONNECT_FACTOR,
+                 stable_after=STABLE_AFTER, rng=None):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.stable_after = stable_after
+        self.rng = rng or random.Random()
+        self.attempt = 0  # Consecutive attempts since the last stable connection
+        self._connected_at = None
+
+    def connected(self, now=None):
+        """Note that a connection is up (and streaming)"""
+        self._connected_at = time.monotonic() if now is None else now
+
+    def next_delay(self, now=None):
+        """Seconds to wait before the next attempt, after a failed connect or a lost connection"""
+        now = time.monotonic() if now is None else now
+        if self._connected_at is not None and now - self._connected_at >= self.stable_after:
+            self.attempt = 0
+        self._connected_at = None
+
+        base = min(self.maximum, self.initial * self.factor ** self.attempt)
+        self.attempt += 1
+        # Equal jitter: at least half the base delay, so the delays still grow
+        return base / 2 + self.rng.uniform(0, base / 2)
+
+
+class GapLog:
+    """Holes in a run's data, appended to a CSV file as they close"""
+
+    def __init__(self, path, run_start=None):
+        self.path = path
+        self.run_start = run_start  # time.monotonic() of the run's first sample; None until known
+        self.gaps = []
+        self._open = None
+        self._lock = threading.Lock()  # close() runs on the sensor notify thread
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerow(GAP_COLUMNS)
+
+    @property
+    def is_open(self):
+        return self._open is not None
+
+    def open(self, reason, start):
+        """Start a gap at start (the last sample's time.monotonic()); a gap already open keeps its start"""
+        with self._lock:
+            if self._open is None:
+                self._open = {"start_monotonic": start, "reason": reason}
+            elif reason not in self._open["reason"]:
+                self._open["reason"] += f"; {reason}"  # e.g. a failed reconnect attempt
+
+    def close(self, end):
+        """End the open gap at end (the first new sample's time.monotonic()); no-op without one"""
+        with self._lock:
+            if self._open is None:
+                return
+            gap, self._open = self._open, None
+            self._write(gap, end)
+
+    def finish(self):
+        """Record a gap that was still open when the run ended"""
+        with self._lock:
+            if self._open is not None:
+                gap, self._open = self._open, None
+                self._write(gap, None)
+
+    def _write(self, gap, end):
+        start = gap["start_monotonic"]
+        gap.update(
+            end_monotonic=end,
+            start=start - self.run_start if self.run_start is not None else None,
+            end=end - self.run_start if self.run_start is not None and end is not None else None,
+            duration=end - start if end is not None else None,
+        )
+        self.gaps.append(gap)
+        with open(self.path, 'a', newline='') as f:
+            csv.writer(f).writerow([gap[column] if gap[column] is not None else '' for column in GAP_COLUMNS])
+
+    def stats(self):
+        """Summary for metadata.json"""
+        with self._lock:
+            durations = [gap["duration"] for gap in self.gaps if gap["duration"] is not None]
+            return {
+                "gaps": len(self.gaps),
+                "total_seconds": sum(durations),
+                "longest_seconds": max(durations) if durations else None,
+                "reasons": [gap["reason"] for gap in self.gaps],
+            }
+
+
+async def watch_stream(runtime, last_sample, timeout=STREAM_TIMEOUT):
+    """Raise ConnectionError once the newest sample (last_sample() returns its
+    time.monotonic(), or None) is more than timeout seconds old; returns when the run stops.
+    timeout may also be a function returning the seconds, for a stream whose rate can change"""
+    current_timeout = timeout if callable(timeout) else lambda: timeout
+    started = time.monotonic()
+    while await runtime.sleep(current_timeout() / 4):
+        newest = max(last_sample() or started, started)
+        limit = current_timeout()
+        if time.monotonic() - newest > limit:
+            raise ConnectionError(f"no sensor data for {limit:.1f}s")
+
+
+def close_in_background(sphero, label="Sphero"):
+    """Close a lost connection on a thread of its own, so requests still waiting
+    for a response from it hold up neither the reconnect nor the event loop"""
+    def close():
+        try:
+            sphero.__exit__(None, None, None)
+        except Exception as e:
+            print(f"{label}: error closing lost connection: {e}")
+
+    threading.Thread(target=close, name="close-connection", daemon=True).start()
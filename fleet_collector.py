@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Fleet Data Collection
+
+Drives and records several Spheros in one arena under one camera from a single
+process. Every robot has its own connection, BLE executor thread, movement
+schedule and send-rate pacer on one CollectorRuntime event loop, so a slow or
+reconnecting robot does not hold up the others. Connections are spread over all
+local Bluetooth controllers by load (see ble_controllers.py), so adding a dongle
+adds radio capacity.
+
+Robots are given by MAC address or toy name (e.g. SB-8C49), or picked with
+--discover from the toys in range, strongest signal first. A background scan
+(toy_registry.py) keeps track of the toys, so each (re)connect starts as soon
+as the robot advertises, without a scan of its own.
+
+All files go into one run directory and use the shared time.monotonic() clock:
+
+    sensor_data_<name>.csv           accelerometer, gyroscope, locator, velocity
+    actions_<name>.bin               every command sent (see action_channel.py)
+    movement_schedule_<name>.npz     the robot's schedule (seed + robot position)
+    gaps_<name>.csv                  holes left by lost connections (see connection_gaps.py)
+    video.mp4, video_timestamps.bin  the shared camera (see camera_process.py)
+    metadata.json                    per-robot achieved sensor and command rates and startup times
+
+Usage:
+    python fleet_collector.py C9:B9:61:72:CB:78 SB-8C49 [--names red blue]
+                              [--policy spiral] [--seed 5] [--no-video]
+                              [--controllers hci0 hci1]
+    python fleet_collector.py --discover 3
+"""
+
+import asyncio
+import csv
+import datetime
+import json
+import os
+import threading
+import time
+
+from pysphero.constants import Toy
+from pysphero.core import Sphero
+from pysphero.driving import Direction
+from pysphero.device_api.sensor import Accelerometer, Gyroscope, Locator, Velocity
+
+from action_channel import ActionWriter
+from ble_controllers import (ControllerAllocator, adapter_for, connect_entry, connect_stats, first_command,
+                             list_controllers)
+from camera_process import CameraProcess
+from collector_runtime import CollectorRuntime, sample_rate_stats
+from command_scheduler import AdaptivePacer, CommandScheduler
+from connection_gaps import GapLog, ReconnectBackoff, close_in_background, watch_stream
+from movement_schedule import POLICIES, SchedulePlayer, generate_schedule, save_schedule
+from startup import StartupTimer, wait_until_ready
+from toy_registry import ToyRegistry, is_mac_address
+
+# Camera settings
+CAMERA_INDICES = [0]
+CAMERA_WIDTH = 640
+CAMERA_HEIGHT = 480
+CAMERA_FPS = 30
+RECORDING_MODE = "encode"  # "encode" or "mjpeg", as in sphero_move_and_collect_with_sensors.py
+
+# Data collection settings
+SENSOR_FREQUENCY = 20  # Hz per robot
+SENSOR_INTERVAL = int(1000 / SENSOR_FREQUENCY)  # Convert to milliseconds for PySphero API
+DATA_DIR = "collected_data"
+METADATA_FILENAME = "metadata.json"
+SENSOR_COLUMNS = [
+    'timestamp', 'monotonic_time',
+    'accel_x', 'accel_y', 'accel_z',
+    'gyro_x', 'gyro_y', 'gyro_z',
+    'locator_x', 'locator_y',
+    'velocity_x', 'velocity_y'
+]
+SENSOR_FLUSH_ROWS = 20  # Rows between CSV flushes, per robot
+
+# Movement settings
+MOVEMENT_INTERVAL = 0.5  # Seconds between commands per robot (before pacing)
+MAX_COMMAND_ERRORS = 3  # Consecutive failed commands before reconnecting
+CONNECTION_LOAD = SENSOR_FREQUENCY + 1 / MOVEMENT_INTERVAL  # Packets per second a robot puts on its controller
+
+# Runtime settings
+STATUS_INTERVAL = 10  # Seconds between status lines
+MAX_RECONNECTS = 20  # Consecutive failed attempts per robot; the delay backs off from 50 ms to 5 s
+DISCOVERY_TIME = 3.0  # Seconds of scanning before --discover picks the robots
+ADVERTISEMENT_TIMEOUT = 10.0  # Seconds to wait for a robot to advertise before connecting anyway
+WEAK_RSSI = -85  # dBm below which a robot's link is reported as weak
+
+
+def parse_sensor_response(response):
+    """Sensor values of one streamed sample, in SENSOR_COLUMNS order (without the times)"""
+    names = {
+        "Accelerometer.x": 0, "Accelerometer.y": 1, "Accelerometer.z": 2,
+        "Gyroscope.x": 3, "Gyroscope.y": 4, "Gyroscope.z": 5,
+        "Locator.x": 6, "Locator.y": 7,
+        "Velocity.x": 8, "Velocity.y": 9,
+    }
+    values = [0.0] * len(names)
+    for sensor_key, value in response.items():
+        position = names.get(str(sensor_key))
+        if position is not None:
+            values[position] = value
+    return values
+
+
+class FleetRobot:
+    """One robot of the fleet: its connection loop, movement and output files"""
+
+    def __init__(self, name, target, run_dir, run_started, commands, schedule_info, startup_started=None):
+        self.name = name
+        self.target = target  # MAC address or toy name
+        self.mac_address = target if is_mac_address(target) else None  # Known once the robot advertised
+        self.toy_type = Toy.unknown
+        self.run_started = run_started
+        self.sensor_file = f"sensor_data_{name}.csv"
+        self.actions_file = f"actions_{name}.bin"
+        self.gaps_file = f"gaps_{name}.csv"
+
+        self.scheduler = CommandScheduler(pacer=AdaptivePacer(max_rate=1 / MOVEMENT_INTERVAL))
+        self.player = SchedulePlayer(commands, schedule_info, self.scheduler)
+        self.actions = ActionWriter(os.path.join(run_dir, self.actions_file))
+        # Gap times are relative to the run start, like the CSV timestamps
+        self.gaps = GapLog(os.path.join(run_dir, self.gaps_file), time.monotonic() - (time.time() - run_started))
+        self.executor = None
+        self.controller = None  # Bluetooth controller of the current connection
+        self.controllers_used = []
+        self.connect_log = []  # Connect and connect-to-first-command times, see ble_controllers.py
+        self.startup = StartupTimer(startup_started)  # Phases from the fleet's start, see startup.py
+
+        self.lock = threading.Lock()  # The sensor callback runs on this robot's notify thread
+        self.sample_times = []
+        self._csv_file = open(os.path.join(run_dir, self.sensor_file), 'w', newline='')
+        self._csv_writer = csv.writer(self._csv_file)
+        self._csv_writer.writerow(SENSOR_COLUMNS)
+
+        self.connections = 0
+        self.reconnects = 0
+        self.commands_sent = 0
+
+    def sensor_callback(self, response):
+        """Write one sample (called on pysphero's notify thread)"""
+        monotonic_time = time.monotonic()
+        try:
+            row = [time.time() - self.run_started, monotonic_time] + parse_sensor_response(response)
+        except Exception as e:
+            print(f"[{self.name}] Error processing sensor data: {e}")
+            return
+
+        if self.gaps.is_open:
+            self.gaps.close(monotonic_time)  # First sample after a reconnect
+        self.startup.mark("first_sample", monotonic_time)
+        with self.lock:
+            self.sample_times.append(monotonic_time)
+            self._csv_writer.writerow(row)
+            if len(self.sample_times) % SENSOR_FLUSH_ROWS == 0:
+                self._csv_file.flush()
+
+    def _send(self, sphero, command):
+        direction = Direction.reverse if command['direction'] else Direction.forward
+        sphero.driving.drive_with_heading(int(command['speed']), int(command['heading']), direction)
+
+    async def move(self, runtime, sphero, connection=None):
+        """Play the robot's schedule until the run stops; raises ConnectionError when commands keep failing"""
+        errors = 0
+        command = self.player.next_command(self.scheduler.earliest_send())
+
+        while command is not None and await runtime.sleep(self.scheduler.delay()):
+            planned_time = self.scheduler.next_deadline
+            started = time.monotonic()
+            try:
+                await runtime.call(self.executor, self._send, sphero, command)
+            except Exception as e:
+                self.scheduler.failed(started)
+                errors += 1
+                print(f"[{self.name}] Command error ({errors}/{MAX_COMMAND_ERRORS}): {e}")
+                if errors >= MAX_COMMAND_ERRORS:
+                    raise ConnectionError(f"{errors} consecutive command errors")
+            else:
+                completed = time.monotonic()
+                self.scheduler.record(started, completed)
+                first_command(connection, completed)
+                self.startup.mark("first_command", completed)
+                self.actions.write(int(command['speed']), int(command['heading']), int(command['direction']),
+                                   float(command['duration']), started, planned_time, completed - started)
+                self.commands_sent += 1
+                errors = 0
+
+            command = self.player.next_command(self.scheduler.earliest_send())
+
+    def last_sample_time(self):
+        with self.lock:
+            return self.sample_times[-1] if self.sample_times else None
+
+    async def wait_for_advertisement(self, runtime, registry):
+        """The robot's registry entry once it advertises (connected robots do not), or None after a timeout"""
+        deadline = time.monotonic() + ADVERTISEMENT_TIMEOUT
+        while runtime.running and time.monotonic() < deadline:
+            toy = registry.get(self.target)
+            if toy is not None or not registry.available:
+                return toy
+            await runtime.sleep(0.1)
+        return None
+
+    async def run(self, runtime, allocator, registry):
+        """Connect, stream and move, reconnecting on failure until the run stops. A
+        lost connection is closed in the background and the robot reconnects after
+        a short backoff, continuing the same files; the hole goes to its gaps file."""
+        self.executor = runtime.robot_executor(self.name)
+        backoff = ReconnectBackoff()
+
+        while runtime.running and backoff.attempt < MAX_RECONNECTS:
+            toy = await self.wait_for_advertisement(runtime, registry) or registry.resolve(self.target)
+            if toy is None:
+                print(f"[{self.name}] {self.target} is not advertising, will look again")
+                await runtime.sleep(backoff.next_delay())
+                continue
+            self.mac_address = toy["mac_address"]
+            self.toy_type = toy["toy_type"]
+            if toy["rssi"] is not None and toy["rssi"] < WEAK_RSSI:
+                print(f"[{self.name}] Weak signal ({toy['rssi']} dBm), expect a lower sensor rate")
+
+            # Pick the controller per connection, so a reconnect moves to the least loaded one
+            self.controller = allocator.acquire(CONNECTION_LOAD)
+            self.controllers_used.append(self.controller)
+            sphero = None
+            lost = False
+            try:
+                print(f"[{self.name}] Connecting to {self.mac_address} via {self.controller}...")
+                sphero = Sphero(mac_address=self.mac_address, toy_type=self.toy_type,
+                                ble_adapter_cls=adapter_for(self.controller))
+                connect_started = time.monotonic()
+                with registry.paused():  # Scanning slows connects down
+                    await runtime.call(self.executor, sphero.__enter__)
+                connection = connect_entry(sphero, connect_started)
+                connection["rssi"] = toy["rssi"]
+                self.connect_log.append(connection)
+                self.connections += 1
+                self.startup.mark("connected")
+                await runtime.call(self.executor, sphero.power.wake)
+                if self.connections == 1:
+                    # Poll until the ball answers instead of sleeping (after a drop it is still awake)
+                    ready = await runtime.call(self.executor, wait_until_ready, sphero)
+                    connection["ready_ms"] = ready * 1000 if ready is not None else None
+                    if ready is None:
+                        print(f"[{self.name}] Did not answer after waking up, continuing anyway")
+                self.startup.mark("robot_ready")
+
+                await runtime.call(self.executor, sphero.sensor.set_notify, self.sensor_callback,
+                                   Accelerometer, Gyroscope, Locator, Velocity, interval=SENSOR_INTERVAL)
+                self.startup.mark("streaming")
+                print(f"[{self.name}] Streaming at {SENSOR_FREQUENCY}Hz, moving")
+                backoff.connected()
+                await runtime.first(self.move(runtime, sphero, connection),
+                                    watch_stream(runtime, self.last_sample_time))
+
+            except Exception as e:
+                print(f"[{self.name}] Connection error: {e}")
+                lost = True
+                self.reconnects += 1
+                last_sample = self.last_sample_time()
+                if last_sample is not None:
+                    self.gaps.open(str(e) or type(e).__name__, last_sample)
+            finally:
+                if sphero is not None and lost:
+                    # Don't wait out the dead connection's pending request timeouts
+                    close_in_background(sphero, self.name)
+                    self.executor.shutdown(wait=False)
+                    self.executor = runtime.robot_executor(self.name)
+                elif sphero is not None:
+                    try:
+                        await runtime.call(self.executor, sphero.__exit__, None, None, None)
+                    except Exception as e:
+                        print(f"[{self.name}] Error closing connection: {e}")
+                allocator.release(self.controller, CONNECTION_LOAD)
+
+            if runtime.running:
+                delay = backoff.next_delay()
+                print(f"[{self.name}] Will retry in {delay * 1000:.0f}ms... "
+                      f"(attempt {backoff.attempt}/{MAX_RECONNECTS})")
+                await runtime.sleep(delay)
+
+        if backoff.attempt >= MAX_RECONNECTS:
+            print(f"[{self.name}] Maximum reconnect attempts ({MAX_RECONNECTS}) reached, robot stopped.")
+
+    def close(self):
+        self.gaps.finish()
+        with self.lock:
+            self._csv_file.flush()
+            self._csv_file.close()
+        self.actions.close()
+
+    def stats(self, duration):
+        with self.lock:
+            times = list(self.sample_times)
+        return {
+            "mac_address": self.mac_address,
+            "toy_type": self.toy_type.value,
+            "sensor_file": self.sensor_file,
+            "actions_file": self.actions_file,
+            "gaps_file": self.gaps_file,
+            "sensor_samples": len(times),
+            "sensor_rate": sample_rate_stats(times, SENSOR_FREQUENCY),
+            "commands_sent": self.commands_sent,
+            "command_rate_hz": self.commands_sent / duration if duration else None,
+            "command_timing": self.scheduler.stats(),
+            "movement_schedule": self.player.stats(),
+            "connections": self.connections,
+            "reconnects": self.reconnects,
+            "gaps": self.gaps.stats(),
+            "controllers": self.controllers_used,
+            "connect_timing": connect_stats(self.connect_log),
+            "startup": self.startup.stats(),
+        }
+
+
+class Fleet:
+    """A fleet run: robots, the shared camera and the run directory"""
+
+    def __init__(self, robots_config, policy="random_walk", seed=None, record_video=True, controllers=None,
+                 registry=None):
+        self.startup = StartupTimer()
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.run_dir = os.path.join(DATA_DIR, f"fleet_run_{timestamp}")
+        os.makedirs(self.run_dir, exist_ok=True)
+        print(f"Data will be saved to {self.run_dir}")
+
+        self.run_started = time.time()
+        self.record_video = record_video
+        self.camera_process = None
+        self.camera_stats = []
+        self.runtime = CollectorRuntime()
+        self.allocator = ControllerAllocator(controllers)
+        print(f"Bluetooth controllers: {', '.join(self.allocator.controllers)}")
+        self.registry = registry or ToyRegistry(self.allocator.controllers[0])
+
+        # One schedule per robot; robot i uses seed + i so the whole fleet run can be regenerated
+        self.robots = []
+        for position, (name, target) in enumerate(robots_config):
+            robot_seed = None if seed is None else seed + position
+            commands, info = generate_schedule(policy, robot_seed, period=MOVEMENT_INTERVAL)
+            save_schedule(os.path.join(self.run_dir, f"movement_schedule_{name}.npz"), commands, info)
+            print(f"[{name}] Movement schedule: {info['policy']}, seed {info['seed']}")
+            self.robots.append(FleetRobot(name, target, self.run_dir, self.run_started, commands, info,
+                                          self.startup.started))
+
+    async def camera_task(self):
+        """Record the shared camera until the run stops"""
+        runtime = self.runtime
+        cameras = [(index, os.path.join(self.run_dir, "video" if position == 0 else f"video_cam{index}"))
+                   for position, index in enumerate(CAMERA_INDICES)]
+        self.camera_process = CameraProcess(cameras, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS,
+                                            recording_mode=RECORDING_MODE)
+        if not await runtime.io(self.camera_process.start):
+            print("Error: Could not open any camera, recording without video.")
+            return
+        self.startup.mark("camera_ready")
+        self.camera_process.set_run_start(self.run_started)
+
+        while runtime.running and self.camera_process.is_running():
+            await runtime.sleep(1.0)
+        self.camera_stats = await runtime.io(self.camera_process.stop)
+
+    def print_status(self):
+        elapsed = time.time() - self.run_started
+        minutes, seconds = divmod(int(elapsed), 60)
+        parts = [f"{robot.name}: {len(robot.sample_times) / elapsed:.1f}Hz, {robot.commands_sent} cmds"
+                 for robot in self.robots]
+        print(f"Running for {minutes}m {seconds}s - " + " | ".join(parts))
+
+    async def collect(self):
+        runtime = self.runtime
+        tasks = [asyncio.ensure_future(runtime.every("status", STATUS_INTERVAL, self.print_status))]
+        if self.record_video:
+            tasks.append(asyncio.ensure_future(self.camera_task()))
+
+        try:
+            # Robots connect and run concurrently
+            await asyncio.gather(*(robot.run(runtime, self.allocator, self.registry) for robot in self.robots))
+        finally:
+            runtime.stop()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def startup_stats(self):
+        """Camera start and the time until every robot streamed, from the fleet's start"""
+        first_samples = [robot.startup.elapsed_ms("first_sample") for robot in self.robots]
+        return {
+            "camera_ready_ms": self.startup.elapsed_ms("camera_ready"),
+            "all_first_sample_ms": max(first_samples) if first_samples and None not in first_samples else None,
+        }
+
+    def write_metadata(self):
+        duration = time.time() - self.run_started
+        robots = {robot.name: robot.stats(duration) for robot in self.robots}
+        metadata = {
+            "start_time": datetime.datetime.fromtimestamp(self.run_started).isoformat(),
+            "end_time": datetime.datetime.now().isoformat(),
+            "duration_seconds": duration,
+            "robots": robots,
+            "fleet": {
+                "robots": len(self.robots),
+                "sensor_samples": sum(stats["sensor_samples"] for stats in robots.values()),
+                "commands_sent": sum(stats["commands_sent"] for stats in robots.values()),
+                "controllers": self.allocator.stats(),
+                "toys_seen": self.registry.stats(),
+                "startup": self.startup_stats(),
+            },
+            "camera": {
+                "indices": CAMERA_INDICES,
+                "width": CAMERA_WIDTH,
+                "height": CAMERA_HEIGHT,
+                "fps": CAMERA_FPS
+            } if self.record_video else None,
+            "cameras": self.camera_stats,
+            "task_timing": self.runtime.timing_stats(),
+        }
+        path = os.path.join(self.run_dir, METADATA_FILENAME)
+        with open(path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        print(f"Metadata written to {path}")
+
+    def run(self):
+        self.registry.start()
+        try:
+            self.runtime.run(self.collect())
+        finally:
+            self.registry.stop()
+            for robot in self.robots:
+                robot.close()
+            self.write_metadata()
+
+
+def main():
+    """Collect from several robots at once"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Drive and record several Spheros in one run.')
+    parser.add_argument('robots', nargs='*', help='MAC addresses or toy names (e.g. SB-8C49) of the robots')
+    parser.add_argument('--discover', type=int, default=None, metavar='N',
+                        help='Use the N toys in range with the strongest signal')
+    parser.add_argument('--names', nargs='+', default=None,
+                        help='Robot names used in file names (default: robot0, robot1, ...)')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random_walk',
+                        help='Movement policy for every robot (default: random_walk)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Base seed; robot i uses seed + i (default: drawn per robot)')
+    parser.add_argument('--no-video', action='store_true', help='Do not record the camera')
+    parser.add_argument('--controllers', nargs='+', default=None,
+                        help=f'Bluetooth controllers to use (default: all, found {" ".join(list_controllers())})')
+    args = parser.parse_args()
+
+    if bool(args.robots) == bool(args.discover):
+        parser.error("give either the robots or --discover N")
+
+    controllers = args.controllers or list_controllers()
+    registry = ToyRegistry(controllers[0])
+    registry.start()
+    robots = args.robots
+    if args.discover:
+        print(f"Scanning for {DISCOVERY_TIME:.0f} seconds...")
+        time.sleep(DISCOVERY_TIME)
+        toys = registry.toys()
+        for toy in toys:
+            print(f"  {toy['name']} {toy['mac_address']} {toy['rssi']} dBm")
+        if len(toys) < args.discover:
+            registry.stop()
+            parser.error(f"only {len(toys)} toys in range, {args.discover} requested")
+        robots = [toy["mac_address"] for toy in toys[:args.discover]]
+        default_names = [toy["name"] for toy in toys[:args.discover]]
+    else:
+        default_names = [f"robot{i}" for i in range(len(robots))]
+
+    names = args.names or default_names
+    if len(names) != len(robots) or len(set(names)) != len(names):
+        registry.stop()
+        parser.error("--names needs one unique name per robot")
+
+    fleet = Fleet(list(zip(names, robots)), args.policy, args.seed, record_video=not args.no_video,
+                  controllers=controllers, registry=registry)
+    fleet.run()
+    print("Fleet data collection complete!")
+
+
+if __name__ == "__main__":
+    main()
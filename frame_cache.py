@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Decoded Frame Cache
+
+Decodes a run's video once into an uncompressed uint8 array on disk
+(video.mp4 -> video_frames.npy, shape (N, H, W, C)), optionally downscaled
+and/or converted to grayscale, plus a timestamp index (video_frames_index.npz).
+Training loaders can then fetch any frame by index or timestamp through
+np.memmap with no decode cost, and worker processes reading the same file
+share its pages through the OS page cache.
+
+The cache is built in parallel with video_runner; each worker writes its chunk
+of frames straight into the memory-mapped file.
+
+Index contents:
+
+    capture_time  float64 (N,), time.monotonic() at capture, from the frame
+                  timestamp sidecar (frame index / fps if the run has none)
+    wall_time     float64 (N,), the same times as time.time() (NaN without sidecar)
+    valid         bool (N,), False for frames the decoder could not read
+
+Usage:
+    python frame_cache.py collected_data/run_YYYYMMDD_HHMMSS [--downscale 2] [--grayscale]
+
+    cache = FrameCache("collected_data/run_.../video_frames.npy")
+    frame = cache[100]
+    frames = cache.frames_at(sensor_times)   # nearest frame for each time
+"""
+
+import functools
+import os
+import time
+
+import cv2
+import numpy as np
+
+from frame_timestamps import read_frame_timestamps, sidecar_path
+from video_reader import VideoFrameReader, find_run_video
+from video_runner import build_seek_index, process_video
+
+
+def cache_path(video_path, downscale=1, grayscale=False):
+    """Return the frame cache path for a video and cache settings"""
+    suffix = "_frames"
+    if downscale > 1:
+        suffix += f"_d{downscale}"
+    if grayscale:
+        suffix += "_gray"
+    return os.path.splitext(video_path)[0] + suffix + ".npy"
+
+
+def index_path(frames_path):
+    """Return the timestamp index path for a frame cache"""
+    return os.path.splitext(frames_path)[0] + "_index.npz"
+
+
+def transform_frames(frames, downscale=1, grayscale=False):
+    """Downscale and/or grayscale a (n, H, W, 3) uint8 batch, returning (n, h, w, C)"""
+    n, height, width, _ = frames.shape
+    h, w = height // downscale, width // downscale
+
+    # Process the whole batch as one tall image; with an integer factor no
+    # output pixel mixes two frames
+    stacked = np.ascontiguousarray(frames[:, :h * downscale, :w * downscale]).reshape(
+        n * h * downscale, w * downscale, 3)
+    if downscale > 1:
+        stacked = cv2.resize(stacked, (w, n * h), interpolation=cv2.INTER_AREA)
+    if grayscale:
+        stacked = cv2.cvtColor(stacked, cv2.COLOR_BGR2GRAY)
+
+    return stacked.reshape(n, h, w, -1)
+
+
+def _write_batch(path, downscale, grayscale, first_index, frames):
+    """video_runner batch function: write transformed frames into the cache file"""
+    cache = np.load(path, mmap_mode='r+')
+    cache[first_index:first_index + len(frames)] = transform_frames(frames, downscale, grayscale)
+    cache.flush()
+    return first_index, len(frames)
+
+
+def _frame_times(video_path, frame_count):
+    """Return (capture_time, wall_time) arrays for the frames of a video"""
+    timestamps_file = sidecar_path(video_path)
+    capture_time = np.full(frame_count, np.nan)
+    wall_time = np.full(frame_count, np.nan)
+
+    if os.path.exists(timestamps_file):
+        header, records = read_frame_timestamps(timestamps_file)
+        count = min(len(records), frame_count)
+        capture_time[:count] = records['capture_time'][:count]
+        wall_time[:count] = capture_time[:count] - header["monotonic_origin"] + header["wall_origin"]
+    else:
+        reader = VideoFrameReader(video_path)
+        fps = reader.fps
+        reader.close()
+        if fps:
+            capture_time[:] = np.arange(frame_count) / fps
+
+    return capture_time, wall_time
+
+
+def build_frame_cache(video_path, downscale=1, grayscale=False, workers=None):
+    """Decode a video into a memory-mapped frame cache and return its path"""
+    path = cache_path(video_path, downscale, grayscale)
+    _, frame_count = build_seek_index(video_path)
+
+    # Output frame shape from the first frame
+    reader = VideoFrameReader(video_path)
+    try:
+        first = next(reader.read_range(0, 1), None)
+    finally:
+        reader.close()
+    if first is None:
+        raise IOError(f"Could not decode any frames from {video_path}")
+    frame_shape = transform_frames(first[1][None], downscale, grayscale).shape[1:]
+
+    # Build under a temporary name so a crash never leaves a half-written cache
+    temp_path = path + ".partial.npy"
+    np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.uint8,
+                              shape=(frame_count,) + frame_shape).flush()
+
+    try:
+        written = process_video(video_path, functools.partial(_write_batch, temp_path, downscale, grayscale),
+                                workers=workers)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    valid = np.zeros(frame_count, dtype=bool)
+    for first_index, count in written:
+        valid[first_index:first_index + count] = True
+
+    capture_time, wall_time = _frame_times(video_path, frame_count)
+    np.savez(index_path(path), capture_time=capture_time, wall_time=wall_time, valid=valid,
+             downscale=downscale, grayscale=grayscale, source=os.path.basename(video_path))
+    os.replace(temp_path, path)
+    return path
+
+
+class FrameCache:
+    """Read-only, random access view of a frame cache.
+
+    Frames are memory mapped, so indexing only touches the pages it needs.
+    Pickling sends the path rather than the frames, so a FrameCache can be
+    handed to loader worker processes cheaply.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = np.load(path, mmap_mode='r')
+
+        with np.load(index_path(path)) as index:
+            self.capture_time = index['capture_time']
+            self.wall_time = index['wall_time']
+            self.valid = index['valid']
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, key):
+        return self.frames[key]
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def index_at(self, times):
+        """Return the index of the frame captured nearest to each time (capture_time clock)"""
+        times = np.asarray(times, dtype=np.float64)
+        if len(self.capture_time) < 2:
+            return np.zeros(times.shape, dtype=np.int64)
+        right = np.clip(np.searchsorted(self.capture_time, times), 1, len(self.capture_time) - 1)
+        left = right - 1
+        nearer_left = np.abs(times - self.capture_time[left]) <= np.abs(self.capture_time[right] - times)
+        return np.where(nearer_left, left, right)
+
+    def frames_at(self, times):
+        """Return the nearest frame for each time as a (len(times), h, w, C) array"""
+        return self.frames[self.index_at(times)]
+
+
+def main():
+    """Build the frame cache for a recorded run"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Decode a run video into a memory-mapped frame cache.')
+    parser.add_argument('run_dir', help='Run directory, e.g. collected_data/run_YYYYMMDD_HHMMSS')
+    parser.add_argument('--camera', type=int, default=0,
+                        help='Camera position in CAMERA_INDICES (default: 0)')
+    parser.add_argument('--downscale', type=int, default=1,
+                        help='Integer downscale factor (default: 1, full resolution)')
+    parser.add_argument('--grayscale', action='store_true',
+                        help='Store single-channel grayscale frames')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for decoding (default: all cores)')
+    args = parser.parse_args()
+
+    video_path = find_run_video(args.run_dir, args.camera)
+    print(f"Building frame cache for {video_path}...")
+
+    start_time = time.time()
+    path = build_frame_cache(video_path, args.downscale, args.grayscale, args.workers)
+    elapsed = time.time() - start_time
+
+    cache = FrameCache(path)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    print(f"Cached {int(cache.valid.sum())}/{len(cache)} frames of shape {cache.frames.shape[1:]} "
+          f"in {elapsed:.1f}s ({size_mb:.0f} MB)")
+    print(f"Frame cache saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
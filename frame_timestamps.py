@@ -0,0 +1,98 @@
+"""
+Per-Frame Timestamp Sidecar
+
+Stores the timing of every frame written to a video file in a compact binary
+file next to it (video.mp4 -> video_timestamps.bin), so sensor/frame alignment
+can be done exactly instead of reading burned-in overlay text.
+
+File layout (little endian):
+
+    header  magic "FTS1", version (uint16), record size (uint16),
+            wall clock origin (float64, time.time()),
+            monotonic origin (float64, time.monotonic())
+    records one per frame in the order they were written to the video:
+            capture index (uint32), capture time (float64, time.monotonic()),
+            grab-to-write latency in seconds (float32)
+
+Gaps in the capture index mean frames that were captured but dropped before
+encoding. The two origins let a reader convert monotonic times to wall clock.
+"""
+
+import os
+import struct
+import time
+
+MAGIC = b"FTS1"
+VERSION = 1
+HEADER_STRUCT = struct.Struct("<4sHHdd")
+RECORD_STRUCT = struct.Struct("<Idf")
+FLUSH_INTERVAL_FRAMES = 30  # Flush to disk about once a second at 30fps
+
+
+def sidecar_path(video_path):
+    """Return the timestamp sidecar path for a video file"""
+    return os.path.splitext(video_path)[0] + "_timestamps.bin"
+
+
+class FrameTimestampWriter:
+    """Append-only writer for a frame timestamp sidecar"""
+
+    def __init__(self, path):
+        self.path = path
+        self.wall_origin = time.time()
+        self.monotonic_origin = time.monotonic()
+        self.count = 0
+
+        self._file = open(path, 'wb')
+        self._file.write(HEADER_STRUCT.pack(MAGIC, VERSION, RECORD_STRUCT.size,
+                                            self.wall_origin, self.monotonic_origin))
+
+    def write(self, capture_index, capture_time, latency):
+        """Record one written frame"""
+        self._file.write(RECORD_STRUCT.pack(capture_index, capture_time, latency))
+        self.count += 1
+
+        if self.count % FLUSH_INTERVAL_FRAMES == 0:
+            self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            self._file.close()
+
+
+def read_frame_timestamps(path):
+    """Read a timestamp sidecar.
+
+    Returns (header, records) where header is a dict with the clock origins and
+    records is a NumPy structured array with fields
+    'capture_index', 'capture_time' and 'latency'.
+    """
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        magic, version, record_size, wall_origin, monotonic_origin = HEADER_STRUCT.unpack(
+            f.read(HEADER_STRUCT.size))
+
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a frame timestamp file")
+    if record_size != RECORD_STRUCT.size:
+        raise ValueError(f"{path} has unsupported record size {record_size} (version {version})")
+
+    dtype = np.dtype([
+        ('capture_index', '<u4'),
+        ('capture_time', '<f8'),
+        ('latency', '<f4'),
+    ])
+
+    # A crash can leave a partial record at the end, ignore it
+    data_size = os.path.getsize(path) - HEADER_STRUCT.size
+    count = data_size // dtype.itemsize
+    records = np.fromfile(path, dtype=dtype, count=count, offset=HEADER_STRUCT.size)
+
+    header = {
+        "version": version,
+        "wall_origin": wall_origin,
+        "monotonic_origin": monotonic_origin,
+    }
+    return header, records
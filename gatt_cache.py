@@ -0,0 +1,113 @@
+"""
+Persistent GATT Handle Cache
+
+pysphero's BluepyAdapter discovers the api_v2 characteristic and its
+notification descriptor on every connect (a characteristic search over the
+whole handle range plus a descriptor search), and the reconnect loops pay that
+again on every drop. The handles of a robot only change with its firmware, so
+they are stored on disk per MAC address, together with the firmware version
+they were discovered under.
+
+On connect a cached entry is validated with one read of the characteristic
+declaration, which holds the characteristic's properties, value handle and
+UUID. If that read fails or does not match (e.g. after a firmware update), the
+handles are discovered as before and the entry is replaced.
+
+Usage:
+
+    cache = GattHandleCache()
+    characteristic, cccd_handle, source = cache.api_characteristic(peripheral, mac_address)
+"""
+
+import datetime
+import json
+import os
+import struct
+import threading
+
+from bluepy.btle import UUID, BTLEException, Characteristic
+
+from pysphero.constants import GenericCharacteristic, SpheroCharacteristic
+
+GATT_CACHE_PATH = os.path.expanduser("~/.cache/sphero/gatt_handles.json")
+CACHE_VERSION = 1
+
+
+def declaration_matches(data, properties, value_handle, uuid):
+    """True if a characteristic declaration (properties, value handle, UUID little-endian) matches"""
+    if len(data) not in (5, 19):
+        return False
+    declared_properties, declared_handle = struct.unpack_from("<BH", data)
+    declared_uuid = UUID("%04X" % struct.unpack_from("<H", data, 3)[0]) if len(data) == 5 else UUID(data[3:][::-1].hex())
+    return declared_properties == properties and declared_handle == value_handle and declared_uuid == UUID(uuid)
+
+
+class GattHandleCache:
+    """Discovered api_v2 handles per MAC address, persisted as JSON"""
+
+    def __init__(self, path=GATT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data.get("devices", {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, mac_address):
+        with self._lock:
+            return self.entries.get(mac_address.upper())
+
+    def put(self, mac_address, handles, firmware=None):
+        with self._lock:
+            self.entries[mac_address.upper()] = dict(
+                handles, firmware=firmware, updated=datetime.datetime.now().isoformat())
+            self._save()
+
+    def set_firmware(self, mac_address, firmware):
+        with self._lock:
+            entry = self.entries.get(mac_address.upper())
+            if entry is not None and entry.get("firmware") != firmware:
+                entry["firmware"] = firmware
+                self._save()
+
+    def forget(self, mac_address):
+        with self._lock:
+            if self.entries.pop(mac_address.upper(), None) is not None:
+                self._save()
+
+    def _save(self):
+        # Write and rename, so robots connecting in parallel never see a partial file
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": CACHE_VERSION, "devices": self.entries}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def api_characteristic(self, peripheral, mac_address):
+        """Return (api_v2 characteristic, CCCD handle, "cache" or "discovery") for a connected peripheral"""
+        uuid = SpheroCharacteristic.api_v2.value
+        entry = self.get(mac_address)
+        if entry is not None:
+            try:
+                declaration = peripheral.readCharacteristic(entry["handle"])
+                if declaration_matches(declaration, entry["properties"], entry["value_handle"], uuid):
+                    characteristic = Characteristic(peripheral, uuid, entry["handle"], entry["properties"],
+                                                    entry["value_handle"])
+                    return characteristic, entry["cccd_handle"], "cache"
+            except (BTLEException, KeyError):
+                pass  # Stale entry: fall back to discovery
+
+        characteristic = peripheral.getCharacteristics(uuid=uuid)[0]
+        descriptor = characteristic.getDescriptors(
+            forUUID=GenericCharacteristic.client_characteristic_configuration.value)[0]
+        self.put(mac_address, {
+            "handle": characteristic.handle,
+            "properties": characteristic.properties,
+            "value_handle": characteristic.valHandle,
+            "cccd_handle": descriptor.handle,
+        })
+        return characteristic, descriptor.handle, "discovery"
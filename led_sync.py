@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+LED-Flash Camera Sync Calibration
+
+The sidecar frame times and the sensor sample times share the host's
+time.monotonic() clock, but a frame is timestamped some time after the scene
+it shows: camera exposure, USB transfer and driver buffering all add latency,
+and that latency can drift over a long run. This module measures it.
+
+At the start and end of a run the collector flashes a coded on/off sequence on
+the Sphero's LEDs (flash_sync_code) and records the host time of every
+command. Offline, calibrate_run() detects the flashes in the video with a
+vectorized per-frame brightness signal, finds the delay that best matches the
+observed on/off pattern to the commanded one, and solves for
+
+    latency(t) = camera_latency + drift * (t - reference_time)
+
+Each LED change is placed midway between sending its command and the ack,
+as command_scheduler estimates command arrival, so the measured latency runs
+from the LED changing to timestamping the frame that shows it, without the
+BLE command latency.
+The result is stored under "sync_calibration" in metadata.json, and
+sensor_alignment uses it as the frame lag.
+
+Usage:
+    python led_sync.py collected_data/run_YYYYMMDD_HHMMSS [--camera 0]
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+from ball_tracker import preprocess
+from frame_timestamps import read_frame_timestamps, sidecar_path
+from video_reader import METADATA_FILENAME, VideoFrameReader, find_run_video
+
+# Flash settings
+SYNC_CODE = (1, 0, 1, 1, 0, 1, 0, 0, 1, 1, 1, 0, 1)  # Aperiodic, so only one delay matches
+SYNC_SLOT = 0.2  # Seconds per code bit (6 frames at 30fps)
+SYNC_BRIGHTNESS = 255
+
+# Detection settings
+SEARCH_MARGIN = 1.0  # Seconds of video searched before the first and after the last flash
+MAX_LATENCY = 1.0  # Largest latency considered
+LATENCY_STEP = 0.001  # Resolution of the latency search
+BRIGHT_PIXELS = 20  # Pixels averaged for the per-frame brightness signal (downscaled frame)
+MIN_CONTRAST = 30  # Minimum on/off brightness difference (0-255) for a usable detection
+MIN_AGREEMENT = 0.9  # Fraction of frames that must match the code at the best latency
+
+
+def _set_sync_leds(sphero, on, method):
+    from pysphero.device_api.user_io import Color
+
+    color = Color(SYNC_BRIGHTNESS, SYNC_BRIGHTNESS, SYNC_BRIGHTNESS) if on else Color()
+    if method == "matrix":
+        sphero.user_io.set_led_matrix_one_color(color)  # Sphero BOLT
+    else:
+        sphero.user_io.set_all_leds_8_bit_mask(color, color)
+
+
+def flash_sync_code(sphero, code=SYNC_CODE, slot=SYNC_SLOT, method="matrix"):
+    """Flash a code on the Sphero's LEDs.
+
+    Starts and ends dark. Returns a list of [sent_time, acked_time, state] per
+    LED change, with times from time.monotonic(). method is "matrix" for the
+    BOLT's LED matrix or "leds" for the front/back LEDs.
+    """
+    events = []
+    state = None
+    start = time.monotonic()
+
+    for i, bit in enumerate((0,) + tuple(code) + (0,)):
+        # Slot starts are fixed ahead of time, so command latency does not accumulate
+        delay = start + i * slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if bit == state:
+            continue
+
+        sent_time = time.monotonic()
+        _set_sync_leds(sphero, bit, method)
+        events.append([sent_time, time.monotonic(), bit])
+        state = bit
+
+    return events
+
+
+def brightness_signal(frames):
+    """Return the mean of the brightest pixels of each frame in a (n, H, W, 3) batch"""
+    value = preprocess(frames).reshape(len(frames), -1)
+    k = min(BRIGHT_PIXELS, value.shape[1])
+    return np.partition(value, -k, axis=1)[:, -k:].mean(axis=1)
+
+
+def solve_latency(events, frame_times, brightness):
+    """Find the delay between LED commands and the frames showing them.
+
+    Returns a dict with 'latency', 'agreement' (fraction of frames matching
+    the code at that latency) and 'time' (mid time of the flashes), or None if
+    the flashes could not be seen.
+    """
+    events = np.asarray(events, dtype=np.float64)
+    changes = (events[:, 0] + events[:, 1]) / 2  # Estimated LED change: half the round trip after sending
+    low, high = np.percentile(brightness, [10, 90])
+    if high - low < MIN_CONTRAST:
+        return None
+    observed = brightness > (low + high) / 2
+
+    # Commanded LED state at each frame time for every candidate latency at once
+    latencies = np.arange(-0.1, MAX_LATENCY, LATENCY_STEP)
+    shifted = frame_times[None, :] - latencies[:, None]
+    change = np.searchsorted(changes, shifted, side='right') - 1
+    states = np.concatenate([[0], events[:, 2]]).astype(bool)
+    expected = states[change + 1]
+    agreement = (expected == observed[None, :]).mean(axis=1)
+
+    # The best latencies form a plateau one frame interval wide; take its middle
+    best = int(np.argmax(agreement))
+    plateau = agreement >= agreement[best] - 1e-9
+    left = best
+    while left > 0 and plateau[left - 1]:
+        left -= 1
+    right = best
+    while right < len(latencies) - 1 and plateau[right + 1]:
+        right += 1
+
+    return {
+        "latency": float((latencies[left] + latencies[right]) / 2),
+        "agreement": float(agreement[best]),
+        "time": float((changes[0] + changes[-1]) / 2),
+    }
+
+
+def _detect_flashes(video_path, frame_times, events):
+    """Solve the latency for one flash sequence using the frames around it"""
+    events = np.asarray(events, dtype=np.float64)
+    window = np.flatnonzero((frame_times >= events[0, 0] - SEARCH_MARGIN)
+                            & (frame_times <= events[-1, 0] + MAX_LATENCY + SEARCH_MARGIN))
+    if len(window) == 0:
+        return None
+
+    reader = VideoFrameReader(video_path)
+    try:
+        signal = np.concatenate([brightness_signal(frames) for _, frames
+                                 in reader.batches(64, int(window[0]), len(window))])
+    finally:
+        reader.close()
+
+    count = min(len(signal), len(window))
+    return solve_latency(events, frame_times[window[:count]], signal[:count])
+
+
+def calibrate_run(run_dir, camera=0):
+    """Solve a run's camera latency and drift from its LED sync flashes and store the result"""
+    metadata_path = os.path.join(run_dir, METADATA_FILENAME)
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+
+    led_sync = metadata.get("led_sync") or {}
+    if not led_sync.get("start"):
+        raise ValueError(f"{run_dir} has no LED sync flashes (record with LED_SYNC = True)")
+
+    video_path = find_run_video(run_dir, camera)
+    _, frames = read_frame_timestamps(sidecar_path(video_path))
+    frame_times = frames['capture_time']
+
+    solved = {}
+    for phase in ("start", "end"):
+        if led_sync.get(phase):
+            result = _detect_flashes(video_path, frame_times, led_sync[phase])
+            if result is not None and result["agreement"] >= MIN_AGREEMENT:
+                solved[phase] = result
+
+    if not solved:
+        raise ValueError(f"Could not detect the LED sync flashes in {video_path}")
+
+    reference = solved.get("start") or solved["end"]
+    drift = 0.0
+    if "start" in solved and "end" in solved and solved["end"]["time"] > solved["start"]["time"]:
+        drift = (solved["end"]["latency"] - solved["start"]["latency"]) / (solved["end"]["time"] - solved["start"]["time"])
+
+    calibration = {
+        "camera_latency": reference["latency"],
+        "drift": drift,
+        "reference_time": reference["time"],
+        "start": solved.get("start"),
+        "end": solved.get("end"),
+    }
+
+    metadata.setdefault("sync_calibration", {})[str(camera)] = calibration
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    return calibration
+
+
+def load_sync_calibration(run_dir, camera=0):
+    """Return the stored sync calibration for a camera, or None"""
+    metadata_path = os.path.join(run_dir, METADATA_FILENAME)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+    return (metadata.get("sync_calibration") or {}).get(str(camera))
+
+
+def calibrated_frame_lag(calibration, frame_times):
+    """Return the per-frame lag (seconds) from a sync calibration"""
+    frame_times = np.asarray(frame_times, dtype=np.float64)
+    return calibration["camera_latency"] + calibration["drift"] * (frame_times - calibration["reference_time"])
+
+
+def main():
+    """Calibrate camera latency for a recorded run"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Solve camera latency and drift from LED sync flashes.')
+    parser.add_argument('run_dir', help='Run directory, e.g. collected_data/run_YYYYMMDD_HHMMSS')
+    parser.add_argument('--camera', type=int, default=0,
+                        help='Camera position in CAMERA_INDICES (default: 0)')
+    args = parser.parse_args()
+
+    calibration = calibrate_run(args.run_dir, args.camera)
+    print(f"Camera latency: {calibration['camera_latency'] * 1000:.1f}ms, "
+          f"drift: {calibration['drift'] * 1e6:.0f}us/s")
+    for phase in ("start", "end"):
+        if calibration[phase]:
+            print(f"  {phase}: {calibration[phase]['latency'] * 1000:.1f}ms "
+                  f"({calibration[phase]['agreement'] * 100:.0f}% of frames match)")
+    print(f"Calibration saved to {os.path.join(args.run_dir, METADATA_FILENAME)}")
+
+
+if __name__ == "__main__":
+    main()
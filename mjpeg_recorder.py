@@ -0,0 +1,135 @@
+"""
+MJPEG Passthrough Recording
+
+USB (V4L2) cameras can deliver frames already compressed as MJPEG. Instead of
+letting OpenCV decode every frame to BGR and re-encoding it with mp4v, this
+module keeps the compressed bytes and writes them unchanged into an MJPEG
+stream (video.mjpeg) with a binary frame index next to it (video.mjpeg.idx).
+
+The .mjpeg file is a plain concatenation of JPEG images, so tools like ffmpeg
+can play it directly (`ffplay -f mjpeg video.mjpeg`). The index stores the byte
+offset and size of every frame for O(1) random access.
+
+Index layout (little endian):
+
+    header  magic "MJI1"
+    records one per frame: byte offset (uint64), size in bytes (uint32)
+"""
+
+import os
+import struct
+
+import cv2
+import numpy as np
+
+INDEX_MAGIC = b"MJI1"
+INDEX_RECORD_STRUCT = struct.Struct("<QI")
+FLUSH_INTERVAL_FRAMES = 30
+
+JPEG_SOI = b"\xff\xd8"  # JPEG start-of-image marker
+
+
+def index_path(video_path):
+    """Return the frame index path for an MJPEG stream"""
+    return video_path + ".idx"
+
+
+def is_jpeg(frame):
+    """Check whether a captured buffer holds a compressed JPEG image"""
+    if frame is None or frame.size < 2:
+        return False
+    return bytes(frame.reshape(-1)[:2]) == JPEG_SOI
+
+
+def decode_jpeg(buffer):
+    """Decode a JPEG buffer to a BGR frame"""
+    return cv2.imdecode(np.asarray(buffer).reshape(-1), cv2.IMREAD_COLOR)
+
+
+def enable_mjpeg_passthrough(cap):
+    """Ask the camera for MJPEG and turn off OpenCV's conversion to BGR.
+
+    Returns True if the capture now yields compressed JPEG bytes. Otherwise
+    the normal BGR conversion is restored and False is returned.
+    """
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
+    # Check a real frame, not every backend honours CONVERT_RGB
+    ret, frame = cap.read()
+    if ret and is_jpeg(frame):
+        return True
+
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+    return False
+
+
+class MjpegStreamWriter:
+    """Writes compressed JPEG frames to an MJPEG stream with a frame index.
+
+    Has the same write()/release()/isOpened() interface as cv2.VideoWriter so
+    it can be used by camera_pipeline.CameraPipeline directly.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._offset = 0
+        self._file = open(path, 'wb')
+        self._index = open(index_path(path), 'wb')
+        self._index.write(INDEX_MAGIC)
+
+    def isOpened(self):
+        return not self._file.closed
+
+    def write(self, frame):
+        """Append one compressed frame (bytes or a uint8 array from cap.retrieve())"""
+        data = memoryview(frame).cast('B')
+        self._file.write(data)
+        self._index.write(INDEX_RECORD_STRUCT.pack(self._offset, len(data)))
+        self._offset += len(data)
+        self.count += 1
+
+        if self.count % FLUSH_INTERVAL_FRAMES == 0:
+            self._file.flush()
+            self._index.flush()
+
+    def release(self):
+        for f in (self._file, self._index):
+            if not f.closed:
+                f.flush()
+                f.close()
+
+
+class MjpegReader:
+    """Random access reader for an MJPEG stream written by MjpegStreamWriter"""
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(index_path(path), 'rb') as f:
+            if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"{index_path(path)} is not an MJPEG frame index")
+
+        dtype = np.dtype([('offset', '<u8'), ('size', '<u4')])
+        count = (os.path.getsize(index_path(path)) - len(INDEX_MAGIC)) // dtype.itemsize
+        self.index = np.fromfile(index_path(path), dtype=dtype, count=count, offset=len(INDEX_MAGIC))
+
+        # Drop index entries whose data never made it to disk (e.g. after a crash)
+        data_size = os.path.getsize(path)
+        complete = self.index['offset'] + self.index['size'] <= data_size
+        self.index = self.index[complete]
+
+        self._data = np.memmap(path, dtype=np.uint8, mode='r') if data_size else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.index)
+
+    def read_bytes(self, i):
+        """Return the compressed bytes of frame i without decoding"""
+        offset, size = int(self.index[i]['offset']), int(self.index[i]['size'])
+        return self._data[offset:offset + size]
+
+    def read(self, i):
+        """Return frame i decoded to BGR"""
+        return decode_jpeg(self.read_bytes(i))
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Precomputed Movement Schedules
+
+Generates a whole run's movement commands up front from a policy and a seed,
+so a run's motion can be regenerated exactly and compared across firmware,
+sensor rate or pipeline changes. A schedule is a list of segments (hold a
+speed and heading for some time), expanded into one command per send: the
+Sphero is sent its current command again every period while a segment lasts,
+as unlimited_move.py always did.
+
+Policies:
+
+    random_walk     random speed and heading held for a random time
+                    (unlimited_move.py's original behaviour)
+    spiral          heading turns at a constant rate while speed ramps up, so
+                    the robot spirals outwards; restarts every growth_time
+    coverage_sweep  back-and-forth legs with a sideways step between them,
+                    sweeping across the arena and back
+
+Schedules are saved as .npz: a structured 'commands' array (fields below, 21
+bytes per command, about 380 KB per hour at 0.2 s) and the generation
+parameters as JSON in 'info'.
+
+    time      float64, seconds from the start of the schedule
+    duration  float32, length of the segment this command belongs to
+    speed     uint16
+    heading   uint16, degrees
+    direction uint8, 0 forward / 1 reverse
+    segment   uint32, segment index
+
+SchedulePlayer turns schedule times into CommandScheduler deadlines anchored
+at the start of playback. Commands whose deadline passed while the robot was
+unreachable are skipped rather than sent late, so the timeline stays aligned
+with the run's clock across reconnects.
+
+Usage:
+    python movement_schedule.py spiral.npz --policy spiral --seed 7 --duration 600
+
+    commands, info = load_schedule("spiral.npz")
+    scheduler = CommandScheduler()
+    player = SchedulePlayer(commands, info, scheduler)
+    command = player.next_command(time.monotonic())
+    while command is not None:
+        scheduler.wait()
+        ...send command, then scheduler.record(started, completed)
+        command = player.next_command(time.monotonic())
+"""
+
+import json
+import math
+
+import numpy as np
+
+SCHEDULE_VERSION = 1
+COMMAND_PERIOD = 0.2  # Seconds between sends, matches unlimited_move.py
+DEFAULT_DURATION = 3600  # Seconds; SchedulePlayer loops shorter schedules
+MAX_SPEED = 255
+
+COMMAND_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('duration', '<f4'),
+    ('speed', '<u2'),
+    ('heading', '<u2'),
+    ('direction', 'u1'),
+    ('segment', '<u4'),
+])
+
+
+def random_walk(rng, duration, min_speed=100, max_speed=MAX_SPEED, min_hold=0.3, max_hold=1.0,
+                reverse_probability=0.0):
+    """Random speed and heading, each held for a uniform random time"""
+    # Enough segments to cover the duration even if every hold is the shortest
+    count = int(math.ceil(duration / min_hold)) + 1
+    holds = rng.uniform(min_hold, max_hold, count)
+    speeds = rng.integers(min_speed, max_speed + 1, count)
+    headings = rng.integers(0, 360, count)
+    directions = rng.random(count) < reverse_probability
+
+    starts = np.concatenate([[0.0], np.cumsum(holds)[:-1]])
+    keep = starts < duration
+    return starts[keep], holds[keep], speeds[keep], headings[keep], directions[keep]
+
+
+def spiral(rng, duration, period=COMMAND_PERIOD, min_speed=60, max_speed=200, turn_rate=90.0,
+           growth_time=30.0):
+    """Constant turn rate (degrees/second) with speed ramping up over growth_time"""
+    starts = np.arange(0.0, duration, period)
+    start_heading = rng.integers(0, 360)
+    turn = turn_rate if rng.random() < 0.5 else -turn_rate  # Clockwise or counter-clockwise
+
+    headings = np.mod(np.round(start_heading + turn * starts), 360)
+    speeds = np.round(min_speed + (max_speed - min_speed) * (np.mod(starts, growth_time) / growth_time))
+    holds = np.full(len(starts), period)
+    return starts, holds, speeds, headings, np.zeros(len(starts), dtype=bool)
+
+
+def coverage_sweep(rng, duration, speed=120, leg_time=3.0, step_time=0.6, legs=8):
+    """Boustrophedon sweep: legs alternate between a heading and its opposite,
+    joined by a short sideways step; after `legs` legs the steps reverse so
+    the sweep comes back across the arena"""
+    base = int(rng.integers(0, 360))
+    starts, holds, headings = [], [], []
+    t = 0.0
+    leg = 0
+    while t < duration:
+        starts.append(t)
+        holds.append(leg_time)
+        headings.append(base if leg % 2 == 0 else base + 180)
+        t += leg_time
+
+        side = 90 if (leg // legs) % 2 == 0 else -90
+        starts.append(t)
+        holds.append(step_time)
+        headings.append(base + side)
+        t += step_time
+        leg += 1
+
+    starts = np.array(starts)
+    keep = starts < duration
+    count = int(keep.sum())
+    return (starts[keep], np.array(holds)[keep], np.full(count, speed),
+            np.mod(np.array(headings)[keep], 360), np.zeros(count, dtype=bool))
+
+
+POLICIES = {
+    "random_walk": random_walk,
+    "spiral": spiral,
+    "coverage_sweep": coverage_sweep,
+}
+
+
+def expand_segments(starts, holds, speeds, headings, directions, period):
+    """One command at the start of each segment and every period after it while the segment lasts"""
+    holds = np.asarray(holds, dtype=np.float64)
+    sends = np.maximum(1, np.ceil(holds / period - 1e-9)).astype(np.int64)
+
+    segment = np.repeat(np.arange(len(starts)), sends)
+    first = np.cumsum(sends) - sends
+    offset = np.arange(len(segment)) - np.repeat(first, sends)
+
+    commands = np.zeros(len(segment), dtype=COMMAND_DTYPE)
+    commands['time'] = np.asarray(starts)[segment] + offset * period
+    commands['duration'] = holds[segment]
+    commands['speed'] = np.asarray(speeds)[segment]
+    commands['heading'] = np.asarray(headings)[segment]
+    commands['direction'] = np.asarray(directions)[segment]
+    commands['segment'] = segment
+    return commands
+
+
+def generate_schedule(policy="random_walk", seed=None, duration=DEFAULT_DURATION, period=COMMAND_PERIOD,
+                      **params):
+    """Precompute a run's commands.
+
+    Returns (commands, info). With seed=None a seed is drawn and recorded in
+    info, so every schedule can be regenerated. Extra keyword arguments are
+    passed to the policy (see POLICIES).
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown movement policy {policy!r} (choose from {', '.join(POLICIES)})")
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+
+    rng = np.random.default_rng(seed)
+    generator = POLICIES[policy]
+    if policy == "spiral":
+        params.setdefault("period", period)
+    segments = generator(rng, duration, **params)
+    commands = expand_segments(*segments, period=period)
+
+    info = {
+        "version": SCHEDULE_VERSION,
+        "policy": policy,
+        "seed": seed,
+        "duration": duration,
+        "period": period,
+        "params": params,
+        "commands": len(commands),
+        "segments": len(segments[0]),
+    }
+    return commands, info
+
+
+def save_schedule(path, commands, info):
+    np.savez(path, commands=commands, info=np.array(json.dumps(info)))
+
+
+def load_schedule(path):
+    """Return (commands, info) from a saved schedule"""
+    with np.load(path) as data:
+        commands = data['commands']
+        info = json.loads(str(data['info']))
+
+    if info.get("version") != SCHEDULE_VERSION:
+        raise ValueError(f"{path} has unsupported schedule version {info.get('version')}")
+    return commands, info
+
+
+class SchedulePlayer:
+    """Plays a schedule through a CommandScheduler (created with period=None).
+
+    next_command() sets the scheduler's deadline for the returned command; the
+    caller waits, sends it and calls scheduler.record() as usual.
+    """
+
+    def __init__(self, commands, info, scheduler, loop=True):
+        self.commands = commands
+        self.info = info
+        self.scheduler = scheduler
+        self.loop = loop
+        self.length = max(info["duration"], float(commands['time'][-1]) + info["period"]) if len(commands) else 0
+        self.origin = None
+        self.position = 0  # Commands played or skipped, over all laps
+        self.skipped = 0
+
+    def start(self, origin):
+        """Anchor schedule time 0 at origin (time.monotonic() seconds)"""
+        self.origin = origin
+        self.position = 0
+
+    def _deadline(self, position):
+        lap, index = divmod(position, len(self.commands))
+        return self.origin + lap * self.length + self.commands['time'][index], index
+
+    def next_command(self, now):
+        """Return the next command still due (a COMMAND_DTYPE record), or None when the schedule has ended"""
+        if self.origin is None:
+            self.start(now)
+        if not len(self.commands):
+            return None
+
+        period = self.info["period"]
+        while True:
+            if not self.loop and self.position >= len(self.commands):
+                return None
+            deadline, index = self._deadline(self.position)
+            self.position += 1
+            if deadline >= now - period:
+                break
+            self.skipped += 1  # Missed while disconnected (or badly late): skip, don't send late
+
+        self.scheduler.schedule(deadline)
+        return self.commands[index]
+
+    def stats(self):
+        """Playback summary for metadata.json"""
+        return dict(self.info, played=self.position - self.skipped, skipped=self.skipped,
+                    laps=self.position // len(self.commands) if len(self.commands) else 0)
+
+
+def main():
+    """Generate a movement schedule file"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Precompute a seeded movement schedule.')
+    parser.add_argument('output', help='Schedule file to write, e.g. spiral.npz')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random_walk',
+                        help='Movement policy (default: random_walk)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed (default: drawn and printed)')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                        help=f'Schedule length in seconds (default: {DEFAULT_DURATION})')
+    parser.add_argument('--period', type=float, default=COMMAND_PERIOD,
+                        help=f'Seconds between sends (default: {COMMAND_PERIOD})')
+    args = parser.parse_args()
+
+    commands, info = generate_schedule(args.policy, args.seed, args.duration, args.period)
+    save_schedule(args.output, commands, info)
+    print(f"{info['policy']} schedule, seed {info['seed']}: {info['segments']} segments, "
+          f"{info['commands']} commands over {info['duration']:.0f}s")
+    print(f"Schedule saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
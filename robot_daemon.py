@@ -0,0 +1,639 @@
+#!/usr/bin/env python3
+"""
+Robot Connection Daemon
+
+Holds one Sphero's BLE connection for as long as it runs, streaming sensors
+continuously, so switching between runs (or tools) no longer costs a connect,
+a wake-up and the sleeps after it. Runs are started and stopped over a local
+Unix socket and begin writing at the next sample, milliseconds after the
+request.
+
+A run writes the same files as sphero_move_and_collect_with_sensors.py into
+collected_data/daemon_run_YYYYMMDD_HHMMSS_mmm/: sensor_data.csv, actions.bin,
+movement_schedule.npz, gaps.csv, metadata.json and, with "video", the camera
+recording. Between runs the robot stands still while the stream keeps
+running. Lost connections are re-established as in the collectors
+(connection_gaps.py); a gap during a run goes to its gaps.csv.
+
+Protocol: newline-delimited JSON. Each request gets one reply,
+{"ok": true, ...} or {"ok": false, "error": "..."}:
+
+    {"cmd": "status"}
+    {"cmd": "start_run", "policy": "spiral", "seed": 7, "schedule": null, "video": false}
+    {"cmd": "stop_run"}
+    {"cmd": "set_rate", "sensor_hz": 10, "command_hz": 2}
+    {"cmd": "subscribe", "streams": ["samples", "commands"]}
+    {"cmd": "shutdown"}
+
+The sensor rate changes at once; the command rate sets the period of the
+next run's movement schedule. After "subscribe" the connection carries one
+JSON event per line ({"stream": "sample", ...} or {"stream": "command", ...})
+until the client disconnects; a subscriber that falls behind loses events
+rather than slowing the daemon down.
+
+Usage:
+    python robot_daemon.py serve [--mac C9:B9:61:72:CB:78] [--controller hci1]
+    python robot_daemon.py start [--policy spiral] [--seed 7] [--video]
+    python robot_daemon.py stop
+    python robot_daemon.py rate --sensor-hz 10
+    python robot_daemon.py watch samples commands
+    python robot_daemon.py status | shutdown
+"""
+
+import asyncio
+import csv
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+
+from pysphero.core import Sphero
+from pysphero.driving import Direction
+from pysphero.device_api.sensor import Accelerometer, Gyroscope, Locator, SensorCommand, Velocity
+
+from action_channel import ACTIONS_FILENAME, ActionWriter
+from ble_controllers import adapter_for, connect_entry, connect_stats, first_command
+from camera_process import CameraProcess
+from collector_runtime import CollectorRuntime, sample_rate_stats
+from command_scheduler import AdaptivePacer, CommandScheduler
+from connection_gaps import STREAM_TIMEOUT, GapLog, ReconnectBackoff, close_in_background, watch_stream
+from fleet_collector import SENSOR_COLUMNS, parse_sensor_response
+from movement_schedule import POLICIES, SchedulePlayer, generate_schedule, load_schedule, save_schedule
+from startup import wait_until_ready
+
+MAC_ADDRESS = "C9:B9:61:72:CB:78"
+SOCKET_PATH = "/tmp/sphero_daemon.sock"
+DATA_DIR = "collected_data"
+
+# Same files as the sensor collector
+SENSOR_FILENAME = "sensor_data.csv"
+SCHEDULE_FILENAME = "movement_schedule.npz"
+GAPS_FILENAME = "gaps.csv"
+METADATA_FILENAME = "metadata.json"
+
+# Camera settings, for runs started with "video"
+CAMERA_INDICES = [0]
+CAMERA_WIDTH = 640
+CAMERA_HEIGHT = 480
+CAMERA_FPS = 30
+RECORDING_MODE = "encode"
+
+SENSORS = (Accelerometer, Gyroscope, Locator, Velocity)
+SENSOR_FREQUENCY = 20  # Hz until changed with set_rate
+COMMAND_FREQUENCY = 2.0  # Commands per second of the next run's schedule
+MAX_SENSOR_FREQUENCY = 100
+MAX_STREAM_INTERVAL = 65535  # Milliseconds; the streaming interval is a 2-byte field
+STREAM_TIMEOUT_SAMPLES = 3  # Missed samples before a slow stream counts as lost
+MAX_COMMAND_ERRORS = 3  # Consecutive failed commands before reconnecting
+MAX_RECONNECTS = 20  # Consecutive failed attempts before the daemon gives up
+SUBSCRIBER_QUEUE_SIZE = 1000  # Events buffered per subscriber before they are dropped
+SENSOR_FLUSH_ROWS = 20
+
+
+def set_stream_interval(sphero, interval_ms):
+    """Change the streaming interval of SENSORS without restarting the notify worker
+    (calling set_notify again would start a second one)"""
+    mask = 0
+    for sensor in SENSORS:
+        mask |= sensor.mask()
+    sphero.sensor.request(
+        SensorCommand.set_sensor_streaming_mask,
+        data=[*interval_ms.to_bytes(2, "big"), 0, *mask.to_bytes(4, "big")],
+        target_id=0x12,
+    )
+
+
+class DaemonRun:
+    """Output files and movement of one run"""
+
+    def __init__(self, run_dir, commands, info, requested):
+        self.run_dir = run_dir
+        self.requested = requested  # time.monotonic() of the start_run request
+        self.started = time.time()
+        self.first_sample = None
+        self.first_command = None
+        self.sample_times = []
+        self.commands_sent = 0
+        self.camera_process = None
+        self.camera_stats = []
+
+        self.scheduler = CommandScheduler(pacer=AdaptivePacer(max_rate=1 / info["period"]))
+        self.player = SchedulePlayer(commands, info, self.scheduler)
+        self.actions = ActionWriter(os.path.join(run_dir, ACTIONS_FILENAME))
+        self.gaps = GapLog(os.path.join(run_dir, GAPS_FILENAME))
+        self._csv_file = open(os.path.join(run_dir, SENSOR_FILENAME), 'w', newline='')
+        self._csv_writer = csv.writer(self._csv_file)
+        self._csv_writer.writerow(SENSOR_COLUMNS)
+
+    def write_sample(self, monotonic_time, values):
+        """Called with the daemon's lock held"""
+        if self.first_sample is None:
+            self.first_sample = monotonic_time
+            self.gaps.run_start = monotonic_time
+        self.gaps.close(monotonic_time)
+        self.sample_times.append(monotonic_time)
+        self._csv_writer.writerow([time.time() - self.started, monotonic_time] + values)
+        if len(self.sample_times) % SENSOR_FLUSH_ROWS == 0:
+            self._csv_file.flush()
+
+    def close(self):
+        """Called with the daemon's lock held"""
+        self.gaps.finish()
+        self._csv_file.close()
+        self.actions.close()
+
+    def metadata(self, sensor_hz):
+        duration = time.time() - self.started
+        return {
+            "start_time": datetime.datetime.fromtimestamp(self.started).isoformat(),
+            "end_time": datetime.datetime.now().isoformat(),
+            "duration_seconds": duration,
+            "sensor_samples": len(self.sample_times),
+            "sensor_rate": sample_rate_stats(self.sample_times, sensor_hz),
+            "commands_sent": self.commands_sent,
+            "command_timing": self.scheduler.stats(),
+            "movement_schedule": self.player.stats(),
+            "gaps": self.gaps.stats(),
+            "cameras": self.camera_stats,
+            "daemon": {
+                # From the start_run request, so with the connection already up these are milliseconds
+                "time_to_first_sample_ms": (self.first_sample - self.requested) * 1000 if self.first_sample else None,
+                "time_to_first_command_ms": (self.first_command - self.requested) * 1000 if self.first_command else None,
+            },
+        }
+
+
+class RobotDaemon:
+    """Keeps one robot connected and streaming, and serves the control socket"""
+
+    def __init__(self, mac_address=MAC_ADDRESS, controller=None, socket_path=SOCKET_PATH):
+        self.mac_address = mac_address
+        self.controller = controller
+        self.socket_path = socket_path
+        self.runtime = CollectorRuntime()
+
+        self.sensor_hz = SENSOR_FREQUENCY
+        self.command_hz = COMMAND_FREQUENCY
+        self.sphero = None  # While connected and streaming
+        self.run = None
+        self.runs = 0
+        self.connect_log = []
+        self.reconnects = 0
+        self.last_sample = None
+        self.samples = 0
+
+        self.lock = threading.Lock()  # The sensor callback runs on pysphero's notify thread
+        self.subscribers = {}  # asyncio.Queue -> set of streams
+        self.dropped_events = 0
+        self._clients = {}  # Handler task -> its StreamWriter
+        self._run_changed = None
+        self._starting = False  # A start_run is between its checks and setting self.run
+
+    # Sensor stream
+
+    def sensor_callback(self, response):
+        monotonic_time = time.monotonic()
+        try:
+            values = parse_sensor_response(response)
+        except Exception as e:
+            print(f"Error processing sensor data: {e}")
+            return
+
+        with self.lock:
+            self.last_sample = monotonic_time
+            self.samples += 1
+            if self.run is not None:
+                self.run.write_sample(monotonic_time, values)
+
+        if self.subscribers:
+            event = dict(zip(SENSOR_COLUMNS[2:], values), stream="sample", monotonic_time=monotonic_time)
+            self.runtime.loop.call_soon_threadsafe(self._publish, "samples", event)
+
+    def stream_timeout(self):
+        """Seconds without a sample before the connection counts as lost (follows set_rate)"""
+        return max(STREAM_TIMEOUT, STREAM_TIMEOUT_SAMPLES / self.sensor_hz)
+
+    def _publish(self, stream, event):
+        for queue, streams in self.subscribers.items():
+            if stream not in streams:
+                continue
+            if queue.full():
+                self.dropped_events += 1
+            else:
+                queue.put_nowait(event)
+
+    # Connection and movement
+
+    def _send(self, sphero, command):
+        direction = Direction.reverse if command['direction'] else Direction.forward
+        sphero.driving.drive_with_heading(int(command['speed']), int(command['heading']), direction)
+
+    async def _run_changes_within(self, seconds):
+        """Wait up to seconds; True if a run started or stopped meanwhile"""
+        try:
+            await asyncio.wait_for(self._run_changed.wait(), seconds)
+        except asyncio.TimeoutError:
+            return False
+        self._run_changed.clear()
+        return True
+
+    async def move(self, sphero, connection):
+        """Play the current run's schedule while there is one; raises ConnectionError when commands keep failing"""
+        runtime = self.runtime
+        errors = 0
+        while runtime.running:
+            run = self.run
+            if run is None:
+                await runtime.first(self._run_changed.wait(), runtime.wait_stopped())
+                self._run_changed.clear()
+                continue
+
+            command = run.player.next_command(run.scheduler.earliest_send())
+            if await self._run_changes_within(run.scheduler.delay()):
+                continue  # Stopped (or stopped and restarted) while waiting
+            if not runtime.running:
+                break
+
+            planned_time = run.scheduler.next_deadline
+            started = time.monotonic()
+            try:
+                await runtime.ble(self._send, sphero, command)
+            except Exception as e:
+                run.scheduler.failed(started)
+                errors += 1
+                print(f"Command error ({errors}/{MAX_COMMAND_ERRORS}): {e}")
+                if errors >= MAX_COMMAND_ERRORS:
+                    raise ConnectionError(f"{errors} consecutive command errors")
+                continue
+
+            completed = time.monotonic()
+            errors = 0
+            first_command(connection, completed)
+            if self.run is not run:
+                continue  # Stopped while the command was in flight; its files are closed
+            run.scheduler.record(started, completed)
+            try:
+                run.actions.write(int(command['speed']), int(command['heading']), int(command['direction']),
+                                  float(command['duration']), started, planned_time, completed - started)
+            except (OSError, ValueError) as e:
+                # A file problem, not a lost connection: keep the robot connected
+                print(f"Error recording command: {e}")
+            run.commands_sent += 1
+            if run.first_command is None:
+                run.first_command = completed
+            if self.subscribers:
+                self._publish("commands", {
+                    "stream": "command", "planned_time": planned_time, "command_time": started,
+                    "round_trip": completed - started, "speed": int(command['speed']),
+                    "heading": int(command['heading']), "direction": int(command['direction']),
+                })
+
+    async def connection_task(self):
+        """Stay connected and streaming until shutdown, reconnecting after losses"""
+        runtime = self.runtime
+        backoff = ReconnectBackoff()
+
+        while runtime.running and backoff.attempt < MAX_RECONNECTS:
+            sphero = None
+            lost = False
+            try:
+                print(f"Connecting to {self.mac_address}...")
+                sphero = Sphero(mac_address=self.mac_address, ble_adapter_cls=adapter_for(self.controller))
+                connect_started = time.monotonic()
+                await runtime.ble(sphero.__enter__)
+                connection = connect_entry(sphero, connect_started)
+                self.connect_log.append(connection)
+                await runtime.ble(sphero.power.wake)
+                if len(self.connect_log) == 1:
+                    # Poll until the ball answers instead of sleeping (after a drop it is still awake)
+                    ready = await runtime.ble(wait_until_ready, sphero)
+                    connection["ready_ms"] = ready * 1000 if ready is not None else None
+
+                await runtime.ble(sphero.sensor.set_notify, self.sensor_callback, *SENSORS,
+                                  interval=int(1000 / self.sensor_hz))
+                self.sphero = sphero
+                backoff.connected()
+                print(f"Connected, streaming at {self.sensor_hz}Hz")
+                await runtime.first(self.move(sphero, connection),
+                                    watch_stream(runtime, lambda: self.last_sample, self.stream_timeout))
+
+            except Exception as e:
+                print(f"Connection error: {e}")
+                lost = True
+                self.reconnects += 1
+                with self.lock:
+                    if self.run is not None and self.last_sample is not None:
+                        self.run.gaps.open(str(e) or type(e).__name__, self.last_sample)
+            finally:
+                self.sphero = None
+                if sphero is not None and lost:
+                    close_in_background(sphero)
+                    runtime.reset_ble()
+                elif sphero is not None:
+                    try:
+                        await runtime.ble(sphero.driving.drive_with_heading, 0, 0, Direction.forward)
+                        await runtime.ble(sphero.__exit__, None, None, None)
+                    except Exception as e:
+                        print(f"Error closing connection: {e}")
+
+            if runtime.running:
+                delay = backoff.next_delay()
+                print(f"Will retry in {delay * 1000:.0f}ms... (attempt {backoff.attempt}/{MAX_RECONNECTS})")
+                await runtime.sleep(delay)
+
+        if backoff.attempt >= MAX_RECONNECTS:
+            print(f"Maximum reconnect attempts ({MAX_RECONNECTS}) reached, shutting down.")
+            runtime.stop()
+
+    async def camera_task(self, run):
+        runtime = self.runtime
+        cameras = [(index, os.path.join(run.run_dir, "video" if position == 0 else f"video_cam{index}"))
+                   for position, index in enumerate(CAMERA_INDICES)]
+        run.camera_process = CameraProcess(cameras, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS,
+                                           recording_mode=RECORDING_MODE)
+        if not await runtime.io(run.camera_process.start):
+            print("Error: Could not open any camera, recording without video.")
+            run.camera_process = None
+            return
+        run.camera_process.set_run_start(run.started)
+
+    # Requests
+
+    async def start_run(self, policy="random_walk", seed=None, schedule=None, video=False):
+        requested = time.monotonic()
+        if self.run is not None:
+            raise RuntimeError(f"a run is already active ({self.run.run_dir})")
+        if self._starting:
+            raise RuntimeError("a run is already starting")
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy {policy!r}")
+        # Claimed before the first await, so a concurrent start (e.g. while the camera opens) is refused
+        self._starting = True
+        try:
+            return await self._start_run(requested, policy, seed, schedule, video)
+        finally:
+            self._starting = False
+
+    async def _start_run(self, requested, policy, seed, schedule, video):
+        # Milliseconds, since runs can follow each other within a second; never reuse a directory
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        run_dir = os.path.join(DATA_DIR, f"daemon_run_{timestamp}")
+        os.makedirs(run_dir)
+        if schedule:
+            commands, info = load_schedule(schedule)
+        else:
+            commands, info = generate_schedule(policy, seed, period=1 / self.command_hz)
+        save_schedule(os.path.join(run_dir, SCHEDULE_FILENAME), commands, info)
+
+        run = DaemonRun(run_dir, commands, info, requested)
+        if video:
+            try:
+                await self.camera_task(run)
+            except Exception:
+                with self.lock:
+                    run.close()
+                if run.camera_process:
+                    await self.runtime.io(run.camera_process.stop)
+                raise
+        with self.lock:
+            self.run = run
+        self.runs += 1
+        self._run_changed.set()
+        print(f"Run started: {run_dir} ({info['policy']}, seed {info['seed']})")
+        return {"run_dir": run_dir, "seed": info["seed"], "setup_ms": (time.monotonic() - requested) * 1000}
+
+    async def stop_run(self):
+        with self.lock:
+            run, self.run = self.run, None
+            if run is None:
+                raise RuntimeError("no run is active")
+            run.close()
+        self._run_changed.set()
+
+        if self.sphero is not None:
+            try:
+                await self.runtime.ble(self.sphero.driving.drive_with_heading, 0, 0, Direction.forward)
+            except Exception as e:
+                print(f"Warning: could not stop the robot: {e}")
+        if run.camera_process:
+            run.camera_stats = await self.runtime.io(run.camera_process.stop)
+
+        metadata = run.metadata(self.sensor_hz)
+        metadata["connect_timing"] = connect_stats(self.connect_log)
+        with open(os.path.join(run.run_dir, METADATA_FILENAME), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        print(f"Run stopped: {run.run_dir}, {metadata['sensor_samples']} samples, "
+              f"{metadata['commands_sent']} commands")
+        return {"run_dir": run.run_dir, "sensor_samples": metadata["sensor_samples"],
+                "commands_sent": metadata["commands_sent"], "daemon": metadata["daemon"]}
+
+    async def set_rate(self, sensor_hz=None, command_hz=None):
+        if command_hz is not None and command_hz <= 0:
+            raise ValueError("command_hz must be positive")
+        if sensor_hz is not None:
+            interval_ms = int(1000 / sensor_hz) if sensor_hz > 0 else 0
+            if not (sensor_hz <= MAX_SENSOR_FREQUENCY and 1 <= interval_ms <= MAX_STREAM_INTERVAL):
+                raise ValueError(f"sensor_hz must be between {1000 / MAX_STREAM_INTERVAL:.3f} "
+                                 f"and {MAX_SENSOR_FREQUENCY}")
+            if self.sphero is not None:
+                await self.runtime.ble(set_stream_interval, self.sphero, interval_ms)
+            # Only once the robot took it: reconnects stream at this rate
+            self.sensor_hz = sensor_hz
+        if command_hz is not None:
+            self.command_hz = command_hz  # Period of the next run's schedule
+        return {"sensor_hz": self.sensor_hz, "command_hz": self.command_hz}
+
+    def status(self):
+        return {
+            "mac_address": self.mac_address,
+            "connected": self.sphero is not None,
+            "sensor_hz": self.sensor_hz,
+            "command_hz": self.command_hz,
+            "samples": self.samples,
+            "seconds_since_sample": time.monotonic() - self.last_sample if self.last_sample else None,
+            "run_dir": self.run.run_dir if self.run else None,
+            "runs": self.runs,
+            "connections": len(self.connect_log),
+            "reconnects": self.reconnects,
+            "subscribers": len(self.subscribers),
+            "dropped_events": self.dropped_events,
+        }
+
+    async def subscribe(self, writer, streams):
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers[queue] = set(streams)
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break  # Daemon shutting down
+                writer.write((json.dumps(event) + "\n").encode())
+                await writer.drain()
+        finally:
+            del self.subscribers[queue]
+
+    async def handle_client(self, reader, writer):
+        self._clients[asyncio.current_task()] = writer
+        try:
+            while self.runtime.running:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    command = request.pop("cmd", None)
+                    if command == "subscribe":
+                        streams = request.get("streams", ["samples", "commands"])
+                        writer.write((json.dumps({"ok": True, "streams": streams}) + "\n").encode())
+                        await self.subscribe(writer, streams)
+                        break
+                    if command == "status":
+                        reply = self.status()
+                    elif command == "start_run":
+                        reply = await self.start_run(**request)
+                    elif command == "stop_run":
+                        reply = await self.stop_run()
+                    elif command == "set_rate":
+                        reply = await self.set_rate(**request)
+                    elif command == "shutdown":
+                        reply = {}
+                        self.runtime.stop()
+                    else:
+                        raise ValueError(f"unknown command {command!r}")
+                    reply = dict(reply, ok=True)
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                writer.write((json.dumps(reply) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass  # Client went away
+        finally:
+            writer.close()
+            del self._clients[asyncio.current_task()]
+
+    async def serve(self):
+        self._run_changed = asyncio.Event()
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        print(f"Listening on {self.socket_path}")
+        try:
+            await self.connection_task()
+            await self.runtime.wait_stopped()
+        finally:
+            server.close()
+            if self.run is not None:
+                await self.stop_run()
+            # Let connected clients finish instead of having them cancelled
+            for queue in self.subscribers:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+            for writer in self._clients.values():
+                writer.close()
+            if self._clients:
+                await asyncio.wait(list(self._clients), timeout=1.0)
+            os.unlink(self.socket_path)
+
+    def run_forever(self):
+        if os.path.exists(self.socket_path):
+            try:
+                DaemonClient(self.socket_path).request("status")
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            except OSError:
+                os.unlink(self.socket_path)  # Left over from a daemon that did not shut down cleanly
+        self.runtime.run(self.serve())
+
+
+class DaemonClient:
+    """Blocking client for the daemon's control socket"""
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def request(self, cmd, **params):
+        """Send one request and return the reply; raises RuntimeError if the daemon reports an error"""
+        with self._connect() as sock, sock.makefile('rwb') as stream:
+            stream.write((json.dumps(dict(params, cmd=cmd)) + "\n").encode())
+            stream.flush()
+            reply = json.loads(stream.readline())
+        if not reply.pop("ok"):
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def subscribe(self, *streams):
+        """Yield events ("samples" and/or "commands") until the daemon stops"""
+        with self._connect() as sock, sock.makefile('rwb') as stream:
+            sock.settimeout(None)
+            stream.write((json.dumps({"cmd": "subscribe", "streams": list(streams)}) + "\n").encode())
+            stream.flush()
+            stream.readline()  # Acknowledgement
+            for line in stream:
+                yield json.loads(line)
+
+
+def main():
+    """Run the daemon or send it a request"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Keep a Sphero connected and control runs over a socket.')
+    parser.add_argument('--socket', default=SOCKET_PATH, help=f'Control socket (default: {SOCKET_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='Run the daemon')
+    serve.add_argument('--mac', default=MAC_ADDRESS, help='MAC address of the robot')
+    serve.add_argument('--controller', default=None, help='Bluetooth controller, e.g. hci1')
+
+    start = commands.add_parser('start', help='Start a run')
+    start.add_argument('--policy', choices=sorted(POLICIES), default='random_walk')
+    start.add_argument('--seed', type=int, default=None)
+    start.add_argument('--schedule', default=None, help='Saved schedule to replay')
+    start.add_argument('--video', action='store_true', help='Record the camera too')
+
+    commands.add_parser('stop', help='Stop the run')
+    rate = commands.add_parser('rate', help='Change the sensor or command rate')
+    rate.add_argument('--sensor-hz', type=float, default=None)
+    rate.add_argument('--command-hz', type=float, default=None)
+    watch = commands.add_parser('watch', help='Print streamed events')
+    watch.add_argument('streams', nargs='*', choices=['samples', 'commands'], default=['samples', 'commands'])
+    commands.add_parser('status', help='Show the daemon state')
+    commands.add_parser('shutdown', help='Stop the daemon')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        RobotDaemon(args.mac, args.controller, args.socket).run_forever()
+        return
+
+    client = DaemonClient(args.socket)
+    try:
+        if args.command == 'start':
+            reply = client.request("start_run", policy=args.policy, seed=args.seed, schedule=args.schedule,
+                                   video=args.video)
+        elif args.command == 'stop':
+            reply = client.request("stop_run")
+        elif args.command == 'rate':
+            reply = client.request("set_rate", sensor_hz=args.sensor_hz, command_hz=args.command_hz)
+        elif args.command == 'watch':
+            for event in client.subscribe(*args.streams):
+                print(json.dumps(event))
+            return
+        elif args.command == 'shutdown':
+            reply = client.request("shutdown")
+        else:
+            reply = client.request("status")
+    except (OSError, RuntimeError) as e:
+        parser.exit(1, f"Error: {e}\n")
+    except KeyboardInterrupt:
+        return
+    print(json.dumps(reply, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Sensor-to-Frame Alignment
+
+Gives every video frame the IMU state at the instant it was captured. Frame
+capture times come from the frame timestamp sidecar and sensor sample times
+from the monotonic_time column of sensor_data.csv; both are time.monotonic()
+on the collecting host, so they share one clock.
+
+Alignment is fully vectorized: one np.searchsorted call finds the sensor
+samples around every frame, and all channels are linearly interpolated with the
+same weights. An hour of 30fps video against 20Hz sensor data takes well under
+a tenth of a second.
+
+Frames are marked invalid (values NaN) when they fall outside the sensor
+recording or inside a gap where consecutive sensor samples are more than
+`max_gap` seconds apart, e.g. while the robot was reconnecting.
+
+Lag compensation: `sensor_lag` is how long after the measurement the host
+received a sensor sample (BLE and callback latency), `frame_lag` how long after
+exposure a frame was timestamped. Both are subtracted before matching. If the
+run has an LED sync calibration (led_sync.py), the frame lag comes from it by
+default, including its drift over the run.
+
+Usage:
+    python sensor_alignment.py collected_data/run_YYYYMMDD_HHMMSS [--sensor-lag 0.05]
+
+This writes video_sensors.npz next to the video with the per-frame channels.
+"""
+
+import csv
+import os
+import time
+
+import numpy as np
+
+from frame_timestamps import read_frame_timestamps, sidecar_path
+from led_sync import calibrated_frame_lag, load_sync_calibration
+from video_reader import find_run_video
+
+SENSOR_FILENAME = "sensor_data.csv"
+TIME_COLUMN = "monotonic_time"
+DEFAULT_MAX_GAP = 0.5  # Seconds between sensor samples above which values are not interpolated
+
+
+def load_sensor_data(path):
+    """Read a sensor CSV into (times, values, channel names).
+
+    times is the monotonic_time column, values an (M, C) float64 array of the
+    remaining sensor channels.
+    """
+    with open(path, newline='') as f:
+        header = next(csv.reader(f))
+
+    if TIME_COLUMN not in header:
+        raise ValueError(f"{path} has no {TIME_COLUMN} column; it was recorded before "
+                         f"frame/sensor timestamps were shared and cannot be aligned")
+
+    data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+    channels = [name for name in header if name not in ("timestamp", TIME_COLUMN)]
+    columns = [header.index(name) for name in channels]
+    return data[:, header.index(TIME_COLUMN)], data[:, columns], channels
+
+
+def align(frame_times, sensor_times, sensor_values, sensor_lag=0.0, frame_lag=0.0,
+          max_gap=DEFAULT_MAX_GAP):
+    """Align sensor samples to frame times.
+
+    Returns a dict with:
+        values   (N, C) sensor channels linearly interpolated at each frame (NaN where invalid)
+        nearest  (N,) index of the sensor sample closest in time to each frame
+        valid    (N,) bool, frame lies within the sensor recording and not in a gap
+    """
+    frame_times = np.asarray(frame_times, dtype=np.float64) - frame_lag
+    sensor_times = np.asarray(sensor_times, dtype=np.float64) - sensor_lag
+    sensor_values = np.asarray(sensor_values, dtype=np.float64)
+    if sensor_values.ndim == 1:
+        sensor_values = sensor_values[:, None]
+
+    n = len(frame_times)
+    if len(sensor_times) == 0:
+        return {
+            "values": np.full((n, sensor_values.shape[1]), np.nan),
+            "nearest": np.zeros(n, dtype=np.int64),
+            "valid": np.zeros(n, dtype=bool),
+        }
+
+    # Samples are appended by callback threads, so order them first
+    order = np.argsort(sensor_times, kind='stable')
+    sensor_times = sensor_times[order]
+    sensor_values = sensor_values[order]
+
+    # Bracketing samples left <= frame time < right
+    right = np.clip(np.searchsorted(sensor_times, frame_times, side='right'), 1, max(len(sensor_times) - 1, 1))
+    left = right - 1
+    if len(sensor_times) == 1:
+        right = left
+
+    span = sensor_times[right] - sensor_times[left]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(span > 0, (frame_times - sensor_times[left]) / span, 0.0)
+    weight = np.clip(weight, 0.0, 1.0)[:, None]
+    values = sensor_values[left] * (1 - weight) + sensor_values[right] * weight
+
+    nearest = np.where(weight[:, 0] < 0.5, left, right)
+
+    valid = ((frame_times >= sensor_times[0]) & (frame_times <= sensor_times[-1])
+             & (span <= max_gap))
+    values[~valid] = np.nan
+
+    return {
+        "values": values,
+        "nearest": order[nearest],
+        "valid": valid,
+    }
+
+
+def alignment_path(video_path):
+    """Return the aligned sensor data path for a video file"""
+    return os.path.splitext(video_path)[0] + "_sensors.npz"
+
+
+def align_run(run_dir, camera=0, sensor_lag=0.0, frame_lag=None, max_gap=DEFAULT_MAX_GAP):
+    """Align a run's sensor data to the frames of one camera.
+
+    frame_lag defaults to the run's LED sync calibration, or 0 without one.
+    Returns the align() dict plus 'frame_time' (monotonic capture time per
+    frame), 'frame_lag', 'capture_index' and 'channels'.
+    """
+    video_path = find_run_video(run_dir, camera)
+    timestamps_file = sidecar_path(video_path)
+    if not os.path.exists(timestamps_file):
+        raise FileNotFoundError(f"No frame timestamps ({timestamps_file}) for {video_path}")
+
+    _, frames = read_frame_timestamps(timestamps_file)
+    sensor_times, sensor_values, channels = load_sensor_data(os.path.join(run_dir, SENSOR_FILENAME))
+
+    if frame_lag is None:
+        calibration = load_sync_calibration(run_dir, camera)
+        frame_lag = calibrated_frame_lag(calibration, frames['capture_time']) if calibration else 0.0
+
+    result = align(frames['capture_time'], sensor_times, sensor_values,
+                   sensor_lag=sensor_lag, frame_lag=frame_lag, max_gap=max_gap)
+    result["frame_time"] = frames['capture_time']
+    result["frame_lag"] = np.broadcast_to(frame_lag, len(frames)).astype(np.float64)
+    result["capture_index"] = frames['capture_index']
+    result["channels"] = np.array(channels)
+    return result
+
+
+def main():
+    """Align a recorded run's sensor data to its video frames"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Align sensor data to video frames.')
+    parser.add_argument('run_dir', help='Run directory, e.g. collected_data/run_YYYYMMDD_HHMMSS')
+    parser.add_argument('--camera', type=int, default=0,
+                        help='Camera position in CAMERA_INDICES (default: 0)')
+    parser.add_argument('--sensor-lag', type=float, default=0.0,
+                        help='Seconds between a sensor measurement and its arrival on the host')
+    parser.add_argument('--frame-lag', type=float, default=None,
+                        help='Seconds between frame exposure and its capture timestamp '
+                             '(default: from the LED sync calibration, or 0)')
+    parser.add_argument('--max-gap', type=float, default=DEFAULT_MAX_GAP,
+                        help=f'Largest sensor sample gap to interpolate over (default: {DEFAULT_MAX_GAP}s)')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    result = align_run(args.run_dir, args.camera, args.sensor_lag, args.frame_lag, args.max_gap)
+    elapsed = time.time() - start_time
+
+    output_path = alignment_path(find_run_video(args.run_dir, args.camera))
+    np.savez(output_path, **result)
+
+    print(f"Aligned {int(result['valid'].sum())}/{len(result['valid'])} frames "
+          f"to {len(result['channels'])} sensor channels in {elapsed * 1000:.0f}ms")
+    print(f"Aligned data saved to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,14 @@ Sphero Data Collection Script with Video Recording
 This script launches unlimited_move.py in a separate process to control the Sphero's movement
 while recording video from a USB camera. The script does not interfere with the
 Sphero control at all, preserving the original unlimited_move.py functionality.
+
+Every movement command unlimited_move.py sends is reported back over a socket
+(see action_channel.py) and saved to actions.bin, timestamped on the same clock
+as the video frames.
+
+The movement itself is a precomputed schedule (see movement_schedule.py) saved
+to the run directory as movement_schedule.npz, so a run's motion can be
+replayed exactly by passing that file as MOVEMENT_SCHEDULE.
 """
 
 import os
@@ -17,21 +25,38 @@ import csv
 import cv2
 import json
 import sys
+from camera_pipeline import start_camera_recording, DROP_OLDEST
+from action_channel import ACTION_FD_ENV, ACTIONS_FILENAME, ActionRecorder, create_action_channel, read_actions
+from command_scheduler import jitter_stats, send_rate_log
+from movement_schedule import generate_schedule, load_schedule, save_schedule
 
 # Camera settings
-CAMERA_INDEX = 0
+CAMERA_INDICES = [0]  # e.g. [0, 2] to record overhead and side views in the same run
 CAMERA_WIDTH = 640
 CAMERA_HEIGHT = 480
 CAMERA_FPS = 30
+FRAME_QUEUE_SIZE = 60  # Frames buffered between capture and encoding
+FRAME_DROP_POLICY = DROP_OLDEST  # DROP_OLDEST or BLOCK when the encoder falls behind
+TIMESTAMP_OVERLAY = False  # Burn "Time: ..." into frames (timing is always saved to the sidecar)
+RECORDING_MODE = "encode"  # "encode" (re-encode, codec from test_camera.py --benchmark) or "mjpeg" (store the camera's MJPEG as-is)
 
 # Data collection settings
 DATA_DIR = "collected_data"
-VIDEO_FILENAME = "video.mp4"
+VIDEO_BASENAME = "video"  # Extension depends on the codec, e.g. video.mp4
 METADATA_FILENAME = "metadata.json"
+SCHEDULE_FILENAME = "movement_schedule.npz"
+
+# Movement settings
+MOVEMENT_POLICY = "random_walk"  # "random_walk", "spiral" or "coverage_sweep" (see movement_schedule.py)
+MOVEMENT_SEED = None  # None draws a seed; it is saved with the schedule either way
+MOVEMENT_SCHEDULE = None  # Path to a saved schedule (e.g. an earlier run's movement_schedule.npz) to replay instead
 
 # Global variables
 running = True
 start_timestamp = None
+camera_stats = []
+action_recorder = None
+schedule_info = None
 
 def signal_handler(sig, frame):
     """Handle Ctrl+C to gracefully stop data collection"""
@@ -52,92 +77,83 @@ def ensure_data_dir():
     
     return DATA_DIR
 
+def camera_video_basename(position, camera_index):
+    """Video file name (without extension) for a camera; the first camera keeps the plain name"""
+    if position == 0:
+        return VIDEO_BASENAME
+    return f"{VIDEO_BASENAME}_cam{camera_index}"
+
 def camera_recording_thread():
-    """Thread to record video from camera"""
-    global running, start_timestamp, DATA_DIR
+    """Thread to record video from all cameras"""
+    global running, start_timestamp, DATA_DIR, camera_stats
     
     print("Starting camera recording thread...")
-    video_path = os.path.join(DATA_DIR, VIDEO_FILENAME)
-    
-    # Initialize the camera
-    cap = cv2.VideoCapture(CAMERA_INDEX)
     
-    # Check if camera opened successfully
-    if not cap.isOpened():
-        print("Error: Could not open camera")
-        running = False
-        return
-    
-    # Set camera properties
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
-    cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
-    
-    # Get actual camera properties (might be different from requested)
-    actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    actual_fps = cap.get(cv2.CAP_PROP_FPS)
+    if start_timestamp is None:
+        start_timestamp = time.time()
     
-    print(f"Camera initialized with resolution: {actual_width}x{actual_height} @ {actual_fps}fps")
+    def annotate(frame, capture_time):
+        # Add timestamp to the frame
+        elapsed_time = capture_time - start_timestamp
+        timestamp_str = f"Time: {elapsed_time:.2f}s"
+        cv2.putText(frame, timestamp_str, (10, 30), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
     
-    # Create VideoWriter object
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # MP4 codec
-    out = cv2.VideoWriter(video_path, fourcc, actual_fps, (actual_width, actual_height))
+    # Each camera gets its own capture/encode pipeline
+    pipelines = []
+    for position, camera_index in enumerate(CAMERA_INDICES):
+        pipeline = start_camera_recording(
+            camera_index,
+            os.path.join(DATA_DIR, camera_video_basename(position, camera_index)),
+            CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS,
+            recording_mode=RECORDING_MODE,
+            queue_size=FRAME_QUEUE_SIZE,
+            drop_policy=FRAME_DROP_POLICY,
+            annotate=annotate if TIMESTAMP_OVERLAY else None)
+        if pipeline:
+            pipelines.append(pipeline)
     
-    if not out.isOpened():
-        print("Error: Could not create video writer")
-        cap.release()
+    # Check if any camera opened successfully
+    if not pipelines:
+        print("Error: Could not open any camera")
         running = False
         return
     
-    # Record frames until running is set to False
-    frame_count = 0
-    recording_start_time = time.time()
-    if start_timestamp is None:
-        start_timestamp = recording_start_time
-    
     try:
-        while running:
-            ret, frame = cap.read()
-            if not ret:
-                print("Error: Could not read frame")
-                # Try to recover
-                time.sleep(0.1)
-                continue
-                
-            # Add timestamp to the frame
-            elapsed_time = time.time() - start_timestamp
-            timestamp_str = f"Time: {elapsed_time:.2f}s"
-            cv2.putText(frame, timestamp_str, (10, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                
-            # Write the frame to the video file
-            out.write(frame)
-            frame_count += 1
-            
-            # Print status periodically
-            if frame_count % 300 == 0:
-                current_time = time.time()
-                elapsed = current_time - recording_start_time
-                actual_fps = frame_count / elapsed if elapsed > 0 else 0
-                print(f"Recording video: {frame_count} frames, {actual_fps:.1f} fps")
+        # Record frames until running is set to False
+        while running and any(pipeline.is_running() for pipeline in pipelines):
+            time.sleep(0.2)
     
     except Exception as e:
         print(f"Error in camera recording: {e}")
     
     finally:
         # Release everything when done
-        out.release()
-        cap.release()
-        print(f"Video recording stopped. Saved to {video_path}")
-        print(f"Recorded {frame_count} frames")
+        for pipeline in pipelines:
+            pipeline.stop()
+        camera_stats = [pipeline.stats() for pipeline in pipelines]
+        for stats in camera_stats:
+            print(f"Camera {stats['camera_index']}: saved {stats['encoded_frames']} frames to {stats['video_file']} "
+                  f"(captured {stats['captured_frames']}, dropped {stats['dropped_frames']}, "
+                  f"{stats['capture_fps']:.1f} fps)")
 
 def write_metadata():
     """Write metadata about the data collection session"""
-    global DATA_DIR, start_timestamp
+    global DATA_DIR, start_timestamp, camera_stats, action_recorder, schedule_info
     
     metadata_path = os.path.join(DATA_DIR, METADATA_FILENAME)
     
+    # Command timing precision, from the planned and actual send times of every command
+    command_timing = None
+    actions_path = os.path.join(DATA_DIR, ACTIONS_FILENAME)
+    if action_recorder and os.path.exists(actions_path):
+        _, actions = read_actions(actions_path)
+        command_timing = jitter_stats(actions['planned_time'], actions['command_time'],
+                                      actions['command_time'] + actions['round_trip'])
+        if command_timing:
+            # The mover lowers its send rate when acks slow down (see AdaptivePacer)
+            command_timing["send_rate_log"] = send_rate_log(actions['command_time'])
+    
     end_time = datetime.datetime.now()
     duration = None
     if start_timestamp:
@@ -148,11 +164,18 @@ def write_metadata():
         "end_time": end_time.isoformat(),
         "duration_seconds": duration,
         "camera": {
-            "index": CAMERA_INDEX,
+            "indices": CAMERA_INDICES,
             "width": CAMERA_WIDTH,
             "height": CAMERA_HEIGHT,
             "fps": CAMERA_FPS
         },
+        "cameras": camera_stats,
+        "actions": {
+            "file": ACTIONS_FILENAME,
+            "records": action_recorder.count
+        } if action_recorder else None,
+        "command_timing": command_timing,
+        "movement_schedule": schedule_info,
         "notes": "This data collection only includes video. Gyroscope and accelerometer data collection requires instrumenting the Sphero SDK."
     }
     
@@ -161,23 +184,43 @@ def write_metadata():
         
     print(f"Metadata written to {metadata_path}")
 
+def prepare_movement_schedule():
+    """Save this run's movement schedule to the run directory and return its path"""
+    global schedule_info
+    
+    if MOVEMENT_SCHEDULE:
+        commands, schedule_info = load_schedule(MOVEMENT_SCHEDULE)
+    else:
+        commands, schedule_info = generate_schedule(MOVEMENT_POLICY, MOVEMENT_SEED)
+    
+    path = os.path.join(DATA_DIR, SCHEDULE_FILENAME)
+    save_schedule(path, commands, schedule_info)
+    print(f"Movement schedule: {schedule_info['policy']}, seed {schedule_info['seed']}")
+    return path
+
 def run_sphero_movement():
-    """Launch unlimited_move.py as a subprocess"""
+    """Launch unlimited_move.py as a subprocess and record its movement commands"""
+    global action_recorder
+    
+    schedule_path = prepare_movement_schedule()
+    
     print("Starting unlimited_move.py in a separate process...")
+    process = None
+    collector_sock, mover_sock = create_action_channel()
     try:
-        # Launch unlimited_move.py as a separate process
-        process = subprocess.Popen([sys.executable, "unlimited_move.py"], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.STDOUT,
-                                   universal_newlines=True,
-                                   bufsize=1)
+        action_recorder = ActionRecorder(collector_sock, os.path.join(DATA_DIR, ACTIONS_FILENAME))
+        action_recorder.start()
+        
+        # Launch unlimited_move.py as a separate process. Its output goes straight
+        # to the terminal; the commands arrive as records on the action channel
+        env = dict(os.environ, **{ACTION_FD_ENV: str(mover_sock.fileno())})
+        process = subprocess.Popen([sys.executable, "unlimited_move.py", "--schedule", schedule_path],
+                                   pass_fds=(mover_sock.fileno(),),
+                                   env=env)
+        mover_sock.close()
         
         print("Sphero movement script started (PID: {})".format(process.pid))
         
-        # Monitor the subprocess output
-        for line in process.stdout:
-            print(f"[Sphero] {line.strip()}")
-            
         # Process completed
         return_code = process.wait()
         print(f"Sphero movement script exited with code {return_code}")
@@ -185,6 +228,8 @@ def run_sphero_movement():
     except Exception as e:
         print(f"Error running unlimited_move.py: {e}")
     finally:
+        mover_sock.close()
+        
         # If we get here and the process is still running, terminate it
         if process and process.poll() is None:
             print("Terminating Sphero movement script...")
@@ -193,6 +238,10 @@ def run_sphero_movement():
                 process.wait(timeout=5)
             except subprocess.TimeoutExpired:
                 process.kill()
+        
+        if action_recorder:
+            action_recorder.stop()
+            print(f"Recorded {action_recorder.count} movement commands to {ACTIONS_FILENAME}")
 
 def main():
     """Main function to run unlimited_move.py and collect data"""
@@ -229,7 +278,8 @@ def main():
     
     # Wait for threads to finish
     print("Waiting for data collection to complete...")
-    camera_thread.join(timeout=5)
+    # No timeout: each pipeline.stop() is bounded, and the camera stats must be in before the metadata
+    camera_thread.join()
     
     # Write metadata
     write_metadata()
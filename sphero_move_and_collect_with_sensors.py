@@ -5,66 +5,117 @@ Sphero Data Collection Script with Video Recording
 This script continuously collects sensor data from Sphero while periodically
 sending movement commands. It also records video from a USB camera throughout 
 the process.
+
+All periodic work (movement, keep-alive, backups, status) runs as deadline
+scheduled tasks on one asyncio event loop (collector_runtime.py); blocking BLE
+and file calls run on small bounded executors.
+
+By default video is recorded in a child process (camera_process.py) so that
+encoding does not compete with the BLE receiver for the GIL. The achieved
+sensor sample rate is stored in metadata.json to check this.
+
+Movement plays a precomputed schedule (movement_schedule.py), saved to the run
+directory as movement_schedule.npz so the run's motion can be replayed. With
+ARENA_CONTROL the streamed Locator/Velocity override it near the walls of a
+virtual arena (arena_controller.py).
 """
 
 import os
 import time
-import signal
+import asyncio
 import datetime
+import functools
 import threading
 import csv
 import cv2
 import json
 import sys
-import random
 from pysphero.core import Sphero
 from pysphero.driving import Direction
-from pysphero.device_api.sensor import Accelerometer, Gyroscope
+from pysphero.device_api.sensor import Accelerometer, Gyroscope, Locator, Velocity
+from arena_controller import ArenaController, reset_position
+from ble_controllers import adapter_for, connect_entry, connect_stats, first_command
+from camera_pipeline import start_camera_recording, DROP_OLDEST
+from ball_tracker import LiveBallTracker
+from camera_process import CameraProcess
+from collector_runtime import CollectorRuntime, sample_rate_stats
+from command_scheduler import AdaptivePacer, CommandScheduler
+from connection_gaps import GapLog, ReconnectBackoff, close_in_background, watch_stream
+from led_sync import flash_sync_code
+from movement_schedule import SchedulePlayer, generate_schedule, load_schedule, save_schedule
+from startup import StartupTimer, wait_until_ready
 
 # Sphero MAC address - same as in unlimited_move.py
 MAC_ADDRESS = "C9:B9:61:72:CB:78"
+BLE_CONTROLLER = None  # Bluetooth controller to connect through, e.g. "hci1" (None: pysphero's default, hci0)
 
 # Camera settings
-CAMERA_INDEX = 0
+CAMERA_INDICES = [0]  # e.g. [0, 2] to record overhead and side views in the same run
 CAMERA_WIDTH = 640
 CAMERA_HEIGHT = 480
 CAMERA_FPS = 30
+FRAME_QUEUE_SIZE = 60  # Frames buffered between capture and encoding
+FRAME_DROP_POLICY = DROP_OLDEST  # DROP_OLDEST or BLOCK when the encoder falls behind
+TIMESTAMP_OVERLAY = False  # Burn "Time: ..." into frames (timing is always saved to the sidecar)
+LIVE_BALL_TRACKING = False  # Track the ball on the first camera while recording (see ball_tracker.py)
+RECORDING_MODE = "encode"  # "encode" (re-encode, codec from test_camera.py --benchmark) or "mjpeg" (store the camera's MJPEG as-is)
+CAMERA_PROCESS = True  # Record video in a child process (False: threads in this process)
+LED_SYNC = True  # Flash a sync code on the Sphero's LEDs at start and end (see led_sync.py)
+LED_SYNC_METHOD = "matrix"  # "matrix" (BOLT LED matrix) or "leds" (front/back LEDs)
+LED_SYNC_END_TIMEOUT = 10  # Seconds the cameras keep recording after stop while the end code flashes
+LED_SYNC_START_TIMEOUT = 15  # Seconds the start code waits for the cameras, which open concurrently
 
 # Data collection settings
 SENSOR_FREQUENCY = 20  # Hz
 SENSOR_INTERVAL = int(1000 / SENSOR_FREQUENCY)  # Convert to milliseconds for PySphero API
 DATA_DIR = "collected_data"
-VIDEO_FILENAME = "video.mp4"
+VIDEO_BASENAME = "video"  # Extension depends on the codec, e.g. video.mp4
 SENSOR_FILENAME = "sensor_data.csv"
 BACKUP_SENSOR_FILENAME = "backup_sensor_data.csv"
 METADATA_FILENAME = "metadata.json"
+GAPS_FILENAME = "gaps.csv"
+SCHEDULE_FILENAME = "movement_schedule.npz"
 
 # Movement settings
 MOVEMENT_INTERVAL = 0.5  # Send movement commands every 0.5 seconds
-MAX_SPEED = 255  # Maximum speed value for Sphero
+MOVEMENT_POLICY = "random_walk"  # "random_walk", "spiral" or "coverage_sweep" (see movement_schedule.py)
+MOVEMENT_SEED = None  # None draws a seed; it is saved with the schedule either way
+MOVEMENT_SCHEDULE = None  # Path to a saved schedule (e.g. an earlier run's movement_schedule.npz) to replay instead
+ARENA_CONTROL = True  # Steer away from the walls of a virtual arena (see arena_controller.py)
+ARENA_SIZE_CM = (200, 200)  # Width (x) and depth (y) of the arena, centred on the start position
+
+# Runtime settings
+KEEP_ALIVE_INTERVAL = 10  # Seconds between battery checks
+BACKUP_INTERVAL = 30  # Seconds between sensor data backups
+STATUS_INTERVAL = 10  # Seconds between status lines
+MAX_RECONNECTS = 20  # Consecutive failed attempts; the delay between them backs off from 50 ms to 5 s
 
 # Global variables
-running = True
-data_lock = threading.Lock()
+runtime = None  # CollectorRuntime of this run
+run_started = None
+startup = None  # StartupTimer of this run, see startup.py
+data_lock = threading.Lock()  # The sensor callback runs on pysphero's notify thread
 sensor_data = []
 start_timestamp = None
-camera_thread = None
-backup_thread = None
+last_sample_time = None  # time.monotonic() of the newest sample
+gap_log = None  # GapLog of this run's gaps.csv
 csv_file = None
 csv_writer = None
 data_points_counter = 0
 movement_active = True  # Flag to enable/disable movement
-
-def signal_handler(sig, frame):
-    """Handle Ctrl+C to gracefully stop data collection and Sphero movement"""
-    global running
-    
-    if not running:  # If Ctrl+C is pressed twice
-        print("\nForce exiting...")
-        os._exit(1)
-        
-    print("\nStopping data collection and Sphero movement...")
-    running = False
+movement_commands = 0
+command_scheduler = CommandScheduler(pacer=AdaptivePacer(max_rate=1 / MOVEMENT_INTERVAL))  # Deadlines come from the movement schedule
+schedule_player = None  # SchedulePlayer of this run's movement schedule
+arena_controller = None  # ArenaController when ARENA_CONTROL is on
+position_reset = False  # Yaw and locator are zeroed once, on the first connection
+reconnect_count = 0
+connect_log = []  # Connect and connect-to-first-command times, see ble_controllers.py
+camera_stats = []
+ball_tracker = None  # LiveBallTracker when LIVE_BALL_TRACKING is on
+camera_process = None  # CameraProcess when CAMERA_PROCESS is on
+led_sync_events = {"start": None, "end": None}
+led_sync_done = None  # asyncio.Event, set once the end code has been flashed (or cannot be)
+camera_started = None  # asyncio.Event, set once the cameras are recording (or failed to open)
 
 def ensure_data_dir():
     """Create a timestamped directory for this run's data"""
@@ -90,9 +141,11 @@ def ensure_data_dir():
     
     # Write header
     csv_writer.writerow([
-        'timestamp',
+        'timestamp', 'monotonic_time',
         'accel_x', 'accel_y', 'accel_z',
-        'gyro_x', 'gyro_y', 'gyro_z'
+        'gyro_x', 'gyro_y', 'gyro_z',
+        'locator_x', 'locator_y',
+        'velocity_x', 'velocity_y'
     ])
     
     # Ensure data is written to disk
@@ -100,17 +153,34 @@ def ensure_data_dir():
     
     print(f"Initialized sensor data file: {sensor_path}")
     
+    # Connection losses are recorded here, so the run continues with known holes
+    global gap_log
+    gap_log = GapLog(os.path.join(DATA_DIR, GAPS_FILENAME))
+    
     return DATA_DIR
 
 def sensor_callback(response):
     """Process sensor data received from Sphero and write to file in real-time"""
-    global sensor_data, start_timestamp, csv_writer, data_points_counter
+    global sensor_data, start_timestamp, csv_writer, data_points_counter, last_sample_time
     
-    # Get current timestamp relative to start
+    # Get current timestamp relative to start, plus the monotonic time shared
+    # with the video frame timestamps
     current_time = time.time()
+    monotonic_time = time.monotonic()
     if start_timestamp is None:
         start_timestamp = current_time
-        print("First sensor data received! Starting timing from here.")
+        gap_log.run_start = monotonic_time
+        startup.mark("first_sample", monotonic_time)
+        print(f"First sensor data received {startup.elapsed_ms('first_sample'):.0f}ms after start! "
+              f"Starting timing from here.")
+        if camera_process:
+            camera_process.set_run_start(start_timestamp)
+    
+    # The first sample after a reconnect ends the gap
+    last_sample_time = monotonic_time
+    if gap_log.is_open:
+        gap_log.close(monotonic_time)
+        print(f"Sensor data resumed after {gap_log.gaps[-1]['duration']:.2f}s gap")
     
     relative_timestamp = current_time - start_timestamp
     
@@ -119,6 +189,7 @@ def sensor_callback(response):
         # Initialize variables with default values
         accel_x = accel_y = accel_z = 0.0
         gyro_x = gyro_y = gyro_z = 0.0
+        locator_x = locator_y = velocity_x = velocity_y = 0.0
         
         # Extract values from the response dict
         if isinstance(response, dict):
@@ -137,12 +208,27 @@ def sensor_callback(response):
                     gyro_y = value
                 elif "Gyroscope" in sensor_str and ".z" in sensor_str:
                     gyro_z = value
+                elif "Locator" in sensor_str and ".x" in sensor_str:
+                    locator_x = value
+                elif "Locator" in sensor_str and ".y" in sensor_str:
+                    locator_y = value
+                elif "Velocity" in sensor_str and ".x" in sensor_str:
+                    velocity_x = value
+                elif "Velocity" in sensor_str and ".y" in sensor_str:
+                    velocity_y = value
+        
+        # Hand position and velocity to the controller first, it is latency sensitive
+        if arena_controller:
+            arena_controller.on_sample(locator_x, locator_y, velocity_x, velocity_y, monotonic_time)
                     
         # Create data row
         data_row = [
             relative_timestamp,
+            monotonic_time,
             accel_x, accel_y, accel_z,
-            gyro_x, gyro_y, gyro_z
+            gyro_x, gyro_y, gyro_z,
+            locator_x, locator_y,
+            velocity_x, velocity_y
         ]
         
         # Add to data list with thread-safe lock and write to CSV in real-time
@@ -166,120 +252,164 @@ def sensor_callback(response):
     except Exception as e:
         print(f"Error processing sensor data: {e}")
 
-def camera_recording_thread():
-    """Thread for video recording"""
-    global running, DATA_DIR, start_timestamp
+def camera_video_basename(position, camera_index):
+    """Video file name (without extension) for a camera; the first camera keeps the plain name"""
+    if position == 0:
+        return VIDEO_BASENAME
+    return f"{VIDEO_BASENAME}_cam{camera_index}"
+
+def start_camera_threads():
+    """Start one capture/encode pipeline per camera in this process. Returns the pipelines."""
+    global ball_tracker
+    
+    def annotate(frame, capture_time):
+        # Add timestamp overlay
+        timestamp = capture_time - start_timestamp if start_timestamp else 0
+        cv2.putText(frame, f"Time: {timestamp:.3f}s", (10, 30), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    
+    # Each camera gets its own capture/encode pipeline
+    pipelines = []
+    for position, camera_index in enumerate(CAMERA_INDICES):
+        pipeline = start_camera_recording(
+            camera_index,
+            os.path.join(DATA_DIR, camera_video_basename(position, camera_index)),
+            CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS,
+            recording_mode=RECORDING_MODE,
+            queue_size=FRAME_QUEUE_SIZE,
+            drop_policy=FRAME_DROP_POLICY,
+            annotate=annotate if TIMESTAMP_OVERLAY else None)
+        if pipeline:
+            pipelines.append(pipeline)
+    
+    if pipelines and LIVE_BALL_TRACKING:
+        ball_tracker = LiveBallTracker(pipelines[0])
+        ball_tracker.start()
+    
+    return pipelines
+
+def stop_camera_threads(pipelines):
+    """Stop the in-process pipelines and return their stats"""
+    if ball_tracker:
+        ball_tracker.stop()
+    for pipeline in pipelines:
+        pipeline.stop()
+    return [pipeline.stats() for pipeline in pipelines]
+
+async def camera_task(runtime):
+    """Record video from all cameras until the run stops"""
+    global camera_stats, camera_process
     
     try:
-        # Initialize camera
-        cap = cv2.VideoCapture(CAMERA_INDEX)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
-        cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+        if CAMERA_PROCESS:
+            cameras = [(camera_index, os.path.join(DATA_DIR, camera_video_basename(position, camera_index)))
+                       for position, camera_index in enumerate(CAMERA_INDICES)]
+            camera_process = CameraProcess(
+                cameras, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS,
+                recording_mode=RECORDING_MODE,
+                queue_size=FRAME_QUEUE_SIZE,
+                drop_policy=FRAME_DROP_POLICY,
+                timestamp_overlay=TIMESTAMP_OVERLAY,
+                live_ball_tracking=LIVE_BALL_TRACKING)
+            opened = await runtime.io(camera_process.start)
+            if opened:
+                print(f"Camera process started (PID: {camera_process.pid})")
+            is_recording = camera_process.is_running
+        else:
+            pipelines = await runtime.io(start_camera_threads)
+            opened = pipelines
+            is_recording = lambda: any(pipeline.is_running() for pipeline in pipelines)
+        if opened:
+            startup.mark("camera_ready")
+        camera_started.set()
         
-        # Check if camera opened successfully
-        if not cap.isOpened():
-            print("Error: Could not open camera.")
-            running = False
+        # Check if any camera opened successfully
+        if not opened:
+            print("Error: Could not open any camera.")
+            runtime.stop()
+            if camera_process:
+                await runtime.io(camera_process.stop)
             return
         
-        # Get actual camera properties
-        actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        actual_fps = cap.get(cv2.CAP_PROP_FPS)
-        print(f"Camera initialized with resolution: {actual_width}x{actual_height} @ {actual_fps}fps")
-        
-        # Define the codec and create VideoWriter object
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        video_path = os.path.join(DATA_DIR, VIDEO_FILENAME)
-        out = cv2.VideoWriter(video_path, fourcc, actual_fps, (actual_width, actual_height))
-        
-        frame_count = 0
-        last_report_time = time.time()
+        # Record until the run stops or every camera fails
+        while runtime.running and is_recording():
+            await runtime.sleep(1.0)
         
-        # Loop until running is False
-        while running:
-            ret, frame = cap.read()
-            if not ret:
-                print("Error: Failed to capture image")
-                time.sleep(0.1)
-                continue
-                
-            # Add timestamp overlay
-            timestamp = time.time() - start_timestamp if start_timestamp else 0
-            cv2.putText(frame, f"Time: {timestamp:.3f}s", (10, 30), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            
-            # Write the frame to video file
-            out.write(frame)
-            
-            frame_count += 1
-            
-            # Periodically report recording progress
-            if frame_count % 300 == 0:
-                current_time = time.time()
-                elapsed = current_time - last_report_time
-                fps = 300 / elapsed if elapsed > 0 else 0
-                print(f"Recording video: {frame_count} frames, {fps:.1f} fps")
-                last_report_time = current_time
-                
-            # Small sleep to prevent maxing out CPU
-            time.sleep(0.01)
+        # Keep recording while the end sync code flashes
+        if LED_SYNC:
+            try:
+                await asyncio.wait_for(led_sync_done.wait(), LED_SYNC_END_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
         
         # Release everything when done
-        cap.release()
-        out.release()
-        print(f"Video recording stopped. Saved to {video_path}")
-        print(f"Recorded {frame_count} frames")
+        if CAMERA_PROCESS:
+            camera_stats = await runtime.io(camera_process.stop)
+        else:
+            camera_stats = await runtime.io(stop_camera_threads, pipelines)
+        for stats in camera_stats:
+            print(f"Camera {stats['camera_index']}: saved {stats['encoded_frames']} frames to {stats['video_file']} "
+                  f"(captured {stats['captured_frames']}, dropped {stats['dropped_frames']}, "
+                  f"{stats['capture_fps']:.1f} fps)")
         
     except Exception as e:
         print(f"Error in video recording: {e}")
-        running = False
+        camera_started.set()
+        runtime.stop()
 
-def backup_sensor_data_thread():
-    """Periodically save sensor data to prevent data loss in case of crash"""
-    global running, sensor_data, DATA_DIR
+def sensor_rate_stats():
+    """Achieved sensor sample rate, from the monotonic times of the collected samples"""
+    with data_lock:
+        times = [row[1] for row in sensor_data]
+    stats = sample_rate_stats(times, SENSOR_FREQUENCY)
+    if stats:
+        stats["video_in_child_process"] = CAMERA_PROCESS
+    return stats
+
+def write_sensor_backup(rows):
+    """Write a full copy of the sensor data collected so far"""
+    backup_path = os.path.join(DATA_DIR, BACKUP_SENSOR_FILENAME)
     
-    while running:
-        try:
-            # Sleep for 30 seconds, checking running flag every second
-            for _ in range(30):
-                if not running:
-                    break
-                time.sleep(1)
-            
-            if not running:
-                break
-                
-            # Make a copy of current data with lock
-            with data_lock:
-                data_copy = sensor_data.copy()
-            
-            # Only write if we have data
-            if len(data_copy) > 0:
-                backup_path = os.path.join(DATA_DIR, BACKUP_SENSOR_FILENAME)
-                
-                with open(backup_path, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    
-                    # Write header
-                    writer.writerow([
-                        'timestamp',
-                        'accel_x', 'accel_y', 'accel_z',
-                        'gyro_x', 'gyro_y', 'gyro_z'
-                    ])
-                    
-                    # Write data
-                    for row in data_copy:
-                        writer.writerow(row)
-                
-                print(f"Backup saved: {len(data_copy)} data points")
-        except Exception as e:
-            print(f"Error saving backup: {e}")
+    with open(backup_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        
+        # Write header
+        writer.writerow([
+            'timestamp', 'monotonic_time',
+            'accel_x', 'accel_y', 'accel_z',
+            'gyro_x', 'gyro_y', 'gyro_z',
+            'locator_x', 'locator_y',
+            'velocity_x', 'velocity_y'
+        ])
+        
+        # Write data
+        writer.writerows(rows)
+    
+    print(f"Backup saved: {len(rows)} data points")
+
+async def backup_sensor_data(runtime):
+    """Periodically save sensor data to prevent data loss in case of crash"""
+    try:
+        # Make a copy of current data with lock
+        with data_lock:
+            data_copy = sensor_data.copy()
+        
+        # Only write if we have data
+        if len(data_copy) > 0:
+            await runtime.io(write_sensor_backup, data_copy)
+    except Exception as e:
+        print(f"Error saving backup: {e}")
 
 def write_metadata():
     """Write metadata about the data collection"""
-    global DATA_DIR, start_timestamp, sensor_data
+    global DATA_DIR, start_timestamp, sensor_data, camera_stats, ball_tracker
+    
+    # Live tracking runs wherever the cameras run
+    frames_tracked = None
+    if ball_tracker:
+        frames_tracked = ball_tracker.frames_tracked
+    elif camera_process and camera_process.final:
+        frames_tracked = camera_process.final["frames_tracked"]
     
     metadata = {
         "version": "1.0",
@@ -287,16 +417,36 @@ def write_metadata():
         "collection_end": datetime.datetime.now().isoformat(),
         "duration_seconds": time.time() - start_timestamp if start_timestamp else None,
         "camera_settings": {
+            "indices": CAMERA_INDICES,
             "width": CAMERA_WIDTH,
             "height": CAMERA_HEIGHT,
             "fps": CAMERA_FPS
         },
+        "cameras": camera_stats,
+        "live_ball_tracking": {
+            "frames_tracked": frames_tracked
+        } if frames_tracked is not None else None,
+        "camera_process": {
+            "pid": camera_process.pid,
+            "status_messages": camera_process.status_messages
+        } if camera_process else None,
+        "led_sync": led_sync_events if LED_SYNC else None,
         "sensor_settings": {
             "frequency_hz": SENSOR_FREQUENCY,
             "continuous_collection": True,
-            "movement_interval": MOVEMENT_INTERVAL
+            "movement_interval": MOVEMENT_INTERVAL,
+            "ble_controller": BLE_CONTROLLER or "default"
         },
-        "sensor_samples": len(sensor_data)
+        "sensor_samples": len(sensor_data),
+        "sensor_rate": sensor_rate_stats(),
+        "task_timing": runtime.timing_stats() if runtime else None,
+        "command_timing": command_scheduler.stats(),
+        "movement_schedule": schedule_player.stats() if schedule_player else None,
+        "arena_control": arena_controller.stats() if arena_controller else None,
+        "connect_timing": connect_stats(connect_log),
+        "reconnects": reconnect_count,
+        "gaps": gap_log.stats() if gap_log else None,
+        "startup": startup.stats() if startup else None
     }
     
     metadata_path = os.path.join(DATA_DIR, METADATA_FILENAME)
@@ -305,199 +455,266 @@ def write_metadata():
     
     print(f"Metadata written to {metadata_path}")
 
-def movement_thread(sphero_instance):
-    """Thread for sending movement commands periodically"""
-    global running, movement_active
+def prepare_movement_schedule():
+    """Load or generate this run's movement schedule and save it to the run directory"""
+    global schedule_player
+    
+    if MOVEMENT_SCHEDULE:
+        commands, info = load_schedule(MOVEMENT_SCHEDULE)
+    else:
+        commands, info = generate_schedule(MOVEMENT_POLICY, MOVEMENT_SEED, period=MOVEMENT_INTERVAL)
+    
+    save_schedule(os.path.join(DATA_DIR, SCHEDULE_FILENAME), commands, info)
+    schedule_player = SchedulePlayer(commands, info, command_scheduler)
+    print(f"Movement schedule: {info['policy']}, seed {info['seed']}, {info['commands']} commands")
+
+def send_movement(sphero_instance, command):
+    """Send one movement command from the schedule"""
+    global movement_commands
     
-    print("Starting continuous movement thread...")
+    speed = int(command['speed'])
+    heading = int(command['heading'])
+    direction = Direction.reverse if command['direction'] else Direction.forward
     
-    # Initialize variables for movement control
-    last_movement_time = time.time()
-    commands_sent = 0
-    last_status_time = time.time()
+    # Send the command
+    sphero_instance.driving.drive_with_heading(speed, heading, direction)
+    movement_commands += 1
     
-    # Continue until running is False
-    while running:
+    # Log the command
+    if movement_commands <= 5 or movement_commands % 10 == 0:
+        print(f"Movement command: heading={heading}°, speed={speed}")
+
+async def movement_task(runtime, sphero_instance, connection=None):
+    """Play the movement schedule, each command on its deadline. The schedule
+    starts at the first connection; commands that fell due while reconnecting
+    or were held back by the pacer are skipped"""
+    print("Starting continuous movement...")
+    command = schedule_player.next_command(command_scheduler.earliest_send())
+    
+    while command is not None and await runtime.sleep(command_scheduler.delay()):
+        # The arena controller has the robot while it steers away from a wall
+        if movement_active and not (arena_controller and arena_controller.steering):
+            started = time.monotonic()
+            try:
+                await runtime.ble(send_movement, sphero_instance, command)
+                completed = time.monotonic()
+                command_scheduler.record(started, completed)
+                first_command(connection, completed)
+                startup.mark("first_command", completed)
+            except Exception as e:
+                # Don't stop moving, just log, back off and continue
+                print(f"Error sending movement command: {e}")
+                command_scheduler.failed(started)
+        
+        command = schedule_player.next_command(command_scheduler.earliest_send())
+    
+    print(f"Movement stopped. Sent {movement_commands} commands.")
+
+def drive(sphero_instance, speed, heading):
+    """Steering command from the arena controller"""
+    sphero_instance.driving.drive_with_heading(speed, heading, Direction.forward)
+
+async def keep_alive_task(runtime, sphero_instance):
+    """Check the connection with a battery request; raises ConnectionError when it is lost"""
+    consecutive_errors = 0
+    max_errors = 5
+    
+    async def check():
+        nonlocal consecutive_errors
         try:
-            # Check if movement is active
-            if not movement_active:
-                time.sleep(0.1)
-                continue
-                
-            current_time = time.time()
-            
-            # Send movement command at interval
-            if current_time - last_movement_time >= MOVEMENT_INTERVAL:
-                # Random movement parameters
-                speed = random.randint(100, MAX_SPEED)
-                heading = random.randint(0, 359)
-                
-                # Send the command
-                sphero_instance.driving.drive_with_heading(speed, heading, Direction.forward)
-                commands_sent += 1
-                
-                # Log the command
-                if commands_sent <= 5 or commands_sent % 10 == 0:
-                    print(f"Movement command: heading={heading}°, speed={speed}")
-                
-                last_movement_time = current_time
-            
-            # Print status periodically
-            if current_time - last_status_time >= 10:
-                elapsed = int(current_time - time.time() + running_time)
-                minutes, seconds = divmod(elapsed, 60)
-                cmd_rate = commands_sent / elapsed if elapsed > 0 else 0
-                print(f"Running for {minutes}m {seconds}s - Movement commands: {commands_sent} ({cmd_rate:.1f}/sec)")
-                last_status_time = current_time
-            
-            # Small sleep to prevent maxing out CPU
-            time.sleep(0.05)
-            
+            battery = await runtime.ble(sphero_instance.power.get_battery_voltage)
+            consecutive_errors = 0  # Reset error counter on success
+            print(f"Sphero battery: {battery:.2f}V - Data points: {len(sensor_data)}")
         except Exception as e:
-            print(f"Error in movement thread: {e}")
-            # Don't crash the thread, just log and continue
-            time.sleep(1)
+            consecutive_errors += 1
+            print(f"Warning: Battery check failed: {e}")
+            if consecutive_errors >= max_errors:
+                raise ConnectionError(f"Too many consecutive errors ({consecutive_errors})")
     
-    print(f"Movement thread stopped. Sent {commands_sent} commands.")
+    await runtime.every("keep_alive", KEEP_ALIVE_INTERVAL, check)
+
+def print_status():
+    """Print run time and command rate"""
+    elapsed = int(time.time() - run_started)
+    minutes, seconds = divmod(elapsed, 60)
+    cmd_rate = movement_commands / elapsed if elapsed > 0 else 0
+    print(f"Running for {minutes}m {seconds}s - Movement commands: {movement_commands} ({cmd_rate:.1f}/sec)")
+
+async def flash_end_sync(runtime, sphero):
+    """Flash the end sync code while the cameras still record"""
+    try:
+        await runtime.ble(sphero.driving.drive_with_heading, 0, 0, Direction.forward)
+        print("Flashing LED sync code...")
+        led_sync_events["end"] = await runtime.ble(flash_sync_code, sphero, method=LED_SYNC_METHOD)
+    except Exception as e:
+        print(f"Warning: End LED sync failed: {e}")
+    finally:
+        led_sync_done.set()
 
-def run_sensor_and_movement():
+async def sphero_task(runtime):
     """
-    Main function that continuously collects sensor data and periodically sends
-    movement commands.
+    Connect to the Sphero, stream sensor data and send movement commands,
+    reconnecting on failure. A reconnect restores the same sensor stream and
+    continues the movement schedule where the run's clock has got to; the
+    missing stretch is recorded in gaps.csv.
     """
-    global running, start_timestamp, movement_active, running_time
-    
-    # Running time tracker
-    running_time = time.time()
-    
+    global position_reset, reconnect_count
     print("Starting continuous data collection and movement...")
     print(f"Sensor frequency: {SENSOR_FREQUENCY} Hz, Movement interval: {MOVEMENT_INTERVAL} sec")
     print("Press Ctrl+C to stop")
     
-    # Main loop - reconnect on failure
-    reconnect_count = 0
-    max_reconnects = 10
+    # Main loop - reconnect on failure, quickly at first
+    backoff = ReconnectBackoff()
     
-    while running and reconnect_count < max_reconnects:
+    while runtime.running and backoff.attempt < MAX_RECONNECTS:
+        sphero = None
+        lost = False
         try:
-            # Use context manager to properly handle connection
+            # Enter the context manager on the BLE executor so the loop never blocks
             print(f"Connecting to Sphero...")
-            with Sphero(mac_address=MAC_ADDRESS) as sphero:
-                print("Connected! Waking up Sphero...")
-                sphero.power.wake()
-                time.sleep(1.0)  # Give more time to wake up
-                
-                # Set up sensor streaming IMMEDIATELY to get data from the start
-                print(f"Setting up sensor streaming at {SENSOR_FREQUENCY}Hz...")
-                sphero.sensor.set_notify(
-                    sensor_callback,
-                    Accelerometer, 
-                    Gyroscope,
-                    interval=SENSOR_INTERVAL
-                )
-                
-                print("Sensor streaming active. Starting movement...")
-                
-                # Start movement in a separate thread
-                move_thread = threading.Thread(target=movement_thread, args=(sphero,))
-                move_thread.daemon = True
-                move_thread.start()
-                
-                # Main thread just keeps the connection alive and monitors
-                last_status_time = time.time()
-                consecutive_errors = 0
-                max_errors = 5
-                
-                while running:
-                    try:
-                        # Periodically keep connection alive with a simple command
-                        current_time = time.time()
-                        
-                        # Check for any potential issues every 10 seconds
-                        if current_time - last_status_time >= 10:
-                            # Get battery level as a simple keep-alive command
-                            try:
-                                battery = sphero.power.get_battery_voltage()
-                                consecutive_errors = 0  # Reset error counter on success
-                                print(f"Sphero battery: {battery:.2f}V - Data points: {len(sensor_data)}")
-                            except Exception as e:
-                                consecutive_errors += 1
-                                print(f"Warning: Battery check failed: {e}")
-                                if consecutive_errors >= max_errors:
-                                    print(f"Too many consecutive errors ({consecutive_errors}). Reconnecting...")
-                                    break
-                                
-                            last_status_time = current_time
-                            
-                        time.sleep(1.0)  # Check status periodically
-                        
-                    except Exception as connection_e:
-                        print(f"Connection monitor error: {connection_e}")
-                        consecutive_errors += 1
-                        if consecutive_errors >= max_errors:
-                            print(f"Too many consecutive errors ({consecutive_errors}). Reconnecting...")
-                            break
-                        time.sleep(1.0)
-                
-                print("Sphero connection closed.")
-                
+            sphero = Sphero(mac_address=MAC_ADDRESS, ble_adapter_cls=adapter_for(BLE_CONTROLLER))
+            connect_started = time.monotonic()
+            await runtime.ble(sphero.__enter__)
+            connection = connect_entry(sphero, connect_started)
+            connect_log.append(connection)
+            startup.mark("connected")
+            print(f"Connected in {connection['connect_ms']:.0f}ms ({connection['handles']} handles)! Waking up Sphero...")
+            await runtime.ble(sphero.power.wake)
+            if not position_reset:
+                # Poll until the ball answers instead of sleeping (after a drop it is still awake)
+                ready = await runtime.ble(wait_until_ready, sphero)
+                connection["ready_ms"] = ready * 1000 if ready is not None else None
+                if ready is None:
+                    print("Warning: Sphero did not answer after waking up, continuing anyway")
+                else:
+                    print(f"Sphero ready after {ready * 1000:.0f}ms")
+            startup.mark("robot_ready")
+            
+            # Start position and heading become the arena origin; later reconnects keep them
+            if not position_reset:
+                await runtime.ble(reset_position, sphero)
+                position_reset = True
+            
+            # Set up sensor streaming IMMEDIATELY to get data from the start
+            print(f"Setting up sensor streaming at {SENSOR_FREQUENCY}Hz...")
+            await runtime.ble(sphero.sensor.set_notify, sensor_callback, Accelerometer, Gyroscope,
+                              Locator, Velocity, interval=SENSOR_INTERVAL)
+            startup.mark("streaming")
+            
+            # Sync code for the camera latency calibration, once per run
+            # The cameras open concurrently with the connection; the code must be on video
+            if LED_SYNC and led_sync_events["start"] is None:
+                try:
+                    await asyncio.wait_for(camera_started.wait(), LED_SYNC_START_TIMEOUT)
+                except asyncio.TimeoutError:
+                    pass
+                if "camera_ready" in startup.phases:
+                    print("Flashing LED sync code...")
+                    led_sync_events["start"] = await runtime.ble(flash_sync_code, sphero, method=LED_SYNC_METHOD)
+                else:
+                    print("Warning: cameras not recording yet, skipping the start LED sync code")
+            
+            print("Sensor streaming active. Starting movement...")
+            backoff.connected()
+            
+            # Move and monitor the connection until the run stops or the connection is lost
+            movement = asyncio.ensure_future(movement_task(runtime, sphero, connection))
+            tasks = [movement]
+            if arena_controller:
+                tasks.append(asyncio.ensure_future(arena_controller.run(runtime, functools.partial(drive, sphero))))
+            try:
+                # The stream watchdog notices a silent connection long before keep-alive requests fail
+                await runtime.first(keep_alive_task(runtime, sphero),
+                                    watch_stream(runtime, lambda: last_sample_time))
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            
+            # Stopping: flash the end sync code while the cameras still record
+            if LED_SYNC and led_sync_events["start"] and not led_sync_done.is_set():
+                await flash_end_sync(runtime, sphero)
+            
         except Exception as e:
             print(f"Connection error: {e}")
             reconnect_count += 1
+            lost = True
+            if last_sample_time is not None:
+                gap_log.open(str(e) or type(e).__name__, last_sample_time)
+        finally:
+            if sphero is not None and lost:
+                # Don't wait out the dead connection's pending request timeouts
+                close_in_background(sphero)
+                runtime.reset_ble()
+            elif sphero is not None:
+                try:
+                    await runtime.ble(sphero.__exit__, None, None, None)
+                except Exception as e:
+                    print(f"Error closing connection: {e}")
+                print("Sphero connection closed.")
         
         # Only retry if still running
-        if running:
-            print(f"Will retry in 5 seconds... (attempt {reconnect_count}/{max_reconnects})")
-            time.sleep(5)
+        if runtime.running:
+            delay = backoff.next_delay()
+            print(f"Will retry in {delay * 1000:.0f}ms... (attempt {backoff.attempt}/{MAX_RECONNECTS})")
+            await runtime.sleep(delay)
+    
+    if backoff.attempt >= MAX_RECONNECTS:
+        print(f"Maximum reconnect attempts ({MAX_RECONNECTS}) reached. Stopping.")
+
+async def collect(runtime):
+    """Run all collection tasks on one event loop until the run stops"""
+    global led_sync_done, camera_started, arena_controller
     
-    if reconnect_count >= max_reconnects:
-        print(f"Maximum reconnect attempts ({max_reconnects}) reached. Stopping.")
-        running = False
+    led_sync_done = asyncio.Event()
+    camera_started = asyncio.Event()
+    if ARENA_CONTROL:
+        arena_controller = ArenaController(ARENA_SIZE_CM[0] / 2, ARENA_SIZE_CM[1] / 2)
+    camera = asyncio.ensure_future(camera_task(runtime))
+    backup = asyncio.ensure_future(runtime.every("backup", BACKUP_INTERVAL, backup_sensor_data, runtime))
+    status = asyncio.ensure_future(runtime.every("status", STATUS_INTERVAL, print_status))
+    
+    try:
+        await sphero_task(runtime)
+    finally:
+        # Never keep the cameras waiting for an end code that cannot be flashed
+        runtime.stop()
+        led_sync_done.set()
+        await asyncio.gather(camera, backup, status, return_exceptions=True)
 
 def main():
     """Main function to initiate data collection and Sphero movement"""
-    global running, camera_thread, backup_thread, csv_file
+    global runtime, run_started, startup
     
-    # Set up signal handler for Ctrl+C
-    signal.signal(signal.SIGINT, signal_handler)
+    # Phases are timed from here; the camera and the connection then start concurrently
+    startup = StartupTimer()
     
     # Create data directory and initialize CSV file
     ensure_data_dir()
+    prepare_movement_schedule()
     
+    run_started = time.time()
+    runtime = CollectorRuntime()
     try:
-        # Start camera recording thread
-        camera_thread = threading.Thread(target=camera_recording_thread)
-        camera_thread.daemon = True
-        camera_thread.start()
-        
-        # Start sensor data backup thread
-        backup_thread = threading.Thread(target=backup_sensor_data_thread)
-        backup_thread.daemon = True
-        backup_thread.start()
-        
         # Run the continuous data collection and movement
-        run_sensor_and_movement()
+        runtime.run(collect(runtime))
         
     except KeyboardInterrupt:
-        running = False
+        pass
     except Exception as e:
         print(f"Main error: {e}")
-        running = False
     finally:
-        # Make sure running is set to False
-        running = False
-        
-        # Wait for threads to complete
-        print("Waiting for data collection to complete...")
-        if camera_thread and camera_thread.is_alive():
-            camera_thread.join(timeout=5)
-        
         # Close CSV file to ensure all data is written
         if csv_file:
-            csv_file.flush()
-            csv_file.close()
+            with data_lock:
+                csv_file.flush()
+                csv_file.close()
             print(f"Sensor data file closed. Wrote {len(sensor_data)} data points.")
         
+        # A gap still open when the run stopped goes on record too
+        if gap_log:
+            gap_log.finish()
+        
         # Write metadata
         write_metadata()
         
@@ -505,4 +722,4 @@ def main():
         print("Program terminated")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,81 @@
+"""
+Startup Readiness and Timing
+
+After power.wake() the scripts used to sleep for a fixed time (0.5 s in
+unlimited_move.py, 1 s in the collectors, 2 s in working.py) before
+streaming or driving. wait_until_ready() polls instead: it sends
+api_processor echo requests to the processor that handles driving and
+sensors (target 0x12), each with a short timeout, and returns as soon as
+one is answered. A robot that is already awake (e.g. after a reconnect)
+answers the first one.
+
+StartupTimer records when each startup phase completed, relative to the
+start of the run, for the "startup" entry of metadata.json:
+
+    camera_ready   the camera process/pipelines opened the cameras
+    connected      the first BLE connection is open
+    robot_ready    the robot answered the readiness probe
+    streaming      the sensor stream is set up
+    first_sample   the first sensor sample arrived: the time to first sample
+    first_command  the first movement command was acknowledged
+
+The camera and the BLE connection start concurrently, so camera_ready and
+connected overlap instead of adding up.
+
+Usage:
+    startup = StartupTimer()
+    sphero.power.wake()
+    ready_seconds = wait_until_ready(sphero)   # None if the robot never answered
+    startup.mark("robot_ready")
+    ...
+    metadata["startup"] = startup.stats()
+"""
+
+import time
+
+from pysphero.device_api.api_processor import ApiProcessorCommand
+from pysphero.exceptions import PySpheroTimeoutError
+
+READY_TIMEOUT = 3.0  # Seconds to wait for the robot to answer after wake()
+PROBE_TIMEOUT = 0.2  # Seconds per echo request
+PROBE_TARGET = 0x12  # Processor that handles driving and sensor commands
+STARTUP_PHASES = ["camera_ready", "connected", "robot_ready", "streaming", "first_sample", "first_command"]
+
+
+def wait_until_ready(sphero, timeout=READY_TIMEOUT, probe_timeout=PROBE_TIMEOUT):
+    """Poll the robot with echo requests until one is answered.
+
+    Returns the seconds it took, or None if no probe was answered within
+    timeout (the caller then carries on as it did after the fixed sleep).
+    """
+    started = time.monotonic()
+    while True:
+        try:
+            # Any answer, even an API error, means the processor is up
+            sphero.api_processor.request(ApiProcessorCommand.echo, target_id=PROBE_TARGET,
+                                         timeout=probe_timeout, raise_api_error=False)
+            return time.monotonic() - started
+        except PySpheroTimeoutError:
+            if time.monotonic() - started >= timeout:
+                return None
+
+
+class StartupTimer:
+    """Completion times of a run's startup phases"""
+
+    def __init__(self, started=None):
+        self.started = time.monotonic() if started is None else started
+        self.phases = {}  # Phase -> time.monotonic()
+
+    def mark(self, phase, when=None):
+        """Record that phase completed (only its first completion counts)"""
+        if phase not in self.phases:
+            self.phases[phase] = time.monotonic() if when is None else when
+
+    def elapsed_ms(self, phase):
+        when = self.phases.get(phase)
+        return (when - self.started) * 1000 if when is not None else None
+
+    def stats(self):
+        """Milliseconds from the run start to each phase, for metadata.json"""
+        return {f"{phase}_ms": self.elapsed_ms(phase) for phase in STARTUP_PHASES}
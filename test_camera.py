@@ -8,14 +8,24 @@ It verifies:
 2. Resolution and framerate settings work
 3. Video can be captured and saved
 
+With --benchmark it instead times every available video codec (mp4v, MJPG,
+XVID, raw) on synthetic and real frames at the configured resolution, and
+saves the fastest codec that sustains CAMERA_FPS to encoder_choice.json
+(compressed codecs are preferred over raw, see BENCHMARK_PREFER_COMPRESSED).
+The collectors pick that choice up automatically.
+
 Usage:
     python test_camera.py
+    python test_camera.py --benchmark
 """
 
 import cv2
 import time
 import os
 import sys
+import numpy as np
+from video_encoder import (CODECS, load_encoder_choice, open_video_writer,
+                           save_encoder_choice, video_filename)
 
 # Camera settings
 CAMERA_INDEX = 0
@@ -24,6 +34,12 @@ CAMERA_HEIGHT = 480
 CAMERA_FPS = 30
 TEST_DURATION = 5  # seconds
 
+# Benchmark settings
+BENCHMARK_FRAMES = 150  # Frames written per codec and frame source
+BENCHMARK_SOURCE_FRAMES = 30  # Distinct frames cycled through while writing
+BENCHMARK_HEADROOM = 1.2  # A codec must reach 1.2x CAMERA_FPS to count as sustaining it
+BENCHMARK_PREFER_COMPRESSED = True  # Only pick raw (~27MB/s at 640x480@30) if no codec sustains the target
+
 def test_camera():
     """Test if camera can be opened and capture video"""
     print(f"Testing camera at index {CAMERA_INDEX} with {CAMERA_WIDTH}x{CAMERA_HEIGHT} @ {CAMERA_FPS}fps")
@@ -51,12 +67,13 @@ def test_camera():
     if not os.path.exists("test_output"):
         os.makedirs("test_output")
     
-    # Create VideoWriter
-    test_video_path = "test_output/camera_test.mp4"
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(
+    # Create VideoWriter with the benchmarked codec (mp4v if none was saved)
+    codec = load_encoder_choice(actual_width, actual_height)
+    test_video_path = os.path.join("test_output", video_filename("camera_test", codec))
+    print(f"Using {codec} codec")
+    out = open_video_writer(
         test_video_path, 
-        fourcc, 
+        codec, 
         actual_fps, 
         (actual_width, actual_height)
     )
@@ -119,10 +136,125 @@ def test_camera():
     
     return frame_count > 0
 
+def make_synthetic_frames(count=BENCHMARK_SOURCE_FRAMES):
+    """Generate noisy frames with a moving ball, a hard case for inter-frame codecs"""
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = rng.integers(0, 64, (CAMERA_HEIGHT, CAMERA_WIDTH, 3), dtype=np.uint8)
+        x = int(CAMERA_WIDTH * (i + 0.5) / count)
+        cv2.circle(frame, (x, CAMERA_HEIGHT // 2), 30, (255, 255, 255), -1)
+        frames.append(frame)
+    return frames
+
+def capture_real_frames(count=BENCHMARK_SOURCE_FRAMES):
+    """Capture frames from the camera at the configured resolution (empty list if unavailable)"""
+    cap = cv2.VideoCapture(CAMERA_INDEX)
+    if not cap.isOpened():
+        print("WARNING: Could not open camera, benchmarking on synthetic frames only")
+        return []
+    
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+    cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+    
+    frames = []
+    try:
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame.shape[:2] != (CAMERA_HEIGHT, CAMERA_WIDTH):
+                frame = cv2.resize(frame, (CAMERA_WIDTH, CAMERA_HEIGHT))
+            frames.append(frame)
+    finally:
+        cap.release()
+    
+    return frames
+
+def time_codec(codec, frames):
+    """Return the frames per second a codec can write, or None if it is unavailable"""
+    path = os.path.join("test_output", video_filename(f"benchmark_{codec}", codec))
+    out = open_video_writer(path, codec, CAMERA_FPS, (CAMERA_WIDTH, CAMERA_HEIGHT))
+    if not out.isOpened():
+        return None
+    
+    try:
+        start_time = time.perf_counter()
+        for i in range(BENCHMARK_FRAMES):
+            out.write(frames[i % len(frames)])
+        out.release()  # Include flushing buffered frames in the measurement
+        elapsed = time.perf_counter() - start_time
+    finally:
+        out.release()
+        if os.path.exists(path):
+            os.remove(path)
+    
+    return BENCHMARK_FRAMES / elapsed if elapsed > 0 else float("inf")
+
+def benchmark_encoders():
+    """Time every codec and save the fastest one that sustains CAMERA_FPS"""
+    print(f"Benchmarking encoders at {CAMERA_WIDTH}x{CAMERA_HEIGHT}, target {CAMERA_FPS}fps")
+    
+    if not os.path.exists("test_output"):
+        os.makedirs("test_output")
+    
+    sources = {"synthetic": make_synthetic_frames()}
+    real_frames = capture_real_frames()
+    if real_frames:
+        sources["real"] = real_frames
+    
+    required_fps = CAMERA_FPS * BENCHMARK_HEADROOM
+    results = {}
+    for codec in CODECS:
+        results[codec] = {}
+        for source, frames in sources.items():
+            fps = time_codec(codec, frames)
+            results[codec][source] = fps
+            if fps is None:
+                print(f"  {codec:5s} {source:9s}: not available")
+                break
+            print(f"  {codec:5s} {source:9s}: {fps:7.1f} fps")
+    
+    # A codec is only as fast as its slowest frame source
+    worst_fps = {
+        codec: min(fps_by_source.values())
+        for codec, fps_by_source in results.items()
+        if None not in fps_by_source.values()
+    }
+    if not worst_fps:
+        print("ERROR: No codec could be opened")
+        return False
+    
+    sustaining = [codec for codec, fps in worst_fps.items() if fps >= required_fps]
+    if BENCHMARK_PREFER_COMPRESSED and any(codec != "raw" for codec in sustaining):
+        sustaining = [codec for codec in sustaining if codec != "raw"]
+    if sustaining:
+        best = max(sustaining, key=worst_fps.get)
+    else:
+        best = max(worst_fps, key=worst_fps.get)
+        print(f"WARNING: No codec sustains {required_fps:.0f}fps, using the fastest one")
+    
+    save_encoder_choice(best, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS, results)
+    print(f"Selected {best} ({worst_fps[best]:.1f} fps), saved to encoder_choice.json")
+    return True
+
 def main():
     """Main function"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Test the camera or benchmark video encoders.')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Time the available codecs and save the fastest one for the collectors')
+    args = parser.parse_args()
+    
     print("=== Camera Test Utility ===")
     
+    if args.benchmark:
+        if not benchmark_encoders():
+            print("\nFAILED: Encoder benchmark failed")
+        return
+    
     if test_camera():
         print("\nSUCCESS: Camera test passed!")
         print("You can now run the sphero_move_and_collect.py script")
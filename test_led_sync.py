@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+LED Sync Calibration Test
+
+Checks solve_latency() on a synthetic flash sequence: a known camera latency,
+a nonzero BLE round trip for every LED command, and a 30fps camera. The LED
+changes half a round trip after its command is sent, so the solved latency
+must match the camera latency alone to within one frame.
+
+Usage:
+    python test_led_sync.py
+    python -m pytest test_led_sync.py
+"""
+
+import numpy as np
+
+from led_sync import SYNC_CODE, SYNC_SLOT, solve_latency
+
+CAMERA_LATENCY = 0.123  # Seconds from the LED changing to the frame timestamp
+ROUND_TRIP = 0.15  # Seconds from sending an LED command to its ack
+FPS = 30
+ON_BRIGHTNESS = 200
+OFF_BRIGHTNESS = 20
+
+
+def synthetic_flashes(latency=CAMERA_LATENCY, round_trip=ROUND_TRIP, fps=FPS, start=100.0):
+    """Return (events, frame_times, brightness) for one flash of SYNC_CODE"""
+    events = []
+    state = None
+    for i, bit in enumerate((0,) + tuple(SYNC_CODE) + (0,)):
+        if bit != state:
+            sent = start + i * SYNC_SLOT
+            events.append([sent, sent + round_trip, bit])
+            state = bit
+    events = np.array(events)
+
+    # The LED changes half a round trip after sending; a frame shows the scene latency seconds before its timestamp
+    changes = (events[:, 0] + events[:, 1]) / 2
+    frame_times = np.arange(start - 1.0, events[-1, 0] + 2.0, 1.0 / fps)
+    change = np.searchsorted(changes, frame_times - latency, side='right') - 1
+    on = np.concatenate([[0], events[:, 2]]).astype(bool)[change + 1]
+    brightness = np.where(on, ON_BRIGHTNESS, OFF_BRIGHTNESS).astype(np.float64)
+    return events, frame_times, brightness
+
+
+def test_latency_excludes_command_delay():
+    events, frame_times, brightness = synthetic_flashes()
+    result = solve_latency(events, frame_times, brightness)
+    assert result is not None
+    assert result["agreement"] == 1.0
+    assert abs(result["latency"] - CAMERA_LATENCY) < 1.0 / FPS, result
+
+
+def test_latency_without_round_trip():
+    events, frame_times, brightness = synthetic_flashes(round_trip=0.0)
+    result = solve_latency(events, frame_times, brightness)
+    assert abs(result["latency"] - CAMERA_LATENCY) < 1.0 / FPS, result
+
+
+if __name__ == "__main__":
+    test_latency_excludes_command_delay()
+    test_latency_without_round_trip()
+    print("LED sync calibration tests passed")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Background Toy Scanner
+
+pysphero's toy_scanner() starts a fresh scan for every lookup and returns the
+first match, so the scripts hard-code MAC addresses instead. ToyRegistry keeps
+one scan running on a background thread and maintains a table of nearby
+toys: MAC address, Toy type (from the name prefix, as in pysphero), name, last
+RSSI and when it was last seen (time.monotonic()).
+
+Lookups are answered from the table, so connecting needs no scan delay: a
+name or MAC resolves at once if the toy has advertised recently. A connected
+Sphero stops advertising, so after a drop a fresh advertisement also means
+the toy is back in range and ready to be reconnected.
+
+Scanning and connecting on the same controller slow each other down; connects
+can pause the scan with `with registry.paused(): ...`.
+
+Usage:
+    python toy_registry.py              # Print nearby toys until Ctrl+C
+
+    registry = ToyRegistry()
+    registry.start()
+    toy = registry.resolve("SB-8C49", timeout=5)   # Name or MAC address
+    sphero = Sphero(mac_address=toy["mac_address"], toy_type=toy["toy_type"])
+"""
+
+import contextlib
+import threading
+import time
+
+from bluepy.btle import BTLEException, DefaultDelegate, ScanEntry, Scanner
+
+from pysphero.constants import TOY_BY_PREFIX, Toy
+
+from ble_controllers import controller_index
+
+SCAN_WINDOW = 1.0  # Seconds per Scanner.process() call
+STALE_AFTER = 10.0  # Seconds without an advertisement before a toy counts as out of range
+SCAN_RETRY_DELAY = 2.0  # Seconds before restarting a failed scan
+
+
+def is_mac_address(target):
+    """True for MAC addresses, False for toy names like SB-8C49"""
+    return ":" in target
+
+
+class _ScanDelegate(DefaultDelegate):
+    def __init__(self, registry):
+        super().__init__()
+        self.registry = registry
+
+    def handleDiscovery(self, dev, isNewDev, isNewData):
+        name = dev.getValue(ScanEntry.COMPLETE_LOCAL_NAME) or ""
+        self.registry.update(dev.addr, name, dev.rssi)
+
+
+class ToyRegistry:
+    """Nearby toys, kept up to date by a background scan"""
+
+    def __init__(self, controller=None, stale_after=STALE_AFTER):
+        self.controller = controller
+        self.stale_after = stale_after
+        self.available = False  # True once a scan has started; lookups cannot wait for toys otherwise
+        self.scan_errors = 0
+
+        self._toys = {}
+        self._condition = threading.Condition()
+        self._pauses = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._scan, name="toy-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout=SCAN_WINDOW + 1)
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Pause scanning while the block runs (e.g. a connect on the same controller)"""
+        with self._condition:
+            self._pauses += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._pauses -= 1
+                self._condition.notify_all()
+
+    def _scan(self):
+        scanner = Scanner(controller_index(self.controller) or 0).withDelegate(_ScanDelegate(self))
+        while not self._stopping.is_set():
+            with self._condition:
+                while self._pauses and not self._stopping.is_set():
+                    self._condition.wait()
+            if self._stopping.is_set():
+                break
+            try:
+                scanner.clear()
+                scanner.start(passive=False)
+                self.available = True
+                try:
+                    while not self._stopping.is_set() and not self._pauses:
+                        scanner.process(SCAN_WINDOW)
+                finally:
+                    scanner.stop()
+            except (BTLEException, OSError) as e:  # OSError: bluepy-helper could not be started
+                self.scan_errors += 1
+                if self.scan_errors == 1:
+                    print(f"Toy scanner error: {e}, retrying every {SCAN_RETRY_DELAY}s")
+                self._stopping.wait(SCAN_RETRY_DELAY)
+
+    def update(self, mac_address, name, rssi, seen=None):
+        """Record an advertisement (called from the scan thread)"""
+        mac_address = mac_address.upper()
+        with self._condition:
+            toy = self._toys.get(mac_address)
+            toy_type = TOY_BY_PREFIX.get(name[:3])
+            if toy is None:
+                if toy_type is None:
+                    return  # Not a Sphero toy (names only arrive with scan responses, so it may come back)
+                toy = self._toys[mac_address] = {"mac_address": mac_address, "advertisements": 0}
+            if name:
+                toy["name"] = name
+                toy["toy_type"] = toy_type or Toy.unknown
+            toy["rssi"] = rssi
+            toy["last_seen"] = seen if seen is not None else time.monotonic()
+            toy["advertisements"] += 1
+            self._condition.notify_all()
+
+    def toys(self, max_age=None):
+        """Copies of the toys seen within max_age seconds (default: stale_after), strongest signal first"""
+        max_age = self.stale_after if max_age is None else max_age
+        now = time.monotonic()
+        with self._condition:
+            toys = [dict(toy) for toy in self._toys.values() if now - toy["last_seen"] <= max_age]
+        return sorted(toys, key=lambda toy: -toy["rssi"])
+
+    def get(self, target, max_age=None):
+        """The toy with this MAC address or name if it was seen within max_age seconds, else None"""
+        for toy in self.toys(max_age):
+            if target.upper() in (toy["mac_address"], toy.get("name", "").upper()):
+                return toy
+        return None
+
+    def wait_for(self, target, timeout):
+        """Wait up to timeout seconds for the toy to advertise; returns it or None"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                toy = self.get(target)
+                remaining = deadline - time.monotonic()
+                if toy is not None or remaining <= 0 or self._stopping.is_set():
+                    return toy
+                self._condition.wait(remaining)
+
+    def resolve(self, target, timeout=0.0):
+        """Toy for a name or MAC address. A MAC address resolves even if the toy
+        has not been seen, so a registry without a working scan still connects."""
+        toy = self.get(target) or (self.wait_for(target, timeout) if self.available and timeout else None)
+        if toy is None and is_mac_address(target):
+            toy = {"mac_address": target.upper(), "toy_type": Toy.unknown, "name": None, "rssi": None,
+                   "last_seen": None, "advertisements": 0}
+        return toy
+
+    def stats(self):
+        """All toys seen, for metadata.json"""
+        now = time.monotonic()
+        with self._condition:
+            return [{
+                "mac_address": toy["mac_address"],
+                "name": toy.get("name"),
+                "toy_type": toy.get("toy_type", Toy.unknown).value,
+                "rssi": toy["rssi"],
+                "seconds_since_seen": now - toy["last_seen"],
+                "advertisements": toy["advertisements"],
+            } for toy in self._toys.values()]
+
+
+def main():
+    """Print the nearby toys until Ctrl+C"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List nearby Sphero toys.')
+    parser.add_argument('--controller', default=None, help='Bluetooth controller to scan with, e.g. hci1')
+    args = parser.parse_args()
+
+    registry = ToyRegistry(args.controller)
+    registry.start()
+    try:
+        while True:
+            time.sleep(2)
+            toys = registry.toys()
+            print(f"{len(toys)} toys in range:")
+            for toy in toys:
+                print(f"  {toy['mac_address']}  {toy.get('name') or '?':12s} {toy['toy_type'].value:14s} "
+                      f"{toy['rssi']:4d} dBm  seen {time.monotonic() - toy['last_seen']:.1f}s ago")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        registry.stop()
+
+
+if __name__ == "__main__":
+    main()
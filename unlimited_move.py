@@ -1,16 +1,21 @@
 import time
 import signal
-import random
 import sys
 from pysphero.core import Sphero
 from pysphero.driving import Direction
+from action_channel import ActionPublisher
+from ble_controllers import adapter_for, connect_entry, connect_stats, first_command
+from command_scheduler import AdaptivePacer, CommandScheduler
+from connection_gaps import ReconnectBackoff
+from movement_schedule import POLICIES, SchedulePlayer, generate_schedule, load_schedule
+from startup import wait_until_ready
 
 # Sphero MAC address
 MAC_ADDRESS = "C9:B9:61:72:CB:78"
 
-# Speed settings
-MAX_SPEED = 255  # Maximum speed value for Sphero
-CONNECTION_RETRY_DELAY = 5  # Seconds between connection attempts
+# Movement settings
+COMMAND_PERIOD = 0.2  # Seconds between commands (the pacer lowers the rate when acks slow down)
+MAX_COMMAND_ERRORS = 3  # Consecutive failed commands before reconnecting
 
 # Global variable to control execution
 running = True
@@ -21,21 +26,34 @@ def signal_handler(sig, frame):
     print("\nStopping...")
     running = False
 
-def run_continuous_movement():
-    """Main function to keep Sphero moving with random direction and duration"""
+def run_continuous_movement(schedule_path=None, policy="random_walk", seed=None):
+    """Main function to keep Sphero moving, playing a precomputed movement schedule
+    (a saved one, or one generated here from policy and seed)"""
     global running
     
     signal.signal(signal.SIGINT, signal_handler)
+    
+    # Command records for the collector, when started by one
+    actions = ActionPublisher.from_environment()
+    
+    # The whole run's commands are fixed up front, so the run can be regenerated from the seed
+    if schedule_path:
+        commands, info = load_schedule(schedule_path)
+    else:
+        commands, info = generate_schedule(policy, seed, period=COMMAND_PERIOD)
+    scheduler = CommandScheduler(pacer=AdaptivePacer(max_rate=1 / COMMAND_PERIOD))
+    pacer = scheduler.pacer
+    player = SchedulePlayer(commands, info, scheduler)
      
     commands_sent = 0
     start_time = time.time()
     last_status_time = start_time
-    last_movement_change = start_time
-    movement_duration = random.uniform(0.2, 1)  # Random duration between 2-8 seconds
-    speed = random.randint(100, MAX_SPEED)
-    current_heading = random.randint(0, 359)
+    segment = None
+    connect_log = []
+    backoff = ReconnectBackoff()  # Reconnect after 50 ms, backing off to 5 s while attempts keep failing
     
-    print(f"Starting random movement mode...")
+    print(f"Starting {info['policy']} movement (seed {info['seed']}, {info['commands']} commands, "
+          f"{info['duration']:.0f}s, repeating)...")
     print(f"Press Ctrl+C to stop")
     
     # Main loop - reconnect on failure
@@ -43,47 +61,77 @@ def run_continuous_movement():
         try:
             # Use context manager to properly handle connection
             print(f"Connecting to Sphero...")
-            with Sphero(mac_address=MAC_ADDRESS) as sphero:
-                print("Connected! Waking up Sphero...")
+            connect_started = time.monotonic()
+            with Sphero(mac_address=MAC_ADDRESS, ble_adapter_cls=adapter_for()) as sphero:
+                connection = connect_entry(sphero, connect_started)
+                connect_log.append(connection)
+                print(f"Connected in {connection['connect_ms']:.0f}ms ({connection['handles']} handles)! Waking up Sphero...")
                 sphero.power.wake()
-                time.sleep(0.5)  # Brief pause after waking
-                
-                # Initial command
-                print(f"Setting initial movement: heading={current_heading}°, speed={speed}")
-                sphero.driving.drive_with_heading(speed, current_heading, Direction.forward)
-                commands_sent += 1
+                ready = wait_until_ready(sphero)  # Poll until the ball answers instead of sleeping
+                connection["ready_ms"] = ready * 1000 if ready is not None else None
+                if ready is None:
+                    print("Warning: Sphero did not answer after waking up, continuing anyway")
+                else:
+                    print(f"Sphero ready after {ready * 1000:.0f}ms")
+                backoff.connected()
                 
-                # Command loop
+                # Command loop. The schedule starts at the first connection; commands
+                # that fell due while reconnecting or held back by the pacer are skipped,
+                # not sent late
+                command_errors = 0
                 while running:
                     try:
-                        current_time = time.time()
-                        
-                        # Change direction, speed and set new duration randomly
-                        if current_time - last_movement_change >= movement_duration:
-                            speed = random.randint(100, MAX_SPEED)
-                            current_heading = random.randint(0, 359)
-                            movement_duration = random.uniform(0.3, 1)  # Random duration between 2-8 seconds
+                        command = player.next_command(scheduler.earliest_send())
+                        speed = int(command['speed'])
+                        current_heading = int(command['heading'])
+                        direction = Direction.reverse if command['direction'] else Direction.forward
+                        movement_duration = float(command['duration'])
+                        if command['segment'] != segment and movement_duration > info['period']:  # Not every spiral step
                             print(f"New movement: heading={current_heading}°, speed={speed}, duration={movement_duration:.1f}s")
-                            last_movement_change = current_time
+                            segment = command['segment']
+                        
+                        # Wait for the command's deadline (less the expected send latency) and the pacer
+                        scheduler.wait()
+                        current_time = time.time()
                         
                         # Send command
-                        sphero.driving.drive_with_heading(speed, current_heading, Direction.forward)
+                        planned_time = scheduler.next_deadline
+                        command_time = time.monotonic()
+                        rate = pacer.rate
+                        try:
+                            sphero.driving.drive_with_heading(speed, current_heading, direction)
+                        except Exception:
+                            scheduler.failed(command_time)
+                            raise
+                        completed_time = time.monotonic()
+                        scheduler.record(command_time, completed_time)
+                        if connection["first_command_ms"] is None:
+                            first_command(connection, completed_time)
+                            print(f"First command {connection['first_command_ms']:.0f}ms after connecting")
                         commands_sent += 1
+                        command_errors = 0
+                        if pacer.rate < rate:
+                            print(f"Command round trip up to {pacer.srtt * 1000:.0f}ms, "
+                                  f"send rate lowered to {pacer.rate:.1f}/sec")
+                        if actions:
+                            actions.publish(speed, current_heading, direction.value, movement_duration,
+                                            command_time, planned_time, completed_time - command_time)
                         
                         # Print status periodically
                         if current_time - last_status_time >= 5:
                             elapsed = int(current_time - start_time)
                             minutes, seconds = divmod(elapsed, 60)
                             cmd_rate = commands_sent / elapsed if elapsed > 0 else 0
-                            print(f"Running for {minutes}m {seconds}s - Commands sent: {commands_sent} (avg {cmd_rate:.1f}/sec)")
+                            print(f"Running for {minutes}m {seconds}s - Commands sent: {commands_sent} (avg {cmd_rate:.1f}/sec), "
+                                  f"send latency {scheduler.latency * 1000:.0f}ms, send rate {pacer.rate:.1f}/sec")
                             last_status_time = current_time
                         
-                        # Brief delay to prevent overwhelming the connection
-                        time.sleep(0.2)
-                        
                     except Exception as e:
-                        print(f"Command error: {e}")
-                        break  # Break inner loop to reconnect
+                        # The pacer has backed off; only reconnect if that does not help
+                        command_errors += 1
+                        print(f"Command error ({command_errors}/{MAX_COMMAND_ERRORS}): {e}")
+                        if command_errors >= MAX_COMMAND_ERRORS:
+                            break  # Break inner loop to reconnect
                 
                 # Context manager will automatically clean up the connection
                 print("Sphero connection closed. Attempting to reconnect...")
@@ -93,12 +141,35 @@ def run_continuous_movement():
         
         # Only retry if still running
         if running:
-            print(f"Will retry in {CONNECTION_RETRY_DELAY} seconds...")
-            time.sleep(CONNECTION_RETRY_DELAY)
+            delay = backoff.next_delay()
+            print(f"Will retry in {delay * 1000:.0f}ms...")
+            time.sleep(delay)
+    
+    stats = scheduler.stats()
+    if stats:
+        print(f"Command timing: {stats['commands']} commands, jitter p50 {stats['jitter_p50_ms']:.1f}ms, "
+              f"p99 |jitter| {stats['jitter_p99_abs_ms']:.1f}ms")
+        print(f"Send rate: lowered {pacer.decreases} times, final {pacer.rate:.1f}/sec")
+    connects = connect_stats(connect_log)
+    if connects["median_first_command_ms"] is not None:
+        print(f"Connections: {len(connect_log)}, {connects['cached_handles']} with cached handles, "
+              f"median connect-to-first-command {connects['median_first_command_ms']:.0f}ms")
+    playback = player.stats()
+    print(f"Schedule: {playback['played']} commands played, {playback['skipped']} skipped (disconnected or paced)")
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Keep the Sphero moving on a precomputed movement schedule.')
+    parser.add_argument('--schedule', help='Schedule file from movement_schedule.py (default: generate one)')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random_walk',
+                        help='Policy of the generated schedule (default: random_walk)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of the generated schedule (default: drawn and printed)')
+    args = parser.parse_args()
+    
     try:
-        run_continuous_movement()
+        run_continuous_movement(args.schedule, args.policy, args.seed)
     except KeyboardInterrupt:
         pass
     finally:
@@ -0,0 +1,88 @@
+"""
+Video Encoder Selection
+
+Table of the codecs the collectors can record with, and the encoder choice
+file written by `python test_camera.py --benchmark`. The benchmark times every
+codec on this machine and stores the fastest one that sustains the target fps;
+the collectors load that choice at startup and fall back to mp4v without it.
+"""
+
+import datetime
+import json
+import os
+
+import cv2
+
+# Codec name -> (fourcc string or None for uncompressed, container extension)
+CODECS = {
+    "mp4v": ("mp4v", ".mp4"),
+    "MJPG": ("MJPG", ".avi"),
+    "XVID": ("XVID", ".avi"),
+    "raw": (None, ".avi"),
+}
+DEFAULT_CODEC = "mp4v"
+ENCODER_CHOICE_FILE = "encoder_choice.json"
+
+
+def fourcc_code(codec):
+    """Return the cv2 fourcc code for a codec name"""
+    fourcc, _ = CODECS[codec]
+    if fourcc is None:
+        return 0  # Uncompressed frames
+    return cv2.VideoWriter_fourcc(*fourcc)
+
+
+def video_filename(basename, codec):
+    """Return the video file name for a codec, e.g. ("video", "MJPG") -> "video.avi" """
+    return basename + CODECS[codec][1]
+
+
+def open_video_writer(path, codec, fps, size):
+    """Create a cv2.VideoWriter for a codec name"""
+    return cv2.VideoWriter(path, fourcc_code(codec), fps, size)
+
+
+def save_encoder_choice(codec, width, height, fps, results, path=ENCODER_CHOICE_FILE):
+    """Persist the benchmark winner and the measured results"""
+    choice = {
+        "codec": codec,
+        "width": width,
+        "height": height,
+        "target_fps": fps,
+        "benchmarked_at": datetime.datetime.now().isoformat(),
+        "results": results,
+    }
+
+    with open(path, 'w') as f:
+        json.dump(choice, f, indent=2)
+
+    return choice
+
+
+def load_encoder_choice(width, height, path=ENCODER_CHOICE_FILE):
+    """Return the benchmarked codec for this resolution, or DEFAULT_CODEC.
+
+    A choice benchmarked at a different resolution is ignored, because encode
+    cost scales with frame size.
+    """
+    if not os.path.exists(path):
+        return DEFAULT_CODEC
+
+    try:
+        with open(path) as f:
+            choice = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read encoder choice from {path}: {e}")
+        return DEFAULT_CODEC
+
+    codec = choice.get("codec")
+    if codec not in CODECS:
+        print(f"Warning: Unknown codec '{codec}' in {path}, using {DEFAULT_CODEC}")
+        return DEFAULT_CODEC
+
+    if (choice.get("width"), choice.get("height")) != (width, height):
+        print(f"Warning: Encoder benchmark was run at {choice.get('width')}x{choice.get('height')}, "
+              f"not {width}x{height}. Using {DEFAULT_CODEC} (rerun test_camera.py --benchmark)")
+        return DEFAULT_CODEC
+
+    return codec
@@ -0,0 +1,93 @@
+"""
+Video Reading Helpers
+
+Shared helpers for offline tools that process recorded runs: locating a run's
+video file and reading its frames, whether the video was encoded by OpenCV
+(video.mp4 / video.avi) or stored as an MJPEG passthrough stream (video.mjpeg).
+"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+from mjpeg_recorder import MjpegReader
+
+METADATA_FILENAME = "metadata.json"
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mjpeg")
+
+
+def find_run_video(run_dir, camera=0):
+    """Return the video path of a run for the camera at position `camera` in CAMERA_INDICES"""
+    metadata_path = os.path.join(run_dir, METADATA_FILENAME)
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        cameras = metadata.get("cameras") or []
+        if camera < len(cameras) and cameras[camera].get("video_file"):
+            return os.path.join(run_dir, cameras[camera]["video_file"])
+
+    # Runs without per-camera metadata only have the first camera's video
+    if camera == 0:
+        for extension in VIDEO_EXTENSIONS:
+            path = os.path.join(run_dir, "video" + extension)
+            if os.path.exists(path):
+                return path
+
+    raise FileNotFoundError(f"No video for camera {camera} in {run_dir}")
+
+
+class VideoFrameReader:
+    """Sequential/ranged frame reader for OpenCV videos and MJPEG streams"""
+
+    def __init__(self, path):
+        self.path = path
+        self._mjpeg = None
+        self._cap = None
+
+        if path.endswith(".mjpeg"):
+            self._mjpeg = MjpegReader(path)
+            self.frame_count = len(self._mjpeg)
+            self.fps = None
+        else:
+            self._cap = cv2.VideoCapture(path)
+            if not self._cap.isOpened():
+                raise IOError(f"Could not open video {path}")
+            self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+
+    def read_range(self, start=0, count=None):
+        """Yield (frame_index, BGR frame) for `count` frames starting at `start` (all by default)"""
+        end = self.frame_count if count is None else min(start + count, self.frame_count)
+
+        if self._mjpeg is not None:
+            for i in range(start, end):
+                yield i, self._mjpeg.read(i)
+            return
+
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for i in range(start, end):
+            ret, frame = self._cap.read()
+            if not ret:
+                break
+            yield i, frame
+
+    def batches(self, batch_size, start=0, count=None):
+        """Yield (first_frame_index, frames array of shape (n, H, W, 3)) in batches"""
+        frames = []
+        first_index = start
+        for i, frame in self.read_range(start, count):
+            if not frames:
+                first_index = i
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield first_index, np.stack(frames)
+                frames = []
+
+        if frames:
+            yield first_index, np.stack(frames)
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Parallel Chunked Video Processing
+
+Runs an offline pass (feature extraction, tracking, thumbnailing, ...) over a
+recorded video on all CPU cores instead of decoding serially through one
+cv2.VideoCapture:
+
+1. A seek index (the frames a decoder can start from) is built once and
+   cached next to the video (video.mp4 -> video.mp4.seekidx.npy). For MP4 it
+   comes from the sync sample table (stss), for AVI from the idx1 keyframe
+   flags, and for MJPEG streams every frame is a seek point
+2. The video is split into frame ranges that start at seek points
+3. Each range is decoded and processed in a ProcessPoolExecutor worker
+4. Results are returned in frame order
+
+Usage as a library:
+
+    def mean_brightness(first_index, frames):   # module-level, so it pickles
+        return frames.mean(axis=(1, 2, 3))
+
+    results = process_video("collected_data/run_.../video.mp4", mean_brightness)
+
+Usage from the command line (prints the seek index and a decode benchmark):
+    python video_runner.py collected_data/run_YYYYMMDD_HHMMSS/video.mp4
+"""
+
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from video_reader import VideoFrameReader
+
+DEFAULT_CHUNK_FRAMES = 512  # Minimum frames per chunk (about 17s at 30fps)
+DEFAULT_BATCH_SIZE = 64  # Frames handed to the processing function at once
+CHUNKS_PER_WORKER = 4  # More chunks than workers keeps all cores busy until the end
+FALLBACK_SEEK_INTERVAL = 30  # Seek point spacing when the container has no keyframe table
+
+AVIIF_KEYFRAME = 0x10
+
+
+def seek_index_path(video_path):
+    """Return the cached seek index path for a video file"""
+    return video_path + ".seekidx.npy"
+
+
+def _iter_boxes(f, start, end):
+    """Yield (box_type, payload_start, payload_end) for the MP4 boxes in [start, end)"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+
+def _find_box(f, start, end, box_type):
+    for found_type, payload_start, payload_end in _iter_boxes(f, start, end):
+        if found_type == box_type:
+            return payload_start, payload_end
+    return None
+
+
+def _mp4_seek_points(path):
+    """Return (keyframe indices, frame count) from the video track of an MP4/MOV file"""
+    with open(path, 'rb') as f:
+        moov = _find_box(f, 0, os.path.getsize(path), b"moov")
+        if moov is None:
+            return None
+
+        for box_type, trak_start, trak_end in _iter_boxes(f, *moov):
+            if box_type != b"trak":
+                continue
+            mdia = _find_box(f, trak_start, trak_end, b"mdia")
+            if mdia is None:
+                continue
+
+            # Only the video track
+            hdlr = _find_box(f, *mdia, b"hdlr")
+            if hdlr is None:
+                continue
+            f.seek(hdlr[0] + 8)  # version/flags + pre_defined
+            if f.read(4) != b"vide":
+                continue
+
+            minf = _find_box(f, *mdia, b"minf")
+            stbl = _find_box(f, *minf, b"stbl") if minf else None
+            if stbl is None:
+                return None
+
+            stsz = _find_box(f, *stbl, b"stsz")
+            if stsz is None:
+                return None
+            f.seek(stsz[0] + 8)  # version/flags + sample_size
+            frame_count = struct.unpack(">I", f.read(4))[0]
+
+            stss = _find_box(f, *stbl, b"stss")
+            if stss is None:
+                # No sync sample table means every frame is a keyframe
+                return np.arange(frame_count), frame_count
+
+            f.seek(stss[0] + 4)  # version/flags
+            entry_count = struct.unpack(">I", f.read(4))[0]
+            sync_samples = np.frombuffer(f.read(4 * entry_count), dtype=">u4")
+            return sync_samples.astype(np.int64) - 1, frame_count  # 1-based in the file
+
+    return None
+
+
+def _avi_seek_points(path):
+    """Return (keyframe indices, frame count) from the idx1 index of an AVI file"""
+    with open(path, 'rb') as f:
+        riff, _, form = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or form != b"AVI ":
+            return None
+
+        offset = 12
+        file_size = os.path.getsize(path)
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            chunk_id, size = struct.unpack("<4sI", f.read(8))
+            if chunk_id == b"idx1":
+                entries = np.frombuffer(f.read(size - size % 16), dtype=[
+                    ('id', 'S4'), ('flags', '<u4'), ('offset', '<u4'), ('size', '<u4')])
+                # Video frames of the first stream are "00dc" (compressed) or "00db" (raw)
+                video = entries[np.isin(entries['id'], [b"00dc", b"00db"])]
+                keyframes = np.flatnonzero(video['flags'] & AVIIF_KEYFRAME)
+                return keyframes, len(video)
+            offset += 8 + size + (size & 1)  # Chunks are word aligned
+
+    return None
+
+
+def build_seek_index(video_path, use_cache=True):
+    """Return (seek points, frame count) for a video, building and caching the index once"""
+    cache_path = seek_index_path(video_path)
+    if use_cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(video_path):
+        cached = np.load(cache_path)
+        return cached[:-1], int(cached[-1])
+
+    result = None
+    extension = os.path.splitext(video_path)[1].lower()
+    if extension == ".mjpeg":
+        reader = VideoFrameReader(video_path)
+        frame_count = reader.frame_count
+        reader.close()
+        result = (np.arange(frame_count), frame_count)
+    elif extension in (".mp4", ".mov"):
+        result = _mp4_seek_points(video_path)
+    elif extension == ".avi":
+        result = _avi_seek_points(video_path)
+
+    if result is None:
+        # Unknown layout: seek at fixed intervals and let the decoder find the keyframes
+        reader = VideoFrameReader(video_path)
+        frame_count = reader.frame_count
+        reader.close()
+        result = (np.arange(0, frame_count, FALLBACK_SEEK_INTERVAL), frame_count)
+
+    seek_points, frame_count = result
+    seek_points = np.unique(np.concatenate([[0], seek_points[seek_points < frame_count]])) if frame_count else np.zeros(0, np.int64)
+
+    if use_cache:
+        np.save(cache_path, np.concatenate([seek_points, [frame_count]]).astype(np.int64))
+    return seek_points, frame_count
+
+
+def plan_chunks(seek_points, frame_count, min_chunk_frames):
+    """Split [0, frame_count) into (start, count) ranges starting at seek points"""
+    chunks = []
+    start = 0
+    for point in seek_points[1:]:
+        if point - start >= min_chunk_frames:
+            chunks.append((start, int(point) - start))
+            start = int(point)
+    if start < frame_count:
+        chunks.append((start, frame_count - start))
+    return chunks
+
+
+def _init_worker():
+    # One decode thread per process, the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def _process_chunk(task):
+    """Decode one chunk and run the processing function on its batches"""
+    video_path, start, count, process_batch, batch_size = task
+    reader = VideoFrameReader(video_path)
+    try:
+        return [process_batch(first_index, frames)
+                for first_index, frames in reader.batches(batch_size, start, count)]
+    finally:
+        reader.close()
+
+
+def process_video(video_path, process_batch, workers=None,
+                  chunk_frames=DEFAULT_CHUNK_FRAMES, batch_size=DEFAULT_BATCH_SIZE):
+    """Run process_batch(first_frame_index, frames) over a whole video in parallel.
+
+    process_batch must be a module-level (picklable) function; frames is a
+    (n, H, W, 3) uint8 array of at most batch_size frames. Returns the list of
+    its results, one per batch, in frame order.
+    """
+    workers = workers or os.cpu_count() or 1
+    seek_points, frame_count = build_seek_index(video_path)
+    if frame_count == 0:
+        return []
+
+    # Aim for a few chunks per worker, but never smaller than chunk_frames
+    min_chunk_frames = max(chunk_frames, frame_count // (workers * CHUNKS_PER_WORKER))
+    chunks = plan_chunks(seek_points, frame_count, min_chunk_frames)
+    tasks = [(video_path, start, count, process_batch, batch_size) for start, count in chunks]
+
+    if workers == 1 or len(tasks) == 1:
+        chunk_results = [_process_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            chunk_results = list(executor.map(_process_chunk, tasks))
+
+    # map() keeps chunk order, so flattening restores frame order
+    return [result for results in chunk_results for result in results]
+
+
+def _count_frames(first_index, frames):
+    return len(frames)
+
+
+def main():
+    """Print a video's seek index and benchmark parallel decoding"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect and benchmark parallel video decoding.')
+    parser.add_argument('video', help='Video file, e.g. collected_data/run_YYYYMMDD_HHMMSS/video.mp4')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    seek_points, frame_count = build_seek_index(args.video)
+    print(f"{args.video}: {frame_count} frames, {len(seek_points)} seek points")
+
+    start_time = time.time()
+    decoded = sum(process_video(args.video, _count_frames, workers=args.workers))
+    elapsed = time.time() - start_time
+    fps = decoded / elapsed if elapsed > 0 else 0
+    print(f"Decoded {decoded} frames in {elapsed:.1f}s ({fps:.0f} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,9 +6,13 @@ import datetime
 import signal
 import threading
 import sys
+import json
 from pysphero.core import Sphero
 from pysphero.driving import Direction
 from pysphero.device_api.sensor import Accelerometer, Gyroscope
+from command_scheduler import AdaptivePacer, CommandScheduler
+from movement_schedule import POLICIES, SchedulePlayer, generate_schedule, load_schedule, save_schedule
+from startup import StartupTimer, wait_until_ready
 
 # Sphero MAC address
 MAC_ADDRESS = "C9:B9:61:72:CB:78"
@@ -22,6 +26,16 @@ DATA_DIR = "sphero_data"
 MAX_RUNTIME = 3600  # Default runtime in seconds (1 hour)
 MOVEMENT_UPDATE_INTERVAL = 0.1  # Seconds between random movement updates
 
+# Random walk parameters matching the original movement thread: low speeds (to avoid
+# errors), holds between 0.5x and 1.5x the update interval, 5% reverse
+RANDOM_WALK_PARAMS = {
+    "min_speed": 20,
+    "max_speed": 80,
+    "min_hold": 0.5 * MOVEMENT_UPDATE_INTERVAL,
+    "max_hold": 1.5 * MOVEMENT_UPDATE_INTERVAL,
+    "reverse_probability": 0.05,
+}
+
 # Global variables for controlling execution
 running = True
 data_buffer = []
@@ -29,6 +43,9 @@ buffer_lock = threading.Lock()
 total_samples = 0
 consecutive_movement_errors = 0
 last_successful_movement = 0
+command_scheduler = CommandScheduler(pacer=AdaptivePacer(max_rate=1 / RANDOM_WALK_PARAMS["min_hold"]))  # Deadlines come from the movement schedule
+schedule_player = None
+startup = None  # StartupTimer of this run, see startup.py
 
 def force_exit(message=None):
     """Force exit the script in case of unrecoverable error"""
@@ -68,6 +85,9 @@ def sensor_callback(response):
     global data_buffer, total_samples
     
     timestamp = time.time()
+    if total_samples == 0:
+        startup.mark("first_sample")
+        print(f"First sensor data received {startup.elapsed_ms('first_sample'):.0f}ms after start")
     
     # Extract individual sensor values
     try:
@@ -181,8 +201,23 @@ def execute_movement(sphero, speed, heading, direction=Direction.forward):
         
         return False
 
+def prepare_movement_schedule(filename, schedule_path=None, policy="random_walk", seed=None):
+    """Load or generate the movement schedule and save a copy next to the CSV file"""
+    global schedule_player
+    
+    if schedule_path:
+        commands, info = load_schedule(schedule_path)
+    else:
+        params = RANDOM_WALK_PARAMS if policy == "random_walk" else {}
+        commands, info = generate_schedule(policy, seed, period=RANDOM_WALK_PARAMS["max_hold"], **params)
+    
+    copy_path = os.path.splitext(filename)[0] + "_schedule.npz"
+    save_schedule(copy_path, commands, info)
+    schedule_player = SchedulePlayer(commands, info, command_scheduler)
+    print(f"Movement schedule: {info['policy']}, seed {info['seed']} (saved to {copy_path})")
+
 def continuous_random_movement_thread(sphero):
-    """Thread that continuously updates Sphero's movement with random parameters"""
+    """Thread that continuously updates Sphero's movement from the movement schedule"""
     global running, last_successful_movement
     
     print("Continuous random movement thread started")
@@ -192,25 +227,29 @@ def continuous_random_movement_thread(sphero):
     
     while running:
         try:
-            # Generate completely random movement parameters
-            speed = random.randint(20, 80)  # Random speed (low enough to avoid errors)
-            heading = random.randint(0, 359)  # Random heading
+            command = schedule_player.next_command(command_scheduler.earliest_send())
+            if command is None:
+                break
+            speed = int(command['speed'])
+            heading = int(command['heading'])
+            direction = Direction.reverse if command['direction'] else Direction.forward
             
-            # Small chance to change direction
-            direction = Direction.forward
-            if random.random() < 0.05:  # 5% chance
-                direction = Direction.reverse
+            # Wait for this command's deadline, less the expected send latency
+            command_scheduler.wait()
             
-            # Execute the random movement
+            # Execute the scheduled movement
+            started = time.monotonic()
             success = execute_movement(sphero, speed, heading, direction)
-            
+
             if success:
+                command_scheduler.record(started, time.monotonic())
                 error_count = 0
                 
                 # Only print movement changes occasionally
                 if random.random() < 0.1:  # 10% chance to print
                     print(f"Moving: speed={speed}, heading={heading}°")
             else:
+                command_scheduler.failed(started)
                 error_count += 1
                 
                 # If too many consecutive errors, try a recovery
@@ -224,18 +263,15 @@ def continuous_random_movement_thread(sphero):
                     except:
                         pass
             
-            # Sleep for a random amount of time
-            # This creates more natural, unpredictable movements
-            sleep_time = MOVEMENT_UPDATE_INTERVAL * (0.5 + random.random())  # Between 0.5x and 1.5x the base interval
-            time.sleep(sleep_time)
-            
         except Exception as e:
             print(f"Error in continuous movement thread: {e}")
             time.sleep(0.5)  # Sleep a bit longer after an error
 
-def main(runtime=MAX_RUNTIME):
+def main(runtime=MAX_RUNTIME, schedule_path=None, policy="random_walk", seed=None):
     """Main function for Sphero data collection"""
-    global running, last_successful_movement
+    global running, last_successful_movement, startup
+    
+    startup = StartupTimer()
     
     # Set up signal handler for Ctrl+C
     signal.signal(signal.SIGINT, signal_handler)
@@ -244,6 +280,7 @@ def main(runtime=MAX_RUNTIME):
     ensure_data_dir()
     filename = get_data_filename()
     print(f"Data will be saved to: {filename}")
+    prepare_movement_schedule(filename, schedule_path, policy, seed)
     
     # Start data writer thread
     writer_thread = threading.Thread(target=data_writer_thread, args=(filename,))
@@ -251,9 +288,15 @@ def main(runtime=MAX_RUNTIME):
     writer_thread.start()
     
     with Sphero(mac_address=MAC_ADDRESS) as sphero:
+        startup.mark("connected")
         print("Waking up Sphero...", flush=True)
         sphero.power.wake()
-        time.sleep(2)  # Give the ball time to wake up
+        ready = wait_until_ready(sphero)  # Poll until the ball answers instead of sleeping
+        if ready is None:
+            print("Warning: Sphero did not answer after waking up, continuing anyway")
+        else:
+            print(f"Sphero ready after {ready * 1000:.0f}ms")
+        startup.mark("robot_ready")
         
         # Initialize the last successful movement time
         last_successful_movement = time.time()
@@ -278,12 +321,10 @@ def main(runtime=MAX_RUNTIME):
                 timeout=1.0
             )
             
+            startup.mark("streaming")
             print(f"Starting data collection for {runtime} seconds (or until Ctrl+C)")
             start_time = time.time()
             
-            # Wait a moment to ensure streaming is properly established
-            time.sleep(1)
-            
             # Main data collection loop
             try:
                 while running and (time.time() - start_time < runtime):
@@ -333,6 +374,17 @@ def main(runtime=MAX_RUNTIME):
             # Final status
             print(f"Data collection complete. Collected {total_samples} samples.")
             print(f"Data saved to {filename}")
+            print("Startup: " + ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in startup.stats().items()
+                                          if ms is not None))
+            
+            # Command timing precision next to the data
+            timing = command_scheduler.stats()
+            if timing:
+                timing_path = os.path.splitext(filename)[0] + "_command_timing.json"
+                with open(timing_path, 'w') as f:
+                    json.dump(timing, f, indent=2)
+                print(f"Command timing: jitter p50 {timing['jitter_p50_ms']:.1f}ms, "
+                      f"p99 |jitter| {timing['jitter_p99_abs_ms']:.1f}ms (saved to {timing_path})")
 
 if __name__ == "__main__":
     import argparse
@@ -340,10 +392,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Collect Sphero sensor data with continuous random movement.')
     parser.add_argument('--runtime', type=int, default=MAX_RUNTIME,
                         help=f'Runtime in seconds (default: {MAX_RUNTIME})')
+    parser.add_argument('--schedule', help='Replay a schedule file from movement_schedule.py')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random_walk',
+                        help='Policy of the generated schedule (default: random_walk)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of the generated schedule (default: drawn and printed)')
     args = parser.parse_args()
     
     try:
-        main(runtime=args.runtime)
+        main(runtime=args.runtime, schedule_path=args.schedule, policy=args.policy, seed=args.seed)
     except Exception as e:
         print(f"Unhandled exception in main: {e}")
     finally: